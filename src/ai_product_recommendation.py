@@ -34,82 +34,38 @@ The datasets are merged and preprocessed to ensure consistency and prepare for t
 """
 
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-import numpy as np
+from storage import read_table
+from recommender import Recommender
 
 # Load datasets
-order_data = pd.read_csv('./data/processed/order.csv')
-reviews_data = pd.read_csv('./data/processed/reviews.csv')
-product_data = pd.read_csv('./data/processed/product.csv')
+order_data = read_table('order')
+reviews_data = read_table('reviews')
+product_data = read_table('product')
 
 """The recommendation system uses cosine similarity to:
 - Measure the similarity between products based on purchase and review data.
 - Suggest relevant products to customers based on their previous purchases.
 
 Standard scaling is applied to normalize data and improve similarity calculations.
+The user-item matrix is kept sparse and only the top-k most similar customers are stored per customer, so memory grows linearly with the number of customers.
+New reviews can be folded in with `recommender.update(new_rows)` (columns `customer_userid`, `product_id`, `star_ratings`), which only recomputes the neighbour lists of the customers in the delta.
 """
 
-# Merge datasets on product_id and customer_userid
-merged_data = pd.merge(order_data, reviews_data, on=['product_id', 'customer_userid'], how='inner')
+# Merge datasets on the integer product and customer codes
+merged_data = pd.merge(order_data, reviews_data.drop(columns=['product_id', 'customer_userid']), on=['product_code', 'customer_code'], how='inner')
 
-# Create a user-item interaction matrix
-user_item_matrix = merged_data.pivot_table(
-    index='customer_userid', columns='product_id', values='star_ratings', fill_value=0
-)
-
-# Normalize the user-item matrix for cosine similarity
-scaler = StandardScaler()
-user_item_normalized = scaler.fit_transform(user_item_matrix)
-
-# Calculate cosine similarity between users
-user_similarity = cosine_similarity(user_item_normalized)
-user_similarity_df = pd.DataFrame(user_similarity, index=user_item_matrix.index, columns=user_item_matrix.index)
+# Build the sparse user-item matrix and the top-k neighbour index
+# (cosine similarity on the normalized matrix, only the 50 closest customers are kept)
+# pass backend=IVFNeighbors(...) from neighbors.py for approximate search on large customer bases
+recommender = Recommender.fit(merged_data, product_data, n_neighbors=50)
 
 # Function to recommend products for a specific user with confidence scores
 def recommend_products(customer_userid, top_n=5):
-    if customer_userid not in user_similarity_df.index:
-        return f"Customer ID {customer_userid} not found in the dataset."
-
-    # similarity scores for user
-    similar_users = user_similarity_df[customer_userid].sort_values(ascending=False)
-    similar_users = similar_users[similar_users.index != customer_userid]
-
-    # Weighted average for similar users
-    weighted_ratings = np.dot(similar_users.values, user_item_matrix.loc[similar_users.index])
-    similarity_sum = np.abs(similar_users.values).sum()
-    if similarity_sum == 0:
-        return "No similar users found to base recommendations on."
-    recommendations = weighted_ratings / similarity_sum
-
-    # Create a Series with product IDs and their corresponding recommendation scores
-    recommendations_series = pd.Series(recommendations, index=user_item_matrix.columns)
-
-    # Filter out products already rated by the user
-    rated_products = user_item_matrix.loc[customer_userid]
-    unrated_products = recommendations_series[~rated_products.index.isin(rated_products[rated_products > 0].index)]
-
-    # Get the top N product IDs and their scores
-    top_products = unrated_products.nlargest(top_n)
-
-    # Map product IDs to product names using product_data
-    top_product_names = product_data[product_data['product_id'].isin(top_products.index)][['product_id', 'product_name']]
+    return recommender.recommend_products(customer_userid, top_n=top_n)
 
-    # Merge to include scores
-    top_recommendations = top_product_names.merge(top_products.rename('score'), left_on='product_id', right_index=True)
-
-    # Normalize scores
-    min_score = top_recommendations['score'].min()
-    max_score = top_recommendations['score'].max()
-    if max_score == min_score:
-        top_recommendations['confidence'] = 100
-    else:
-        top_recommendations['confidence'] = 100 * (top_recommendations['score'] - min_score) / (max_score - min_score)
-
-    # Sort by confidence
-    top_recommendations = top_recommendations.sort_values(by='confidence', ascending=False)
-
-    return top_recommendations[['product_id', 'product_name', 'confidence']]
+# Function to recommend products for many users at once (one row per user and rank)
+def recommend_products_batch(user_ids, top_n=5):
+    return recommender.recommend_products_batch(user_ids, top_n=top_n)
 
 """## Generating Recommendations
 
@@ -127,3 +83,14 @@ recommended_products = recommend_products(customer_id, top_n=5)
 print(f"Recommended products for customer {customer_id}:")
 print(recommended_products)
 
+# Recommendations for every customer, scored in blocks of users
+all_recommendations = recommend_products_batch(recommender.user_ids, top_n=5)
+print(all_recommendations.head(10))
+
+"""## Saving the Model
+
+The fitted recommender (id maps, sparse interaction matrix, neighbour index and product names) is written to a versioned directory of `.npy` arrays.
+Serving processes can load it with `Recommender.load('recommender_model')`, which memory-maps the arrays instead of re-reading and re-processing the CSVs.
+"""
+
+recommender.save('recommender_model')
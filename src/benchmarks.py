@@ -0,0 +1,611 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for the analysis pipeline.
+
+Run from the repository root, e.g.:
+
+    python src/benchmarks.py neighbors
+"""
+
+import argparse
+import ast
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import uuid
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+
+import category_performance as category_module
+from category_performance import category_performance, product_join_size, product_totals
+from feature_store import FeatureStore
+from id_dictionary import add_codes, build_id_dictionaries, save_id_dictionaries
+from features import seasonal_features
+from neighbors import ExactNeighbors, IVFNeighbors
+from preprocessing import create_order_df, transform_reviews
+from profiling import GROUP_AGGREGATES, MAX_VALUE_COUNTS, profile_table
+from recommender import build_interaction_matrix, column_statistics, column_sums, scaled_space
+from rollups import RollupCube
+from segmentation import (
+    SEGMENTATIONS, OptimalSegmentation1D, StreamingSegmentation, compare_with_full_batch, feature_chunks, k_sweep,
+)
+from sketches import iqr_bounds, sketch_iqr_bounds, sketch_table
+from storage import ROW_GROUP_SIZE, append_table, read_id_dictionaries, read_table, table_path, write_table
+
+
+def synthetic_ratings(n_users, n_products=3800, ratings_per_user=5, n_tastes=20, seed=42):
+    # customers belong to a taste group and mostly rate that group's products
+    rng = np.random.default_rng(seed)
+    taste = rng.integers(0, n_tastes, n_users)
+    n_ratings = n_users * ratings_per_user
+    users = np.repeat(np.arange(n_users), ratings_per_user)
+    group_size = n_products // n_tastes
+    in_group = rng.random(n_ratings) < 0.8
+    products = np.where(
+        in_group,
+        taste[users] * group_size + rng.integers(0, group_size, n_ratings),
+        rng.integers(0, n_products, n_ratings),
+    )
+    return pd.DataFrame({
+        'customer_userid': np.char.add('user_', (users + 1).astype(str)),
+        'product_id': products,
+        'star_ratings': rng.integers(1, 6, n_ratings).astype(float),
+    })
+
+
+def benchmark_neighbors(user_counts=(1000, 5000, 20000), k=50, backends=None):
+    # recall@k of each backend against the exact neighbours, with build and query times
+    backends = backends or {
+        'ivf-64/4': lambda: IVFNeighbors(n_lists=64, n_probe=4),
+        'ivf-64/8': lambda: IVFNeighbors(n_lists=64, n_probe=8),
+        'ivf-64/16': lambda: IVFNeighbors(n_lists=64, n_probe=16),
+    }
+    results = []
+    for n_users in user_counts:
+        user_item, _, user_ids, _ = build_interaction_matrix(synthetic_ratings(n_users))
+        mean, std = column_statistics(*column_sums(user_item), user_item.shape[0])
+        scaled, offset = scaled_space(user_item, mean, std)
+        rows = np.arange(len(user_ids))
+
+        start = time.perf_counter()
+        exact_idx, _ = ExactNeighbors().fit(scaled, offset).query(rows, k)
+        exact_time = time.perf_counter() - start
+        results.append({'users': n_users, 'backend': 'exact', 'build_s': 0.0,
+                        'query_s': exact_time, 'recall_at_k': 1.0})
+
+        for name, make_backend in backends.items():
+            start = time.perf_counter()
+            backend = make_backend().fit(scaled, offset)
+            build_time = time.perf_counter() - start
+            start = time.perf_counter()
+            idx, sim = backend.query(rows, k)
+            query_time = time.perf_counter() - start
+
+            # padded entries are not real neighbours
+            found = np.where(sim != 0, idx, -1)
+            hits = (found[:, :, None] == exact_idx[:, None, :]).any(axis=2).sum()
+            results.append({'users': n_users, 'backend': name, 'build_s': build_time,
+                            'query_s': query_time, 'recall_at_k': hits / exact_idx.size})
+
+    return pd.DataFrame(results)
+
+
+def synthetic_review_dump(n_products, reviews_per_product=10, as_strings=False, seed=42):
+    # products with nested review dictionaries, shaped like reviews.json
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n_products):
+        reviews = [{
+            'review_posted_by_username': f'customer{rng.integers(0, n_products * 5)}',
+            'star_ratings': int(rng.integers(1, 6)),
+            'review_date': f'2023-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d}',
+            'user_age': str(rng.integers(18, 70)),
+            'user_height': '5\'6"',
+            'user_size': 'M',
+            'user_weight': '140 lbs.',
+            'user_body_type': 'Hourglass',
+            'user_color': 'black',
+            'review_title': 'Great fit',
+            'review_text': 'Loved it, would rent again.',
+        } for _ in range(rng.integers(0, 2 * reviews_per_product + 1))]
+        rows.append({'reviews': str(reviews) if as_strings else reviews, 'product_id': uuid.uuid4()})
+    return pd.DataFrame(rows)
+
+
+def _transform_reviews_loop(df):
+    # the original iterrows implementation, kept as the baseline
+    transformed_data = []
+    for _, row in df.iterrows():
+        product_id = row['product_id']
+        reviews = row['reviews']
+        if isinstance(reviews, str):
+            reviews = ast.literal_eval(reviews)
+        for review in reviews:
+            transformed_data.append({
+                "product_id": product_id,
+                "customer_username": review.get("review_posted_by_username", None),
+                "star_ratings": review.get("star_ratings", None),
+                "review_date": review.get("review_date", None),
+                "user_age": review.get("user_age", None),
+                "user_height": review.get("user_height", None),
+                "user_size": review.get("user_size", None),
+                "user_weight": review.get("user_weight", None),
+                "user_body_type": review.get("user_body_type", None),
+                "user_color": review.get("user_color", None),
+                "review_title": review.get("review_title", None),
+                "review_content": review.get("review_text", None),
+            })
+    return pd.DataFrame(transformed_data)
+
+
+def benchmark_transform_reviews(product_counts=(1000, 4000, 16000), reviews_per_product=10):
+    # columnar transform_reviews against the iterrows loop, same output checked
+    results = []
+    for n_products in product_counts:
+        reviews = synthetic_review_dump(n_products, reviews_per_product)
+        start = time.perf_counter()
+        expected = _transform_reviews_loop(reviews)
+        loop_time = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = transform_reviews(reviews)
+        columnar_time = time.perf_counter() - start
+
+        pd.testing.assert_frame_equal(actual, expected)
+        results.append({'products': n_products, 'reviews': len(actual), 'loop_s': loop_time,
+                        'columnar_s': columnar_time, 'speedup': loop_time / columnar_time})
+    return pd.DataFrame(results)
+
+
+def _create_order_df_loop(reviews_df, product_df):
+    # the original per-row uuid4 ids and random.uniform discounts, kept as the baseline
+    order_df = reviews_df[["product_id", "customer_userid"]].copy()
+    order_df["order_id"] = [uuid.uuid4() for _ in range(len(order_df))]
+    prices = order_df["product_id"].map(product_df.set_index("product_id")["product_price"])
+    order_df["paid_amt"] = prices.apply(
+        lambda price: price - (price * random.uniform(0, 0.50)) if pd.notnull(price) else None
+    )
+    order_df["order_date"] = pd.to_datetime(reviews_df["review_date"]) - pd.to_timedelta(
+        np.random.randint(2, 10, size=len(order_df)), unit='D'
+    )
+    return order_df
+
+
+def benchmark_create_order_df(order_counts=(100000, 1000000, 10000000), baseline_max=1000000, n_products=4000):
+    # seeded vectorized order synthesis against the per-row loop, which is skipped above baseline_max orders
+    rng = np.random.default_rng(42)
+    product_df = pd.DataFrame({'product_id': np.char.add('product_', np.arange(n_products).astype(str)),
+                               'product_price': rng.uniform(20, 300, n_products)})
+    results = []
+    for n_orders in order_counts:
+        reviews_df = pd.DataFrame({
+            'product_id': pd.Categorical.from_codes(rng.integers(0, n_products, n_orders), product_df['product_id']),
+            'customer_userid': 'user_1',
+            'review_date': pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 365, n_orders), unit='D'),
+        })
+        start = time.perf_counter()
+        order_df = create_order_df(reviews_df, product_df, rng=42)
+        vectorized_time = time.perf_counter() - start
+        assert order_df.equals(create_order_df(reviews_df, product_df, rng=42))
+
+        loop_time = np.nan
+        if n_orders <= baseline_max:
+            start = time.perf_counter()
+            _create_order_df_loop(reviews_df, product_df)
+            loop_time = time.perf_counter() - start
+        results.append({'orders': n_orders, 'loop_s': loop_time, 'vectorized_s': vectorized_time,
+                        'speedup': loop_time / vectorized_time})
+    return pd.DataFrame(results)
+
+
+def synthetic_orders(n_orders, n_customers=None, seed=42):
+    # order table with the columns the clustering script uses
+    rng = np.random.default_rng(seed)
+    n_customers = n_customers or max(n_orders // 2, 1)
+    return pd.DataFrame({
+        'customer_code': rng.integers(0, n_customers, n_orders).astype(np.int32),
+        'order_id': np.char.add('order_', np.arange(n_orders).astype(str)),
+        'paid_amt': rng.uniform(20, 300, n_orders),
+        'order_date': pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 365, n_orders), unit='D'),
+    })
+
+
+def _seasonal_features_groupby(order_df):
+    # the original row-wise apply and per-group lambdas, kept as the baseline
+    order_df = order_df.copy()
+    order_df['is_holiday'] = order_df['order_date'].apply(lambda x: 1 if x.month in [11, 12] else 0)
+    return order_df.groupby('customer_code').agg(
+        total_spending=('paid_amt', 'sum'),
+        holiday_spending=('paid_amt', lambda x: x[order_df.loc[x.index, 'is_holiday'] == 1].sum()),
+        non_holiday_spending=('paid_amt', lambda x: x[order_df.loc[x.index, 'is_holiday'] == 0].sum()),
+        order_count=('order_id', 'count')
+    ).reset_index()
+
+
+def benchmark_seasonal_features(scales=(1, 10, 100), base_orders=10000):
+    # bincount seasonal features against the groupby lambdas at growing order volumes
+    results = []
+    for scale in scales:
+        order_df = synthetic_orders(base_orders * scale)
+        start = time.perf_counter()
+        expected = _seasonal_features_groupby(order_df)
+        groupby_time = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = seasonal_features(order_df)
+        bincount_time = time.perf_counter() - start
+
+        pd.testing.assert_frame_equal(actual[expected.columns], expected, check_dtype=False)
+        results.append({'scale': scale, 'orders': len(order_df), 'customers': len(actual),
+                        'groupby_s': groupby_time, 'bincount_s': bincount_time,
+                        'speedup': groupby_time / bincount_time})
+    return pd.DataFrame(results)
+
+
+def benchmark_k_sweep(customer_counts=(10000, 50000), k_values=range(1, 11)):
+    # default k_sweep (parallel chains with warm starts) against independent cold fits in one process
+    results = []
+    for n_customers in customer_counts:
+        features = seasonal_features(synthetic_orders(3 * n_customers, n_customers))
+        X = StandardScaler().fit_transform(features[SEGMENTATIONS['seasonal']])
+
+        start = time.perf_counter()
+        sweep = k_sweep(X, k_values)
+        sweep_time = time.perf_counter() - start
+        # every chain keeps at least two k values, so the default call warm-starts whatever the core count
+        assert sweep['warm_started'].any()
+        start = time.perf_counter()
+        cold = k_sweep(X, k_values, n_jobs=1, warm_start=False)
+        cold_time = time.perf_counter() - start
+
+        results.append({'customers': n_customers, 'warm_started': int(sweep['warm_started'].sum()),
+                        'sweep_s': sweep_time, 'cold_serial_s': cold_time,
+                        # warm / cold WCSS per k, close to 1 when the warm starts find as good a solution
+                        'worst_inertia_ratio': float((sweep['inertia'] / cold['inertia']).max())})
+    return pd.DataFrame(results)
+
+
+def benchmark_streaming_segmentation(customer_counts=(10000, 100000, 1000000), k=4, chunk_size=100000):
+    # streaming mini-batch segmentation of seasonal features against full-batch KMeans
+    columns = SEGMENTATIONS['seasonal']
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_customers in customer_counts:
+            path = os.path.join(directory, f'features_{n_customers}.parquet')
+            seasonal_features(synthetic_orders(3 * n_customers, n_customers)).to_parquet(path, index=False)
+
+            def chunks():
+                return feature_chunks(path, columns, chunk_size)
+
+            start = time.perf_counter()
+            model = StreamingSegmentation(k).fit(chunks)
+            streaming_time = time.perf_counter() - start
+
+            X = pd.read_parquet(path, columns=columns).to_numpy(dtype=np.float64)
+            report = compare_with_full_batch(X, model)
+            report['streaming_fit_s'] = streaming_time
+            results.append(report)
+    return pd.DataFrame(results)
+
+
+def benchmark_spending_tiers(customer_counts=(1000, 10000, 100000), max_k=10):
+    # exact 1-D segmentation against the KMeans elbow loop on total spending
+    results = []
+    for n_customers in customer_counts:
+        spending = seasonal_features(synthetic_orders(3 * n_customers, n_customers))['total_spending'].to_numpy()
+
+        start = time.perf_counter()
+        tiers = OptimalSegmentation1D(spending, max_k=max_k)
+        exact_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        kmeans_inertia = [KMeans(n_clusters=k, random_state=42).fit(spending[:, None]).inertia_
+                          for k in range(1, max_k + 1)]
+        kmeans_time = time.perf_counter() - start
+
+        results.append({'customers': len(spending), 'exact_s': exact_time, 'kmeans_loop_s': kmeans_time,
+                        'speedup': kmeans_time / exact_time,
+                        # kmeans / exact WCSS, >= 1 since the segmentation is optimal
+                        'worst_wcss_ratio': float(np.max(np.array(kmeans_inertia) / tiers.sweep()['inertia']))})
+    return pd.DataFrame(results)
+
+
+def synthetic_product_activity(n_orders, n_reviews, n_products=2000, seed=42):
+    # orders, reviews and products with Zipf-like product popularity
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, n_products + 1)
+    popularity /= popularity.sum()
+    product_df = pd.DataFrame({
+        'product_code': np.arange(n_products, dtype=np.int32),
+        'product_category': pd.Categorical(rng.choice(['dress', 'top', 'sweater', 'pants'], n_products)),
+    })
+    order_df = pd.DataFrame({
+        'product_code': rng.choice(n_products, n_orders, p=popularity).astype(np.int32),
+        'paid_amt': rng.uniform(20, 300, n_orders),
+    })
+    reviews_df = pd.DataFrame({
+        'product_code': rng.choice(n_products, n_reviews, p=popularity).astype(np.int32),
+        'star_ratings': rng.integers(1, 6, n_reviews).astype(np.float64),
+        'review_content': 'review',
+    })
+    return order_df, reviews_df, product_df
+
+
+def _category_performance_join(order_df, reviews_df, product_df):
+    # the order x review join on the product the report used to build, with every order and review
+    # counted once, and the number of rows the join held
+    orders = order_df.assign(order_row=np.arange(len(order_df)))
+    reviews = reviews_df.assign(review_row=np.arange(len(reviews_df)))
+    joined = orders.merge(reviews, on='product_code').merge(product_df, on='product_code')
+    revenue = joined.drop_duplicates('order_row').groupby('product_category', observed=True)['paid_amt'].sum()
+    grouped = joined.drop_duplicates('review_row').groupby('product_category', observed=True)
+    expected = pd.DataFrame({
+        'total_revenue': revenue,
+        'avg_star_rating': grouped['star_ratings'].mean(),
+        'total_reviews': grouped['review_content'].count(),
+    }).reset_index()
+    return expected, len(joined)
+
+
+def _category_performance_rows(order_df, reviews_df, product_df):
+    # category_performance's result and the rows of the per-product totals, the largest table it builds
+    rows = []
+
+    def recorded(*args):
+        totals = product_totals(*args)
+        rows.append(len(totals))
+        return totals
+
+    with mock.patch.object(category_module, 'product_totals', recorded):
+        result = category_performance(order_df, reviews_df, product_df)
+    return result, max(rows)
+
+
+def check_category_performance(n_orders=400, n_reviews=400, n_products=50):
+    # on a fixture small enough to join, the aggregation matches the deduplicated join
+    # and never holds as many rows as the join did
+    order_df, reviews_df, product_df = synthetic_product_activity(n_orders, n_reviews, n_products)
+    result, intermediate_rows = _category_performance_rows(order_df, reviews_df, product_df)
+    expected, join_rows = _category_performance_join(order_df, reviews_df, product_df)
+    assert join_rows == product_join_size(order_df, reviews_df)
+    assert intermediate_rows < join_rows
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_categorical=False)
+
+
+def benchmark_category_performance(scales=(1, 4, 16), base_rows=5000):
+    # rows materialized by the per-product aggregation against the order x review join it replaces
+    check_category_performance()
+    results = []
+    for scale in scales:
+        order_df, reviews_df, product_df = synthetic_product_activity(base_rows * scale, base_rows * scale)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        _, aggregate_rows = _category_performance_rows(order_df, reviews_df, product_df)
+        aggregate_time = time.perf_counter() - start
+        aggregate_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # the aggregation holds one row per product, the join grows with orders x reviews of the popular products
+        join_rows = product_join_size(order_df, reviews_df)
+        results.append({'orders': len(order_df), 'reviews': len(reviews_df),
+                        'aggregate_rows': aggregate_rows, 'join_rows': join_rows,
+                        'aggregate_s': aggregate_time, 'aggregate_peak_mb': aggregate_peak / 2 ** 20})
+    return pd.DataFrame(results)
+
+
+def _describe_pandas(df, group_aggregates):
+    # the per-column pandas calls the descriptive analysis made before profiling
+    df.isnull().sum()
+    df.nunique()
+    for column in df.columns:
+        if pd.api.types.is_numeric_dtype(df[column]):
+            df[column].describe()
+        if df[column].nunique() <= MAX_VALUE_COUNTS:
+            df[column].value_counts()
+    for key, freq, value_columns in group_aggregates.values():
+        keys = df[key].dt.to_period(freq).astype(str) if freq else df[key]
+        df.groupby(keys, observed=True).size()
+        for column in value_columns:
+            df.groupby(keys, observed=True)[column].agg(['sum', 'mean'])
+
+
+def benchmark_profiling(order_counts=(100000, 1000000)):
+    # profile_table against the per-column pandas calls on an order table
+    results = []
+    for n_orders in order_counts:
+        order_df = synthetic_orders(n_orders)
+        order_df['product_code'] = np.random.default_rng(0).integers(0, 4000, n_orders).astype(np.int32)
+
+        start = time.perf_counter()
+        _describe_pandas(order_df, GROUP_AGGREGATES['order'])
+        pandas_time = time.perf_counter() - start
+        start = time.perf_counter()
+        profile_table(order_df, GROUP_AGGREGATES['order'])
+        profile_time = time.perf_counter() - start
+        results.append({'orders': n_orders, 'pandas_s': pandas_time, 'profile_s': profile_time,
+                        'speedup': pandas_time / profile_time})
+    return pd.DataFrame(results)
+
+
+def check_append_new_ids(n_orders=1000, n_customers=100, n_products=20, seed=42):
+    # orders appended with raw ids, some never seen before, get codes and reach the refreshed features
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        customer_df = pd.DataFrame({'customer_userid': [f'user_{i}' for i in range(n_customers)]})
+        product_df = pd.DataFrame({'product_id': [f'product_{i}' for i in range(n_products)],
+                                   'product_category': rng.choice(['dress', 'top'], n_products)})
+        dictionaries = build_id_dictionaries(customer_df, product_df)
+        save_id_dictionaries(dictionaries, directory)
+        order_df = synthetic_orders(n_orders, n_customers, seed=seed)
+        order_df['customer_userid'] = dictionaries['customer'].decode(order_df.pop('customer_code'))
+        order_df['product_id'] = dictionaries['product'].decode(rng.integers(0, n_products, n_orders))
+        for name, table in [('customer', customer_df), ('product', product_df), ('order', order_df)]:
+            write_table(add_codes(table, dictionaries), name, directory)
+        FeatureStore(directory).customer_features()
+
+        new_orders = pd.DataFrame({
+            'customer_userid': ['user_new', 'user_new', 'user_0'],
+            'product_id': ['product_new', 'product_0', 'product_new'],
+            'order_id': ['new_1', 'new_2', 'new_3'],
+            'paid_amt': [10.0, 20.0, 30.0],
+            'order_date': pd.Timestamp('2024-01-01'),
+        })
+        append_table(new_orders, 'order', directory)
+
+        customers = read_id_dictionaries(directory)['customer']
+        assert len(customers) == n_customers + 1 and len(read_id_dictionaries(directory)['product']) == n_products + 1
+        assert (read_table('order', directory, ['customer_code', 'product_code']) >= 0).all().all()
+        features = FeatureStore(directory).customer_features().set_index('customer_code')['total_spending']
+        assert features[customers.encode(['user_new'])[0]] == 30.0
+        expected = order_df.loc[order_df['customer_userid'] == 'user_0', 'paid_amt'].sum() + 30.0
+        assert np.isclose(features[customers.encode(['user_0'])[0]], expected)
+
+
+def benchmark_partitioned_orders(order_counts=(1000000, 4000000), n_customers=50000, seed=42):
+    # one day of orders appended to a monthly-partitioned order table: feature refresh and a one-month read,
+    # against recomputing from the single-file table
+    check_append_new_ids()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        product_df = pd.DataFrame({'product_code': np.arange(2000, dtype=np.int32),
+                                   'product_category': np.random.default_rng(seed).choice(['dress', 'top'], 2000)})
+        write_table(product_df, 'product', directory)
+        for n_orders in order_counts:
+            order_df = synthetic_orders(n_orders, n_customers, seed=seed)
+            order_df['product_code'] = np.random.default_rng(seed).integers(0, 2000, n_orders).astype(np.int32)
+            new_orders = synthetic_orders(n_orders // 365, n_customers, seed=seed + 1).assign(
+                product_code=np.int32(0), order_date=pd.Timestamp('2024-01-01'))
+
+            single = os.path.join(directory, f'single-{n_orders}')
+            os.makedirs(single)
+            write_table(product_df, 'product', single)
+            pd.concat([order_df, new_orders]).to_parquet(table_path('order', single), index=False)
+            start = time.perf_counter()
+            FeatureStore(single).customer_features()
+            single_features_time = time.perf_counter() - start
+            start = time.perf_counter()
+            month = read_table('order', single, ['paid_amt', 'order_date'])
+            month = month[(month['order_date'] >= '2023-06-01') & (month['order_date'] < '2023-07-01')]
+            single_read_time = time.perf_counter() - start
+
+            partitioned = os.path.join(directory, f'partitioned-{n_orders}')
+            os.makedirs(partitioned)
+            write_table(product_df, 'product', partitioned)
+            write_table(order_df, 'order', partitioned)
+            FeatureStore(partitioned).customer_features()
+            append_table(new_orders, 'order', partitioned)
+            start = time.perf_counter()
+            FeatureStore(partitioned).customer_features()
+            partitioned_features_time = time.perf_counter() - start
+            start = time.perf_counter()
+            pruned = read_table('order', partitioned, ['paid_amt', 'order_date'],
+                                start='2023-06-01', end='2023-06-30 23:59:59')
+            pruned_read_time = time.perf_counter() - start
+            assert len(pruned) == len(month)
+
+            results.append({'orders': n_orders, 'customers': n_customers, 'appended': len(new_orders),
+                            'single_features_s': single_features_time, 'partitioned_features_s': partitioned_features_time,
+                            'single_month_read_s': single_read_time, 'pruned_month_read_s': pruned_read_time})
+    return pd.DataFrame(results)
+
+
+def _monthly_trends_groupby(order_df, reviews_df, start='2023-01', end='2024-01'):
+    # the year_month string groupbys and filters the descriptive analysis made before the rollup cube
+    order_df = order_df.assign(year_month=order_df['order_date'].dt.to_period('M').astype(str))
+    reviews_df = reviews_df.assign(year_month=reviews_df['review_date'].dt.to_period('M').astype(str))
+    trends = pd.DataFrame({
+        'order_count': order_df.groupby('year_month').size(),
+        'revenue': order_df.groupby('year_month')['paid_amt'].sum(),
+        'review_count': reviews_df.groupby('year_month').size(),
+    })
+    return trends[(trends.index >= start) & (trends.index <= end)]
+
+
+def benchmark_rollups(order_counts=(100000, 1000000), queries=20, seed=42):
+    # repeated monthly trend queries: rollup cube lookups against year_month groupbys, and an incremental update
+    results = []
+    rng = np.random.default_rng(seed)
+    for n_orders in order_counts:
+        order_df, reviews_df, product_df = synthetic_product_activity(n_orders, n_orders // 2)
+        order_df['order_date'] = pd.Timestamp('2022-06-01') + pd.to_timedelta(rng.integers(0, 730, n_orders), unit='D')
+        reviews_df['review_date'] = pd.Timestamp('2022-06-01') + pd.to_timedelta(
+            rng.integers(0, 730, len(reviews_df)), unit='D')
+
+        start = time.perf_counter()
+        for _ in range(queries):
+            expected = _monthly_trends_groupby(order_df, reviews_df)
+        groupby_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cube = RollupCube.build(order_df, reviews_df, product_df)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(queries):
+            trends = cube.query('month', '2023-01', '2024-01', metrics=['order_count', 'revenue', 'review_count'])
+        query_time = time.perf_counter() - start
+        trends.index = trends.index.astype(str)
+        assert np.allclose(trends.to_numpy(), expected.reindex(trends.index, fill_value=0).to_numpy())
+
+        # one more day of orders folded into the cube
+        new_orders = order_df.sample(n_orders // 365, random_state=seed).assign(order_date=pd.Timestamp('2024-06-01'))
+        start = time.perf_counter()
+        cube.add_orders(new_orders)
+        update_time = time.perf_counter() - start
+        results.append({'orders': n_orders, 'queries': queries, 'groupby_s': groupby_time,
+                        'build_s': build_time, 'query_s': query_time, 'update_s': update_time})
+    return pd.DataFrame(results)
+
+
+def benchmark_sketches(order_counts=(1000000, 4000000), n_jobs=None):
+    # sketch_table quantiles and distinct counts against exact ones on a stored order table
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_orders in order_counts:
+            order_df = synthetic_orders(n_orders)
+            order_df.to_parquet(table_path('order', directory), index=False, row_group_size=ROW_GROUP_SIZE)
+
+            start = time.perf_counter()
+            sketches = sketch_table('order', ['paid_amt', 'customer_code'], directory, n_jobs=n_jobs)
+            sketch_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            exact = pd.read_parquet(table_path('order', directory), columns=['paid_amt', 'customer_code'])
+            exact_bounds = iqr_bounds(exact['paid_amt'].quantile(0.15), exact['paid_amt'].quantile(0.80))
+            exact_customers = exact['customer_code'].nunique()
+            exact_time = time.perf_counter() - start
+
+            bounds = sketch_iqr_bounds(sketches['paid_amt'].quantiles)
+            results.append({
+                'orders': n_orders, 'sketch_s': sketch_time, 'exact_s': exact_time,
+                'lower_bound_error': abs(bounds[0] - exact_bounds[0]) / abs(exact_bounds[0]),
+                'upper_bound_error': abs(bounds[1] - exact_bounds[1]) / abs(exact_bounds[1]),
+                'distinct_error': abs(sketches['customer_code'].distinct.count() - exact_customers) / exact_customers,
+            })
+    return pd.DataFrame(results)
+
+
+BENCHMARKS = {
+    'category_performance': benchmark_category_performance,
+    'create_order_df': benchmark_create_order_df,
+    'k_sweep': benchmark_k_sweep,
+    'neighbors': benchmark_neighbors,
+    'partitioned_orders': benchmark_partitioned_orders,
+    'profiling': benchmark_profiling,
+    'rollups': benchmark_rollups,
+    'seasonal_features': benchmark_seasonal_features,
+    'sketches': benchmark_sketches,
+    'spending_tiers': benchmark_spending_tiers,
+    'streaming_segmentation': benchmark_streaming_segmentation,
+    'transform_reviews': benchmark_transform_reviews,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    args = parser.parse_args()
+    print(BENCHMARKS[args.benchmark]().to_string(index=False))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Revenue, rating and review figures per product category.
+
+Orders and reviews are each reduced to one row per product with
+`np.bincount` over the integer product codes, and only those per-product
+totals are joined and rolled up to categories. Joining the raw orders and
+reviews on the product instead pairs every order with every review of the
+same product, which grows with orders x reviews for popular products and
+repeats each order's revenue once per review.
+
+As in the report, only products with both orders and reviews are counted.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _product_sums(codes, n_products, **weights):
+    # per-product sums of each weight column, one bincount each; code -1 (unknown product) is skipped
+    known = codes >= 0
+    return {name: np.bincount(codes[known], weights=values[known], minlength=n_products)
+            for name, values in weights.items()}
+
+
+def product_totals(order_df, reviews_df, n_products):
+    # one row per product code: revenue and order count, rating sum and count, review count
+    order_codes = order_df['product_code'].to_numpy()
+    review_codes = reviews_df['product_code'].to_numpy()
+    ratings = reviews_df['star_ratings'].to_numpy(dtype=np.float64)
+    rated = ~np.isnan(ratings)
+
+    totals = pd.DataFrame({
+        **_product_sums(order_codes, n_products,
+                        revenue=np.nan_to_num(order_df['paid_amt'].to_numpy(dtype=np.float64)),
+                        orders=np.ones(len(order_codes))),
+        **_product_sums(review_codes, n_products,
+                        rating_sum=np.where(rated, ratings, 0.0),
+                        rating_count=rated.astype(np.float64),
+                        reviews=reviews_df['review_content'].notna().to_numpy(dtype=np.float64),
+                        review_rows=np.ones(len(review_codes))),
+    })
+    totals.index.name = 'product_code'
+    return totals
+
+
+def category_performance(order_df, reviews_df, product_df):
+    # total_revenue, avg_star_rating and total_reviews per product category
+    n_products = int(max(product_df['product_code'].max(), order_df['product_code'].max(),
+                         reviews_df['product_code'].max())) + 1
+    totals = product_totals(order_df, reviews_df, n_products)
+    totals = totals[(totals['orders'] > 0) & (totals['review_rows'] > 0)]
+
+    categories = product_df.set_index('product_code')['product_category']
+    totals = totals.join(categories, how='inner')
+    grouped = totals.groupby('product_category', observed=True)
+    category_performance = pd.DataFrame({
+        'total_revenue': grouped['revenue'].sum(),
+        'avg_star_rating': grouped['rating_sum'].sum() / grouped['rating_count'].sum(),
+        'total_reviews': grouped['reviews'].sum().astype(np.int64),
+    }).reset_index()
+    return category_performance
+
+
+def product_join_size(order_df, reviews_df):
+    # rows an order x review join on the product would materialize, without building it
+    orders = order_df['product_code'].value_counts()
+    reviews = reviews_df['product_code'].value_counts()
+    return int((orders * reviews.reindex(orders.index, fill_value=0)).sum())
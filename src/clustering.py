@@ -27,8 +27,15 @@ The datasets are loaded into pandas DataFrames for further preprocessing and ana
 """
 
 import pandas as pd
+from storage import read_id_dictionaries
+from feature_store import FeatureStore
+from features import CATEGORY_PREFIX, HOLIDAY_MONTHS
+from segment_model import SegmentModel
+from segment_registry import SegmentRegistry
+from segmentation import (
+    OptimalSegmentation1D, feature_labels, k_sweep, plot_sweep, select_k, tier_labels, warm_kmeans,
+)
 import numpy as np
-from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 import matplotlib.pyplot as plt
 
@@ -41,17 +48,25 @@ Data preprocessing involves the following steps:
 These steps ensure that the dataset is clean and suitable for clustering and analysis.
 """
 
-customer_df = pd.read_csv('./data/processed/customer.csv')
-order_df = pd.read_csv('./data/processed/order.csv')
-product_df = pd.read_csv('./data/processed/product.csv')
+# readable ids for the integer customer codes
+customer_ids = read_id_dictionaries()['customer']
+
+# spending, category and seasonal features per customer, computed once and cached
+feature_store = FeatureStore()
+customer_features = feature_store.customer_features(holidays=HOLIDAY_MONTHS)
+
+# segment ids and names that stay the same across runs
+registry = SegmentRegistry()
+# fitted scalers and centroids, saved for assigning new customers
+segment_model = SegmentModel()
 
 """## Elbow Method for Optimal Clusters
 - The Elbow Method is applied to identify the optimal number of clusters for customer segmentation.
 - The Within-Cluster Sum of Squares (WCSS) is plotted against various cluster counts to locate the "elbow point."
 
-## K-Means Clustering
-- K-Means clustering is used to group customers based on their total spending.
-- The resulting clusters are labeled as:
+## Spending Tiers
+- Customers are grouped by total spending with an exact one-dimensional segmentation, which finds the lowest WCSS for every number of clusters in one pass and numbers the clusters from the lowest spending up.
+- The resulting clusters are labeled by their rank, e.g. with four clusters:
   - Low Spenders
   - Moderate Spenders
   - High Spenders
@@ -62,48 +77,36 @@ product_df = pd.read_csv('./data/processed/product.csv')
 """
 
 # Aggregate total spending per customer
-customer_spending = order_df.groupby('customer_userid')['paid_amt'].sum().reset_index()
-customer_spending.columns = ['customer_userid', 'total_spending']
+customer_spending = customer_features[['customer_code', 'total_spending']].copy()
+customer_spending.insert(0, 'customer_userid', customer_ids.decode(customer_spending['customer_code']))
 
 # Normalize the total spending
 scaler = StandardScaler()
 customer_spending['total_spending_scaled'] = scaler.fit_transform(customer_spending[['total_spending']])
 
-# Apply the Elbow Method
-wcss = []
-K = range(1, 11)
-for k in K:
-    kmeans = KMeans(n_clusters=k, random_state=42)
-    kmeans.fit(customer_spending[['total_spending_scaled']])
-    wcss.append(kmeans.inertia_)
+# Apply the Elbow Method: the exact minimal WCSS for k = 1..10
+spending_tiers = OptimalSegmentation1D(customer_spending['total_spending_scaled'], max_k=10)
+sweep = spending_tiers.sweep()
+print(sweep)
 
 # Plot the Elbow Method results
-plt.figure(figsize=(10, 6))
-plt.plot(K, wcss, marker='o', linestyle='--')
-plt.xlabel('Number of Clusters')
-plt.ylabel('Within-Cluster Sum of Squares (WCSS)')
-plt.title('Elbow Method for Optimal Number of Clusters')
-plt.xticks(K)
-plt.grid()
-plt.show()
+plot_sweep(sweep, 'Elbow Method for Optimal Number of Clusters')
 
-# Apply K-Means with the optimal number of clusters
-optimal_k = 4
-kmeans = KMeans(n_clusters=optimal_k, random_state=42)
-customer_spending['cluster'] = kmeans.fit_predict(customer_spending[['total_spending_scaled']])
+# Segment with the number of clusters at the elbow of the WCSS curve, cluster 0 spends the least
+optimal_k = select_k(sweep)
+tiers = spending_tiers.labels(customer_spending['total_spending_scaled'], optimal_k)
 
 # Analyze the cluster centers
-cluster_centers = kmeans.cluster_centers_
-cluster_centers_scaled = scaler.inverse_transform(cluster_centers)
+cluster_centers_scaled = scaler.inverse_transform(spending_tiers.centers(optimal_k).reshape(-1, 1))
 print("Cluster Centers (Total Spending):", cluster_centers_scaled)
 
-# Assign labels
-labels = {
-    0: "Low Spenders",
-    3: "Moderate Spenders",
-    1: "High Spenders",
-    2: "Very High Spenders"
-}
+# Match the tiers to the registered segments, new segments are named in order of spending
+segment_ids = registry.assign('spending', cluster_centers_scaled, ['total_spending'], scale=scaler.scale_,
+                              names=tier_labels("Spenders", optimal_k))
+customer_spending['cluster'] = segment_ids[tiers]
+labels = registry.labels('spending')
+segment_model.add('spending', ['total_spending'], scaler, spending_tiers.centers(optimal_k).reshape(-1, 1),
+                  segment_ids, labels)
 customer_spending['spending_segment'] = customer_spending['cluster'].map(labels)
 
 # Visualize the clusters
@@ -132,11 +135,11 @@ print(customer_spending.head())
 
 ## Clustering Preferences
 - The Elbow Method is used to determine the optimal number of clusters for product preferences.
-- Customers are segmented into clusters such as:
-  - Dress Enthusiasts
-  - Sweater Fans
-  - Diverse Shoppers
+- Customers are segmented into clusters named after the category they buy most, such as:
+  - Dress Buyers
+  - Sweater Buyers
   - Top Buyers
+  - Diverse Shoppers
 
 ## Visualization
 - Principal Component Analysis (PCA) reduces the matrix dimensions to two for visualization.
@@ -144,55 +147,48 @@ print(customer_spending.head())
 
 """
 
-# Merge datasets
-order_product_df = pd.merge(order_df, product_df, on='product_id')
-customer_order_product_df = pd.merge(order_product_df, customer_df, on='customer_userid')
-
 # Create customer-product category matrix
-# Group by customer_userid and product_category to calculate counts (or spending)
-product_preferences = customer_order_product_df.groupby(['customer_userid', 'product_category']).size().unstack(fill_value=0)
+# Order counts per customer_code and product_category from the feature store
+product_preferences = feature_store.category_counts(holidays=HOLIDAY_MONTHS)
 
 # Normalize the data
 scaler = StandardScaler()
 product_preferences_scaled = scaler.fit_transform(product_preferences)
 
 # Apply the Elbow Method to find the optimal number of clusters
-wcss = []
-K = range(1, 11)
-for k in K:
-    kmeans = KMeans(n_clusters=k, random_state=42)
-    kmeans.fit(product_preferences_scaled)
-    wcss.append(kmeans.inertia_)
+sweep = k_sweep(product_preferences_scaled)
+print(sweep)
 
 # Plot the Elbow Method
-plt.figure(figsize=(10, 6))
-plt.plot(K, wcss, marker='o', linestyle='--')
-plt.xlabel('Number of Clusters')
-plt.ylabel('Within-Cluster Sum of Squares (WCSS)')
-plt.title('Elbow Method for Optimal Clusters')
-plt.grid()
-plt.show()
+plot_sweep(sweep, 'Elbow Method for Optimal Clusters')
 
-# Apply K-Means with the optimal number of clusters
-optimal_k = 4
-kmeans = KMeans(n_clusters=optimal_k, random_state=42)
-product_preferences['cluster'] = kmeans.fit_predict(product_preferences_scaled)
+# Apply K-Means with the number of clusters at the elbow of the WCSS curve
+# seeded with the previous run's centroids
+optimal_k = select_k(sweep)
+preference_features = list(product_preferences.columns)
+previous = registry.previous_centroids('preferences', preference_features)
+kmeans = warm_kmeans(optimal_k, None if previous is None else scaler.transform(previous))
+clusters = kmeans.fit_predict(product_preferences_scaled)
 
 # Analyze cluster centers and assign labels
 cluster_centers = kmeans.cluster_centers_
 # print("Cluster Centers (scaled):", cluster_centers)
 
-# Assign labels to clusters
-labels = {
-    1: "Dress Enthusiasts",
-    0: "Sweater Fans",
-    2: "Diverse Shoppers",
-    3: "Top Buyers"
-}
+# Match the clusters to the registered segments; segments seen for the first time are named
+# after the category their centroid is highest on, whatever KMeans numbered them or the categories are
+segment_ids = registry.assign('preferences', scaler.inverse_transform(cluster_centers), preference_features,
+                              scale=scaler.scale_, names=feature_labels(cluster_centers, preference_features, {
+    category: f"{str(category).title()} Buyers" for category in preference_features
+}, default="Diverse Shoppers"))
+product_preferences['cluster'] = segment_ids[clusters]
+labels = registry.labels('preferences')
+segment_model.add('preferences', [CATEGORY_PREFIX + str(c) for c in preference_features], scaler,
+                  cluster_centers, segment_ids, labels)
 product_preferences['preference_segment'] = product_preferences['cluster'].map(labels)
 
 # Save the results
 product_preferences.reset_index(inplace=True)
+product_preferences.insert(0, 'customer_userid', customer_ids.decode(product_preferences['customer_code']))
 product_preferences.to_csv('customer_product_category_segments.csv', index=False)
 
 # Visualization
@@ -232,31 +228,11 @@ plt.show()
 - Scatter plots are used to display customer segments based on holiday and non-holiday spending patterns.
 """
 
-# Convert 'order_date' to datetime format
-order_df['order_date'] = pd.to_datetime(order_df['order_date'])
-
-# Extract time-based features
-order_df['month'] = order_df['order_date'].dt.month
-order_df['is_holiday'] = order_df['order_date'].apply(lambda x: 1 if x.month in [11, 12] else 0)  # Holiday: Nov & Dec
-
-# Aggregate customer data
-customer_seasonal = order_df.groupby('customer_userid').agg(
-    total_spending=('paid_amt', 'sum'),
-    holiday_spending=('paid_amt', lambda x: x[order_df.loc[x.index, 'is_holiday'] == 1].sum()),
-    non_holiday_spending=('paid_amt', lambda x: x[order_df.loc[x.index, 'is_holiday'] == 0].sum()),
-    order_count=('order_id', 'count')
-).reset_index()
-
-# Replace NaN values (e.g., customers with no holiday spending) with 0
-customer_seasonal.fillna(0, inplace=True)
-
-# features for clustering
-# Add a holiday_ratio feature to emphasize holiday spending
-customer_seasonal['holiday_ratio'] = customer_seasonal['holiday_spending'] / customer_seasonal['total_spending']
-customer_seasonal['holiday_ratio'].fillna(0, inplace=True)
-
-# Re-weight holiday spending to give it more importance in clustering
-customer_seasonal['weighted_holiday_spending'] = customer_seasonal['holiday_spending'] * 2
+# Aggregate customer data: total, holiday (Nov & Dec) and non-holiday spending, order count,
+# holiday_ratio and holiday spending re-weighted to give it more importance in clustering
+customer_seasonal = customer_features[['customer_code', 'total_spending', 'holiday_spending', 'non_holiday_spending',
+                                       'order_count', 'holiday_ratio', 'weighted_holiday_spending']].copy()
+customer_seasonal.insert(0, 'customer_userid', customer_ids.decode(customer_seasonal['customer_code']))
 
 #Select features for clustering
 features = ['weighted_holiday_spending', 'non_holiday_spending', 'holiday_ratio', 'order_count']
@@ -264,37 +240,34 @@ scaler = StandardScaler()
 customer_seasonal_scaled = scaler.fit_transform(customer_seasonal[features])
 
 #Use the Elbow Method to find the optimal number of clusters
-wcss = []
-K = range(1, 11)
-for k in K:
-    kmeans = KMeans(n_clusters=k, random_state=42)
-    kmeans.fit(customer_seasonal_scaled)
-    wcss.append(kmeans.inertia_)
+sweep = k_sweep(customer_seasonal_scaled)
+print(sweep)
 
 # Plot the Elbow Method
-plt.figure(figsize=(10, 6))
-plt.plot(K, wcss, marker='o', linestyle='--')
-plt.xlabel('Number of Clusters')
-plt.ylabel('Within-Cluster Sum of Squares (WCSS)')
-plt.title('Elbow Method for Seasonal Clustering')
-plt.grid()
-plt.show()
+plot_sweep(sweep, 'Elbow Method for Seasonal Clustering')
 
-# Step 7: Apply K-Means Clustering
-optimal_k = 4
-kmeans = KMeans(n_clusters=optimal_k, random_state=42)
-customer_seasonal['cluster'] = kmeans.fit_predict(customer_seasonal_scaled)
+# Step 7: Apply K-Means Clustering with the number of clusters at the elbow of the WCSS curve
+# seeded with the previous run's centroids
+optimal_k = select_k(sweep)
+previous = registry.previous_centroids('seasonal', features)
+kmeans = warm_kmeans(optimal_k, None if previous is None else scaler.transform(previous))
+clusters = kmeans.fit_predict(customer_seasonal_scaled)
 
 #label clusters
 cluster_centers = kmeans.cluster_centers_
 
-# Assign labels based on cluster analysis
-labels = {
-    0: "Occasional Shoppers",
-    1: "Big Spenders",
-    2: "Holiday Shoppers",
-    3: "Year-Round Shoppers"
-}
+# Match the clusters to the registered segments; segments seen for the first time are named
+# after the feature their centroid is highest on, whatever KMeans numbered them
+segment_ids = registry.assign('seasonal', scaler.inverse_transform(cluster_centers), features,
+                              scale=scaler.scale_, names=feature_labels(cluster_centers, features, {
+    'non_holiday_spending': "Big Spenders",
+    'weighted_holiday_spending': "Holiday Shoppers",
+    'holiday_ratio': "Holiday Shoppers",
+    'order_count': "Year-Round Shoppers",
+}, default="Occasional Shoppers"))
+customer_seasonal['cluster'] = segment_ids[clusters]
+labels = registry.labels('seasonal')
+segment_model.add('seasonal', features, scaler, cluster_centers, segment_ids, labels)
 customer_seasonal['segment'] = customer_seasonal['cluster'].map(labels)
 
 # Save the results
@@ -311,4 +284,8 @@ plt.ylabel('Non-Holiday Spending')
 plt.title('Customer Segments Based on Seasonal Behavior')
 plt.legend(title="Segment")
 plt.grid()
-plt.show()
\ No newline at end of file
+plt.show()
+
+# Persist the segments for the next run and the fitted segmentations for assign_segments
+registry.save()
+segment_model.save()
@@ -20,6 +20,10 @@ This notebook focuses on inspecting the **Review Dataset** and transforming it f
 
 
 The goal of this notebook is to clean, process, and structure the review dataset into a form that is suitable for deeper analysis in subsequent notebooks.
+
+For review dumps that do not fit in memory, the same outputs can be produced chunk by chunk with the streaming reader in `preprocessing.py`:
+
+    python src/preprocessing.py ./data/raw/reviews.json --chunk-size 1000
 """
 
 #loading the libraries
@@ -78,41 +82,8 @@ reviews = df[["reviews", "product_id"]]
 reviews
 
 #function to tranform nested review data into a flat dataframe for analysis
-import ast
-
-def transform_reviews(df):
-    # list to store the transformed rows
-    transformed_data = []
-
-    # iterating over each row in the DataFrame
-    for _, row in df.iterrows():
-        product_id = row['product_id']
-        reviews = row['reviews']
-
-        if isinstance(reviews, str):
-            reviews = ast.literal_eval(reviews)
-
-        for review in reviews:
-            # appending a new row for each review dictionary
-            transformed_data.append({
-                "product_id": product_id,
-                "customer_username": review.get("review_posted_by_username", None),
-                "star_ratings": review.get("star_ratings", None),
-                "review_date": review.get("review_date", None),
-                "user_age": review.get("user_age", None),
-                "user_height": review.get("user_height", None),
-                "user_size": review.get("user_size", None),
-                "user_weight": review.get("user_weight", None),
-                "user_body_type": review.get("user_body_type", None),
-                "user_color": review.get("user_color", None),
-                "review_title": review.get("review_title", None),
-                "review_content": review.get("review_text", None),
-            })
-
-    # convert the transformed data into a new DataFrame
-    transformed_df = pd.DataFrame(transformed_data)
-
-    return transformed_df
+#(builds one array per column instead of one dictionary per review, see preprocessing.py)
+from preprocessing import transform_reviews
 
 #transforming the reviews data into structured format and storing it
 final_df = transform_reviews(reviews)
@@ -149,17 +120,7 @@ This function ensures that each customer appears only once by removing duplicate
 
 """
 
-def create_customer_df(df):
-    # selecting relevant columns for customer details
-    customer_columns = [
-        "customer_userid", "user_age", "user_height", "user_size", "user_weight",
-        "user_body_type", "user_color"
-    ]
-
-    # drop duplicates to ensure one row per unique customer_username
-    customer_df = df[customer_columns].drop_duplicates(subset="customer_userid").reset_index(drop=True)
-
-    return customer_df
+from preprocessing import create_customer_df
 
 #extract the unique customer details from the merged DataFrame
 customer_df = create_customer_df(final_final_df)
@@ -172,15 +133,7 @@ The `create_review_df` function extracts review-specific details, such as produc
 This dataframe (`reviews_df`) will be used to to customer reviews analysis
 """
 
-def create_review_df(df):
-  # selecting relevant columns for review details
-  review_columns = [
-      "product_id", "customer_userid", "star_ratings", "review_date", "review_title", "review_content"
-  ]
-
-  review_df = df[review_columns]
-
-  return review_df
+from preprocessing import create_review_df
 
 #extract review-related details from the merged DataFrame
 reviews_df = create_review_df(final_final_df)
@@ -191,7 +144,7 @@ reviews_df.head()
 """### Extracting Order Details
 Below we are extracting relevant order-related data from the `reviews_df` DataFrame, and preparing the order_df for further analysis.
 Paid amount (`paid_amt`) is calculated by applying a random discount (0% to 50%) to the product price.
-Order dates are adjusted by simulating delivery times (adding random days between 2 and 10).
+Order dates are adjusted by simulating delivery times (subtracting random days between 2 and 9).
 The final order_df contains the following columns:
 - `product_id`: Links the order to a specific product.
 - `customer_userid`: Identifies the customer placing the order.
@@ -203,37 +156,10 @@ The final order_df contains the following columns:
 
 """
 
-#select relevant columns for order-related data
-order_df = reviews_df[["product_id", "customer_userid", "review_date"]]
-
-#rename to proper column name
-order_df.rename(columns={'review_date': 'order_date'}, inplace=True)
-
-order_df['order_id'] = [uuid.uuid4() for _ in range(len(order_df))]
-
-#display first few rows of order_df
-order_df.head()
-
-x_df = pd.merge(product_df, order_df, on="product_id")
-
-import random
-
-#Merge the product prices into the order DataFrame
-merged_df = order_df.merge(product_df, on="product_id", how="left")
-
-# Calculate the paid_amt column
-order_df["paid_amt"] = merged_df["product_price"].apply(
-    lambda price: price - (price * random.uniform(0, 0.50)) if pd.notnull(price) else None
-)
-
-#convert the 'order_date' column to datetime format
-order_df['order_date'] = pd.to_datetime(order_df['order_date'])
+from preprocessing import create_order_df
 
-# adjusting the order dates by simulating delivery times
-import numpy as np
-order_df["new_date"] = order_df['order_date'] - pd.to_timedelta(np.random.randint(2, 10, size=len(order_df)), unit='D')
-order_df.drop("order_date", axis=1, inplace=True)
-order_df.rename(columns={"new_date": "order_date"})
+#one order per review with a random discount, delivery time and order id; the seed makes them reproducible
+order_df = create_order_df(reviews_df, product_df, rng=42)
 
 #print order_df
 order_df.head()
@@ -247,13 +173,20 @@ customer_df.head()
 #print reviews_df
 reviews_df.head()
 
-order_df.rename(columns={"new_date": "order_date"}, inplace=True)
+#assigning dense int32 codes to customers and products, and persisting the mapping next to the tables
+import os
+from id_dictionary import add_codes, build_id_dictionaries, save_id_dictionaries
+from storage import DATA_DIR, write_table
 
-#exporting all the final transformed dataframes to csv
+id_dictionaries = build_id_dictionaries(customer_df, product_df)
+os.makedirs(DATA_DIR, exist_ok=True)
+save_id_dictionaries(id_dictionaries, DATA_DIR)
 
-customer_df.to_csv('customer.csv', index=False)
-product_df.to_csv('product.csv', index=False)
-order_df.to_csv('order.csv', index=False)
-reviews_df.to_csv('reviews.csv', index=False)
+#exporting all the final transformed dataframes to ./data/processed as typed parquet tables, plus csv exports
+#the order table is stored partitioned by month of order_date; new orders can be added with storage.append_table
+for name, table in [('customer', customer_df), ('product', product_df), ('order', order_df), ('reviews', reviews_df)]:
+  table = add_codes(table, id_dictionaries)
+  write_table(table, name, DATA_DIR, format='parquet')
+  write_table(table, name, DATA_DIR, format='csv')
 
-print("DataFrames saved to CSV files successfully!")
\ No newline at end of file
+print("DataFrames saved to Parquet and CSV files successfully!")
\ No newline at end of file
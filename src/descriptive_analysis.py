@@ -69,13 +69,37 @@ This combination of datasets forms the foundation for deriving insights into cus
 """
 
 import pandas as pd
-
-customer_df = pd.read_csv('./data/processed/customer.csv')
-total_customers = len(customer_df)
+from storage import read_id_dictionaries, read_table
+from feature_store import FeatureStore
+from category_performance import category_performance
+from profiling import Profiler, profile_table
+from rollups import load_rollups
+from sketches import iqr_bounds, sketch_frame, sketch_iqr_bounds
+
+# readable ids for the integer customer and product codes
+id_dictionaries = read_id_dictionaries()
+
+# every table is read once here; the profiles, sketches, rollups and features below are computed
+# from these frames instead of scanning the stored tables again
+customer_df = read_table('customer')
+product_df = read_table('product')
+order_df = read_table('order')
+reviews_df = read_table('reviews')
+tables = {'customer': customer_df, 'product': product_df, 'order': order_df, 'reviews': reviews_df}
+
+# per-customer features, computed once and cached for every report
+feature_store = FeatureStore()
+# counts, nulls, cardinality, statistics and group aggregates per table, computed once and cached
+profiler = Profiler()
+# orders, revenue and reviews per day, week and month and category, built once and cached
+rollups = load_rollups(tables=tables)
+
+customer_profile = profiler.profile('customer', customer_df)
+total_customers = customer_profile.rows
 print(f"Total customers: {total_customers}")
 
 #Check for unique values in each column
-unique_values = customer_df.nunique()
+unique_values = customer_profile.nunique
 print("\nUnique values in each column:")
 print(unique_values)
 
@@ -87,7 +111,7 @@ This section examines customer preferences for colors:
 """
 
 #Color preferences analysis
-color_preferences = customer_df['user_color'].value_counts()
+color_preferences = customer_profile.value_counts['user_color']
 print("\nColor Preferences:")
 print(color_preferences)
 
@@ -99,7 +123,7 @@ This section analyzes the distribution of clothing sizes preferred by customers:
 """
 
 #User size distribution
-size_distribution = customer_df['user_size'].value_counts()
+size_distribution = customer_profile.value_counts['user_size']
 print("\nUser Size Distribution:")
 print(size_distribution)
 
@@ -111,7 +135,7 @@ This section reviews the distribution of customer body types:
 """
 
 #Body type distribution
-body_type_distribution = customer_df['user_body_type'].value_counts()
+body_type_distribution = customer_profile.value_counts['user_body_type']
 print("\nUser Body Type Distribution:")
 print(body_type_distribution)
 
@@ -130,7 +154,7 @@ import plotly.graph_objects as go
 customer_df['user_age'] = pd.to_numeric(customer_df['user_age'], errors='coerce')
 
 # Summary Statistics for 'user_age'
-age_stats = customer_df['user_age'].describe()
+age_stats = customer_profile.describe('user_age')
 print("Summary Statistics for 'user_age':")
 print(age_stats)
 
@@ -164,11 +188,12 @@ def height_to_inches(height):
     return None
 
 customer_df['user_height'] = customer_df['user_height'].apply(height_to_inches)
-customer_df['user_weight'] = pd.to_numeric(customer_df['user_weight'].str.replace(' lbs.', ''), errors='coerce')
+customer_df['user_weight'] = pd.to_numeric(customer_df['user_weight'].str.replace(' lbs.', ''), errors='coerce').astype('float64')
 
 # Summary Statistics for 'user_height' and 'user_weight'
-height_stats = customer_df['user_height'].describe()
-weight_stats = customer_df['user_weight'].describe()
+measurement_profile = profile_table(customer_df[['user_height', 'user_weight']])
+height_stats = measurement_profile.describe('user_height')
+weight_stats = measurement_profile.describe('user_weight')
 print("Summary Statistics for 'user_height':")
 print(height_stats)
 print("\nSummary Statistics for 'user_weight':")
@@ -203,7 +228,7 @@ weight_hist_fig.show()
 """
 
 # Visualize User Size Distribution as a Bar Chart
-size_distribution = customer_df['user_size'].value_counts().reset_index()
+size_distribution = customer_profile.value_counts['user_size'].reset_index()
 size_distribution.columns = ['user_size', 'count']
 
 
@@ -228,7 +253,7 @@ size_bar_fig.show()
 """
 
 # Visualize User Size Distribution
-size_distribution = customer_df['user_size'].value_counts().reset_index()
+size_distribution = customer_profile.value_counts['user_size'].reset_index()
 size_distribution.columns = ['user_size', 'count']
 filtered_size_distribution = size_distribution[size_distribution['count'] > 50]
 
@@ -254,7 +279,7 @@ size_bar_fig.show()
 """
 
 # Grouping by 'user_body_type'
-body_type_grouped = customer_df.groupby('user_body_type')[['user_height', 'user_weight']].mean().reset_index()
+body_type_grouped = customer_df.groupby('user_body_type', observed=True)[['user_height', 'user_weight']].mean().reset_index()
 body_type_trend_fig = px.bar(
     body_type_grouped,
     x='user_body_type',
@@ -267,26 +292,26 @@ body_type_trend_fig = px.bar(
 body_type_trend_fig.update_layout(yaxis_title='Average Measurement', xaxis_title='Body Type')
 body_type_trend_fig.show()
 
-# Load the product dataset
-product_df = pd.read_csv('./data/processed/product.csv')
+# Profile the product dataset
+product_profile = profiler.profile('product', product_df)
 
 # Total number of products
-total_products = len(product_df)
+total_products = product_profile.rows
 print(f"Total products: {total_products}")
 
 # Missing Values
-missing_values = product_df.isnull().sum()
+missing_values = product_profile.nulls
 print("\nMissing Values in Each Column:")
 print(missing_values)
 
 # Unique Values
-unique_values = product_df.nunique()
+unique_values = product_profile.nunique
 print("\nUnique Values in Each Column:")
 print(unique_values)
 
 # Price Analysis
 # Summary Statistics for 'product_price'
-price_stats = product_df['product_price'].describe()
+price_stats = product_profile.describe('product_price')
 print("Summary Statistics for 'product_price':")
 print(price_stats)
 
@@ -303,7 +328,7 @@ price_hist_fig.update_layout(xaxis_title='Product Price', yaxis_title='Count')
 price_hist_fig.show()
 
 # Category Distribution
-category_distribution = product_df['product_category'].value_counts().reset_index()
+category_distribution = product_profile.groups['by_category']['count'].sort_values(ascending=False).reset_index()
 category_distribution.columns = ['product_category', 'count']
 
 
@@ -322,7 +347,7 @@ category_bar_fig.show()
 import plotly.express as px
 
 # Calculate Category Distribution
-category_distribution = product_df['product_category'].value_counts().reset_index()
+category_distribution = product_profile.groups['by_category']['count'].sort_values(ascending=False).reset_index()
 category_distribution.columns = ['product_category', 'count']
 
 # Filter categories with more than 10 counts
@@ -341,7 +366,7 @@ category_bar_fig.update_layout(xaxis_title='Product Category', yaxis_title='Coun
 category_bar_fig.show()
 
 # Average Price by Category
-avg_price_by_category = product_df.groupby('product_category')['product_price'].mean().reset_index()
+avg_price_by_category = product_profile.groups['by_category']['product_price_mean'].rename('product_price').reset_index()
 
 # Visualize Average Price by Category
 avg_price_fig = px.bar(
@@ -365,32 +390,46 @@ print(most_expensive)
 print("\nTop 5 Least Expensive Products:")
 print(least_expensive)
 
-# Load the order dataset
-order_df = pd.read_csv('./data/processed/order.csv')
+# Profile the order dataset
+order_profile = profiler.profile('order', order_df)
 
 # Total number of orders
-total_orders = len(order_df)
+total_orders = order_profile.rows
 print(f"Total orders: {total_orders}")
 
 # Missing Values
-missing_values = order_df.isnull().sum()
+missing_values = order_profile.nulls
 print("\nMissing Values in Each Column:")
 print(missing_values)
 
 # Unique Values
-unique_values = order_df.nunique()
+unique_values = order_profile.nunique
 print("\nUnique Values in Each Column:")
 print(unique_values)
 
 # Paid Amount Analysis
 # Summary Statistics for 'paid_amt'
-paid_amt_stats = order_df['paid_amt'].describe()
+paid_amt_stats = order_profile.describe('paid_amt')
 print("\nSummary Statistics for 'paid_amt':")
 print(paid_amt_stats)
 
-# Visualize Paid Amount Distribution
+# Outlier bounds and distinct customers and products from one batched pass over the loaded order table
+order_sketches = sketch_frame(order_df, ['paid_amt', 'customer_code', 'product_code'])
+paid_amt_bounds = sketch_iqr_bounds(order_sketches['paid_amt'].quantiles)
+print(f"\nApproximate 'paid_amt' outlier bounds: {paid_amt_bounds[0]:.2f} to {paid_amt_bounds[1]:.2f}")
+print(f"Approximate distinct customers: {order_sketches['customer_code'].distinct.count()}")
+print(f"Approximate distinct products: {order_sketches['product_code'].distinct.count()}")
+
+def remove_outliers_iqr(data, column, bounds=None):
+    # bounds from a quantile sketch for large tables, exact quantiles of the column otherwise
+    if bounds is None:
+        bounds = iqr_bounds(data[column].quantile(0.15), data[column].quantile(0.80))
+    lower_bound, upper_bound = bounds
+    return data[(data[column] >= lower_bound) & (data[column] <= upper_bound)]
+
+# Visualize Paid Amount Distribution without the outliers, filtered with the sketch bounds
 paid_amt_hist_fig = px.histogram(
-    order_df,
+    remove_outliers_iqr(order_df, 'paid_amt', paid_amt_bounds),
     x='paid_amt',
     title='Paid Amount Distribution',
     labels={'paid_amt': 'Paid Amount'},
@@ -401,17 +440,11 @@ paid_amt_hist_fig.update_layout(xaxis_title='Paid Amount', yaxis_title='Count')
 paid_amt_hist_fig.show()
 
 # Order Volume Trends Over Time
-# Convert 'order_date' to datetime
-order_df['order_date'] = pd.to_datetime(order_df['order_date'], errors='coerce')
 
-# Group by month and year for trend analysis
-order_df['year_month'] = order_df['order_date'].dt.to_period('M').astype(str)
-monthly_order_trends = order_df.groupby('year_month').size().reset_index(name='order_count')
-
-filtered_trends = monthly_order_trends[
-    (monthly_order_trends['year_month'] >= '2023-01') &
-    (monthly_order_trends['year_month'] <= '2024-01')
-]
+# Monthly rollup for Jan 2023 - Jan 2024, read from the precomputed cube
+monthly_orders = rollups.query('month', '2023-01', '2024-01', metrics=['order_count', 'revenue'])
+monthly_orders.index = monthly_orders.index.astype(str).rename('year_month')
+filtered_trends = monthly_orders['order_count'].reset_index()
 
 # Visualize Order Trends Over Time
 order_trends_time_fig = px.line(
@@ -426,11 +459,7 @@ order_trends_time_fig.update_layout(xaxis_title='Year-Month', yaxis_title='Order
 order_trends_time_fig.show()
 
 # Revenue Trends Over Time
-monthly_revenue_trends = order_df.groupby('year_month')['paid_amt'].sum().reset_index()
-filtered_trends = monthly_revenue_trends[
-    (monthly_revenue_trends['year_month'] >= '2023-01') &
-    (monthly_revenue_trends['year_month'] <= '2024-01')
-]
+filtered_trends = monthly_orders['revenue'].rename('paid_amt').reset_index()
 
 # Visualize Revenue Trends Over Time
 revenue_trends_fig = px.line(
@@ -446,9 +475,8 @@ revenue_trends_fig.show()
 
 # Customer Spending Analysis
 
-avg_spending_by_customer = order_df.groupby('customer_userid')['paid_amt'].sum()/order_df.groupby('customer_userid')['paid_amt'].count()
-avg_spending_by_customer = avg_spending_by_customer.reset_index()
-avg_spending_by_customer.columns = ['customer_userid', 'avg_spending']
+avg_spending_by_customer = feature_store.customer_features(tables=tables)[['customer_code', 'avg_spending']].copy()
+avg_spending_by_customer.insert(0, 'customer_userid', id_dictionaries['customer'].decode(avg_spending_by_customer['customer_code']))
 
 # Visualize Top Customers by Spending
 top_customers = avg_spending_by_customer.nlargest(20, 'avg_spending')
@@ -463,26 +491,21 @@ top_customers_fig = px.bar(
 top_customers_fig.update_layout(xaxis_title='Customer UserID', yaxis_title='Total Spent')
 top_customers_fig.show()
 
-avg_spending_by_customer = order_df.groupby('customer_userid')['paid_amt'].sum()/order_df.groupby('customer_userid')['paid_amt'].count()
-avg_spending_by_customer = avg_spending_by_customer.reset_index()
-avg_spending_by_customer.columns = ['customer_userid', 'avg_spending']
 avg_spending_by_customer.sort_values(by='avg_spending', ascending=False)
 
 """**Product Popularity Bar Chart**:
     - Shows the most purchased products, emphasizing high-demand items.
 """
 
-product_df = pd.read_csv('./data/processed/product.csv')
-
-# Calculate total revenue for each product based on product_id
-product_revenue = order_df.groupby('product_id')['paid_amt'].sum().reset_index()
-product_revenue.columns = ['product_id', 'total_revenue']
+# Calculate total revenue for each product based on product_code
+product_revenue = order_profile.groups['by_product']['paid_amt_sum'].reset_index()
+product_revenue.columns = ['product_code', 'total_revenue']
 
 # Get the top 20 products by revenue
 top_products = product_revenue.nlargest(20, 'total_revenue')
 
 # Merge with product_df to get product_name
-top_products = top_products.merge(product_df[['product_id', 'product_name']], on='product_id', how='left')
+top_products = top_products.merge(product_df[['product_code', 'product_name']], on='product_code', how='left')
 
 # Visualize Top 20 Products by Revenue with Product Names
 top_products_fig = px.bar(
@@ -502,10 +525,10 @@ top_products_fig.show()
 """
 
 # Merge order_df with product_df to include product_category
-merged_df = order_df.merge(product_df[['product_id', 'product_category']], on='product_id', how='left')
+merged_df = order_df.merge(product_df[['product_code', 'product_category']], on='product_code', how='left')
 
 # Calculate total revenue for each category
-top_selling_categories = merged_df.groupby('product_category')['paid_amt'].sum().reset_index()
+top_selling_categories = merged_df.groupby('product_category', observed=True)['paid_amt'].sum().reset_index()
 top_selling_categories.columns = ['product_category', 'total_revenue']
 
 # Sort and get top 10 categories
@@ -523,21 +546,21 @@ fig = px.bar(
 fig.update_layout(xaxis_title='Product Category', yaxis_title='Total Revenue')
 fig.show()
 
-# Load the reviews dataset
-reviews_df = pd.read_csv('./data/processed/reviews.csv')
+# Profile the reviews dataset
+reviews_profile = profiler.profile('reviews', reviews_df)
 
 # Initial Analysis
 # Total number of reviews
-total_reviews = len(reviews_df)
+total_reviews = reviews_profile.rows
 print(f"Total reviews: {total_reviews}")
 
 # Missing Values
-missing_values = reviews_df.isnull().sum()
+missing_values = reviews_profile.nulls
 print("\nMissing Values in Each Column:")
 print(missing_values)
 
 # Unique Values
-unique_values = reviews_df.nunique()
+unique_values = reviews_profile.nunique
 print("\nUnique Values in Each Column:")
 print(unique_values)
 
@@ -548,12 +571,12 @@ print(unique_values)
 
 # Star Ratings Analysis
 # Summary Statistics for 'star_ratings'
-star_ratings_stats = reviews_df['star_ratings'].describe()
+star_ratings_stats = reviews_profile.describe('star_ratings')
 print("\nSummary Statistics for 'star_ratings':")
 print(star_ratings_stats)
 
 # Visualize Star Ratings as Pie Chart
-star_ratings_pie_data = reviews_df['star_ratings'].value_counts().reset_index()
+star_ratings_pie_data = reviews_profile.value_counts['star_ratings'].reset_index()
 star_ratings_pie_data.columns = ['star_rating', 'count']
 
 star_ratings_pie_fig = px.pie(
@@ -570,17 +593,10 @@ star_ratings_pie_fig.show()
 
 """
 
-reviews_df['review_date'] = pd.to_datetime(reviews_df['review_date'], errors='coerce')
-
-# Group by month and year for trend analysis
-reviews_df['year_month'] = reviews_df['review_date'].dt.to_period('M').astype(str)
-monthly_review_trends = reviews_df.groupby('year_month').size().reset_index(name='review_count')
-
-# Filter data for the period Jan 2023 - Jan 2024
-filtered_review_trends = monthly_review_trends[
-    (monthly_review_trends['year_month'] >= '2023-01') &
-    (monthly_review_trends['year_month'] <= '2024-01')
-]
+# Monthly review counts for Jan 2023 - Jan 2024, read from the precomputed cube
+monthly_reviews = rollups.query('month', '2023-01', '2024-01', metrics=['review_count'])
+monthly_reviews.index = monthly_reviews.index.astype(str).rename('year_month')
+filtered_review_trends = monthly_reviews['review_count'].reset_index()
 
 # Visualize Review Trends Over Time
 review_trends_time_fig = px.line(
@@ -600,11 +616,11 @@ review_trends_time_fig.show()
 """
 
 # Merge datasets
-merged_df = pd.merge(order_df, reviews_df, on=['product_id', 'customer_userid'], how='inner')
-merged_df = pd.merge(merged_df, product_df[['product_id', 'product_name', 'product_category']], on='product_id', how='left')
+merged_df = pd.merge(order_df, reviews_df.drop(columns=['product_id', 'customer_userid']), on=['product_code', 'customer_code'], how='inner')
+merged_df = pd.merge(merged_df, product_df[['product_code', 'product_name', 'product_category']], on='product_code', how='left')
 
 # Calculate average star ratings and total revenue per product
-product_performance = merged_df.groupby('product_id').agg({
+product_performance = merged_df.groupby('product_code').agg({
     'paid_amt': 'sum',
     'star_ratings': 'mean',
     'product_name': 'first',  # Include product_name
@@ -612,7 +628,7 @@ product_performance = merged_df.groupby('product_id').agg({
 }).reset_index()
 
 # Rename columns
-product_performance.columns = ['product_id', 'total_revenue', 'avg_star_rating', 'product_name', 'product_category']
+product_performance.columns = ['product_code', 'total_revenue', 'avg_star_rating', 'product_name', 'product_category']
 
 # Visualize top-performing products
 top_products = product_performance.nlargest(10, 'total_revenue')
@@ -628,21 +644,12 @@ fig = px.bar(
 fig.update_layout(xaxis_title='Product Name', yaxis_title='Total Revenue')
 fig.show()
 
-# Merge datasets
-category_analysis = pd.merge(order_df, reviews_df, on='product_id', how='inner')
-category_analysis = pd.merge(category_analysis, product_df, on='product_id', how='left')
-
-# Calculate metrics for each category
-category_performance = category_analysis.groupby('product_category').agg({
-    'paid_amt': 'sum',
-    'star_ratings': 'mean',
-    'review_content': 'count'
-}).reset_index()
-category_performance.columns = ['product_category', 'total_revenue', 'avg_star_rating', 'total_reviews']
+# Calculate metrics for each category from per-product order and review totals
+category_summary = category_performance(order_df, reviews_df, product_df)
 
 # Visualize Category Performance
 fig = px.bar(
-    category_performance,
+    category_summary,
     x='product_category',
     y='total_revenue',
     color='avg_star_rating',
@@ -661,14 +668,6 @@ for column in columns_to_impute:
 
 customer_df
 
-def remove_outliers_iqr(data, column):
-    q1 = data[column].quantile(0.15)
-    q3 = data[column].quantile(0.80)
-    iqr = q3 - q1
-    lower_bound = q1 - 1.5 * iqr
-    upper_bound = q3 + 1.5 * iqr
-    return data[(data[column] >= lower_bound) & (data[column] <= upper_bound)]
-
 customer_df = remove_outliers_iqr(customer_df, 'user_age')
 
 # Visualize Age Distribution using a Histogram
@@ -683,14 +682,6 @@ hist_fig = px.histogram(
 hist_fig.update_layout(xaxis_title='Age', yaxis_title='Count')
 hist_fig.show()
 
-def remove_outliers_iqr(data, column):
-    q1 = data[column].quantile(0.15)
-    q3 = data[column].quantile(0.80)
-    iqr = q3 - q1
-    lower_bound = q1 - 1.5 * iqr
-    upper_bound = q3 + 1.5 * iqr
-    return data[(data[column] >= lower_bound) & (data[column] <= upper_bound)]
-
 customer_df = remove_outliers_iqr(customer_df, 'user_weight')
 
 # Visualize Weight Distribution
@@ -705,14 +696,6 @@ weight_hist_fig = px.histogram(
 weight_hist_fig.update_layout(xaxis_title='Weight (in lbs)', yaxis_title='Count')
 weight_hist_fig.show()
 
-def remove_outliers_iqr(data, column):
-    q1 = data[column].quantile(0.15)
-    q3 = data[column].quantile(0.80)
-    iqr = q3 - q1
-    lower_bound = q1 - 1.5 * iqr
-    upper_bound = q3 + 1.5 * iqr
-    return data[(data[column] >= lower_bound) & (data[column] <= upper_bound)]
-
 customer_df = remove_outliers_iqr(customer_df, 'user_height')
 
 # Visualize Height Distribution
@@ -742,7 +725,7 @@ price_hist_fig = px.histogram(
 price_hist_fig.update_layout(xaxis_title='Product Price', yaxis_title='Count')
 price_hist_fig.show()
 
-order_df = pd.read_csv('./data/processed/order.csv')
+order_df = order_df.copy()
 
 order_df['paid_amt'] = np.log10(order_df['paid_amt'])
 
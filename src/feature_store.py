@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Cached per-customer features.
+
+`FeatureStore.customer_features()` computes every per-customer feature
+(totals, order counts, average spending, seasonal splits and per-category
+order counts) in one pass over the order table and caches the result as
+Parquet, keyed by the version of the input tables. The segmentations in
+`clustering.py` and the customer reports in `descriptive_analysis.py` read
+from it instead of regrouping the orders.
+
+The data version is a hash of the size and modification time of the stored
+`order` and `product` tables, so rewriting them invalidates the cache. When
+the orders are stored in monthly partitions, features are also cached per
+partition file and combined, so after an append only the new files are read.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from features import HOLIDAY_MONTHS, category_counts, combine_features, customer_features
+from storage import DATA_DIR, is_partitioned, read_table, table_files
+
+# bump when customer_features changes its output
+FEATURES_VERSION = 1
+
+FEATURE_TABLES = ('order', 'product')
+
+ORDER_COLUMNS = ['customer_code', 'product_code', 'order_id', 'paid_amt', 'order_date']
+
+
+def files_version(paths):
+    # hash of the files' paths, sizes and mtimes
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()[:16]
+
+
+def data_version(directory=DATA_DIR, tables=FEATURE_TABLES):
+    # hash of the stored tables' files: partitions, Parquet or the CSV fallback
+    return files_version([path for name in tables for path in table_files(name, directory)])
+
+
+def _write_features(features, path):
+    # written under a temporary name and renamed, so stages running in parallel never read a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    features.to_parquet(temporary, index=False)
+    os.replace(temporary, path)
+
+
+class FeatureStore:
+    def __init__(self, directory=DATA_DIR, cache_dir=None):
+        self.directory = directory
+        self.cache_dir = cache_dir or os.path.join(directory, 'features')
+        self._cache = {}
+
+    def _options(self, holidays):
+        options = json.dumps({'features': FEATURES_VERSION, 'holidays': [str(h) for h in holidays]})
+        return hashlib.sha1(options.encode()).hexdigest()[:8]
+
+    def _key(self, holidays):
+        return f"{data_version(self.directory)}-{self._options(holidays)}"
+
+    def _partition_features(self, path, product_df, holidays):
+        # features of one order partition file, cached by the file and the product table
+        version = files_version([path] + table_files('product', self.directory))
+        cached = os.path.join(self.cache_dir, 'partitions', f'{version}-{self._options(holidays)}.parquet')
+        if os.path.exists(cached):
+            return pd.read_parquet(cached)
+        features = customer_features(pd.read_parquet(path, columns=ORDER_COLUMNS), product_df, holidays)
+        _write_features(features, cached)
+        return features
+
+    def path(self, holidays=HOLIDAY_MONTHS, tables=None):
+        # cached Parquet file for the current data version, built if missing; tables maps 'order' and
+        # 'product' to the stored tables when the caller has them in memory already
+        path = os.path.join(self.cache_dir, f'customer_features-{self._key(holidays)}.parquet')
+        if not os.path.exists(path):
+            tables = tables or {}
+            if 'product' in tables:
+                product_df = tables['product'][['product_code', 'product_category']]
+            else:
+                product_df = read_table('product', self.directory, ['product_code', 'product_category'])
+            if is_partitioned('order', self.directory):
+                # partitions are read one by one, only those without cached features
+                features = combine_features([self._partition_features(file, product_df, holidays)
+                                             for file in table_files('order', self.directory)])
+            elif 'order' in tables:
+                features = customer_features(tables['order'][ORDER_COLUMNS], product_df, holidays)
+            else:
+                features = customer_features(read_table('order', self.directory, ORDER_COLUMNS), product_df, holidays)
+            _write_features(features, path)
+        return path
+
+    def customer_features(self, holidays=HOLIDAY_MONTHS, tables=None):
+        # holidays must be months or dates here, so the cache key can be derived from it
+        key = self._key(holidays)
+        if key not in self._cache:
+            self._cache[key] = pd.read_parquet(self.path(holidays, tables))
+        return self._cache[key]
+
+    def category_counts(self, holidays=HOLIDAY_MONTHS):
+        return category_counts(self.customer_features(holidays))
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Per-customer features built from the order table.
+
+Features are computed with masked column sums and one `np.bincount` pass per
+column over the integer customer codes, instead of per-group Python lambdas.
+`customer_features` builds every per-customer feature the segmentations and
+reports use in one pass; `feature_store.py` caches its result.
+`combine_features` merges the features of separate parts of the orders (such
+as the monthly order partitions) into those of all of them.
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import AbstractHolidayCalendar
+
+# November and December, as in the seasonal segmentation
+HOLIDAY_MONTHS = (11, 12)
+
+# per-customer sums and counts, the other features are ratios of them
+ADDITIVE_FEATURES = ('total_spending', 'holiday_spending', 'non_holiday_spending', 'order_count')
+
+# prefix of the per-category order count columns in customer_features
+CATEGORY_PREFIX = 'category:'
+
+
+def holiday_mask(order_dates, holidays=HOLIDAY_MONTHS):
+    # True for orders that fall in the holiday calendar.
+    # `holidays` is a collection of months (1-12), a collection of dates,
+    # or a pandas holiday calendar such as USFederalHolidayCalendar().
+    order_dates = pd.to_datetime(pd.Series(order_dates))
+    if isinstance(holidays, AbstractHolidayCalendar):
+        holidays = holidays.holidays(order_dates.min(), order_dates.max())
+    holidays = list(holidays)
+    if all(isinstance(h, (int, np.integer)) for h in holidays):
+        return order_dates.dt.month.isin(holidays).to_numpy()
+    return order_dates.dt.normalize().isin(pd.to_datetime(holidays)).to_numpy()
+
+
+def _customer_codes(order_df, customer_column):
+    # dense integer codes; id-dictionary codes are used as they are
+    values = order_df[customer_column]
+    if pd.api.types.is_integer_dtype(values) and (values.min() >= 0 if len(values) else True):
+        return values.to_numpy(), None
+    return pd.factorize(values)
+
+
+def seasonal_features(order_df, holidays=HOLIDAY_MONTHS, customer_column='customer_code'):
+    codes, uniques = _customer_codes(order_df, customer_column)
+    n_customers = codes.max() + 1 if len(codes) else 0
+    paid = np.nan_to_num(order_df['paid_amt'].to_numpy(dtype=np.float64))
+    is_holiday = holiday_mask(order_df['order_date'], holidays)
+
+    # one weighted bincount per feature
+    order_count = np.bincount(codes, weights=order_df['order_id'].notna().to_numpy(), minlength=n_customers)
+    total_spending = np.bincount(codes, weights=paid, minlength=n_customers)
+    holiday_spending = np.bincount(codes, weights=paid * is_holiday, minlength=n_customers)
+    non_holiday_spending = np.bincount(codes, weights=paid * ~is_holiday, minlength=n_customers)
+
+    # only customers that placed orders, like a groupby
+    present = np.bincount(codes, minlength=n_customers) > 0
+    customer_seasonal = pd.DataFrame({
+        customer_column: np.flatnonzero(present) if uniques is None else uniques[present],
+        'total_spending': total_spending[present],
+        'holiday_spending': holiday_spending[present],
+        'non_holiday_spending': non_holiday_spending[present],
+        'order_count': order_count[present].astype(np.int64),
+    })
+
+    return _add_ratios(customer_seasonal)
+
+
+def _add_ratios(customer_seasonal):
+    # holiday_ratio emphasizes holiday spending, 0 for customers without spending
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = customer_seasonal['holiday_spending'] / customer_seasonal['total_spending']
+    customer_seasonal['holiday_ratio'] = ratio.replace([np.inf, -np.inf], np.nan).fillna(0)
+    # re-weighted holiday spending, more important in clustering
+    customer_seasonal['weighted_holiday_spending'] = customer_seasonal['holiday_spending'] * 2
+    return customer_seasonal
+
+
+def _add_avg_spending(features):
+    features['avg_spending'] = features['total_spending'] / features['order_count'].replace(0, np.nan)
+    return features
+
+
+def customer_features(order_df, product_df=None, holidays=HOLIDAY_MONTHS, customer_column='customer_code'):
+    # seasonal features, average spending and, with product_df, order counts per product category
+    customer_seasonal = _add_avg_spending(seasonal_features(order_df, holidays, customer_column))
+    if product_df is None:
+        return customer_seasonal
+
+    codes, uniques = _customer_codes(order_df, customer_column)
+    n_customers = codes.max() + 1 if len(codes) else 0
+
+    # category code per order through a product_code -> category lookup, -1 for unknown products
+    categories = product_df['product_category'].astype('category')
+    category_names = categories.cat.categories
+    lookup = np.full(int(product_df['product_code'].max()) + 1 if len(product_df) else 0, -1, dtype=np.int64)
+    lookup[product_df['product_code'].to_numpy()] = categories.cat.codes.to_numpy()
+    product_codes = order_df['product_code'].to_numpy()
+    known = (product_codes >= 0) & (product_codes < len(lookup))
+    order_categories = np.full(len(order_df), -1, dtype=np.int64)
+    order_categories[known] = lookup[product_codes[known]]
+    known = order_categories >= 0
+
+    # one bincount over (customer, category) pairs
+    n_categories = len(category_names)
+    counts = np.bincount(
+        codes[known] * n_categories + order_categories[known], minlength=n_customers * n_categories
+    ).reshape(n_customers, n_categories)
+
+    present = np.bincount(codes, minlength=n_customers) > 0
+    counts = pd.DataFrame(
+        counts[present], columns=[CATEGORY_PREFIX + str(name) for name in category_names]
+    )
+    return pd.concat([customer_seasonal, counts], axis=1)
+
+
+def combine_features(parts, customer_column='customer_code'):
+    # customer_features of the concatenated orders from customer_features of each part of them:
+    # the sums and counts are added up per customer and the ratios recomputed
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return pd.DataFrame(columns=[customer_column])
+    columns = list(parts[0].columns)
+    summed = [c for c in columns if c in ADDITIVE_FEATURES or c.startswith(CATEGORY_PREFIX)]
+    combined = pd.concat(parts, ignore_index=True)
+    codes, uniques = _customer_codes(combined, customer_column)
+    n_customers = codes.max() + 1
+
+    # one bincount per summed column, like the features themselves
+    present = np.bincount(codes, minlength=n_customers) > 0
+    features = pd.DataFrame({customer_column: np.flatnonzero(present) if uniques is None else uniques[present]})
+    for column in summed:
+        total = np.bincount(codes, weights=combined[column].to_numpy(dtype=np.float64), minlength=n_customers)
+        dtype = combined[column].dtype
+        features[column] = total[present].astype(dtype) if pd.api.types.is_integer_dtype(dtype) else total[present]
+    features = _add_ratios(features)
+    if 'avg_spending' in columns:
+        features = _add_avg_spending(features)
+    return features[columns]
+
+
+def category_counts(features, customer_column='customer_code'):
+    # customer x product category order counts, for customers with categorized orders
+    columns = [c for c in features.columns if c.startswith(CATEGORY_PREFIX)]
+    counts = features.set_index(customer_column)[columns]
+    counts.columns = pd.Index([c[len(CATEGORY_PREFIX):] for c in columns], name='product_category')
+    return counts[counts.sum(axis=1) > 0]
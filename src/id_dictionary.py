@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Dense integer codes for customer and product ids.
+
+`product_id` (a UUID string) and `customer_userid` (`"user_N"`) are mapped to
+dense int32 codes once, during preprocessing, and the mapping is persisted
+next to the processed tables. Every table then carries `customer_code` /
+`product_code` columns, so merges, groupbys and matrices work on integers,
+and `decode` recovers the readable ids for output.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# id column -> code column
+CODE_COLUMNS = {
+    'customer_userid': 'customer_code',
+    'product_id': 'product_code',
+}
+
+# dictionary name -> (id column, table that holds every id)
+DICTIONARIES = {
+    'customer': ('customer_userid', 'customer'),
+    'product': ('product_id', 'product'),
+}
+
+
+class IdDictionary:
+    def __init__(self, ids):
+        self.ids = pd.Index(ids, dtype=object).astype(str)
+        if not self.ids.is_unique:
+            raise ValueError("Ids in an IdDictionary must be unique.")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, values):
+        # int32 code per value, -1 for ids that are not in the dictionary
+        return self.ids.get_indexer(pd.Index(values, dtype=object).astype(str)).astype(np.int32)
+
+    def decode(self, codes):
+        return self.ids.to_numpy()[np.asarray(codes)]
+
+    def extend(self, values):
+        # new ids get the next codes, existing codes never change
+        new_ids = pd.Index(pd.unique(pd.Index(values, dtype=object).astype(str))).difference(self.ids, sort=False)
+        self.ids = self.ids.append(new_ids)
+        return self
+
+    def save(self, path):
+        pd.DataFrame({'code': np.arange(len(self.ids), dtype=np.int32), 'id': self.ids}).to_parquet(path, index=False)
+
+    @classmethod
+    def load(cls, path):
+        mapping = pd.read_parquet(path).sort_values('code')
+        return cls(mapping['id'])
+
+
+def dictionary_path(name, directory):
+    return os.path.join(directory, f'{name}_ids.parquet')
+
+
+def build_id_dictionaries(customer_df, product_df):
+    # codes follow the order of the customer and product tables
+    return {
+        'customer': IdDictionary(customer_df['customer_userid']),
+        'product': IdDictionary(product_df['product_id']),
+    }
+
+
+def save_id_dictionaries(dictionaries, directory='.'):
+    os.makedirs(directory, exist_ok=True)
+    for name, dictionary in dictionaries.items():
+        dictionary.save(dictionary_path(name, directory))
+
+
+def add_codes(df, dictionaries):
+    # int32 code column next to every id column the table has
+    df = df.copy()
+    for name, (id_column, _) in DICTIONARIES.items():
+        if id_column in df.columns:
+            df[CODE_COLUMNS[id_column]] = dictionaries[name].encode(df[id_column])
+    return df
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Load generator for `recommendation_service.py`.
+
+Opens concurrent keep-alive connections, sends `/recommend` requests for
+random customers of the saved model and reports client-side latency and
+throughput next to the service's own `/metrics`.
+
+    python src/recommendation_service.py --model recommender_model &
+    python src/load_generator.py --model recommender_model --requests 20000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+
+
+async def _request(reader, writer, target):
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+    await writer.drain()
+    await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return json.loads(await reader.readexactly(length))
+
+
+async def _client(host, port, targets, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    for target in targets:
+        start = time.perf_counter()
+        await _request(reader, writer, target)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def run_load(user_ids, host='127.0.0.1', port=8080, n_requests=10000, concurrency=64, top_n=5, seed=42):
+    rng = np.random.default_rng(seed)
+    users = rng.choice(np.asarray(user_ids), n_requests)
+    targets = [f'/recommend?{urlencode({"customer_userid": user, "top_n": top_n})}' for user in users]
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, targets[i::concurrency], latencies) for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    server_metrics = await _request(reader, writer, '/metrics')
+    writer.close()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'throughput_rps': n_requests / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'server': server_metrics,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send concurrent requests to the recommendation service.')
+    parser.add_argument('--model', default='recommender_model')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--top-n', type=int, default=5)
+    args = parser.parse_args()
+
+    # customer ids straight from the saved model
+    user_ids = np.load(f'{args.model}/user_ids.npy', mmap_mode='r')
+    report = asyncio.run(run_load(user_ids, args.host, args.port, args.requests, args.concurrency, args.top_n))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Neighbour-search backends for the recommender.
+
+Every backend works on the scaled interaction matrix produced by
+`recommender.scaled_space`: the normalized row of user i is
+`scaled[i] - offset`, and similarity is the cosine between normalized rows.
+
+- `ExactNeighbors`: brute force over blocks of users, the reference result.
+- `IVFNeighbors`: inverted-file index. Users are embedded with a truncated
+  SVD of the scaled matrix and grouped into `n_lists` cells by a spherical
+  k-means coarse quantizer. A query only scores the users in the `n_probe`
+  cells closest to its own cell, with the exact similarity. Raising
+  `n_probe` trades latency for recall (`n_probe == n_lists` is exact).
+
+Both expose `fit(scaled, offset)`, `update(scaled, offset, rows)` for
+incremental refreshes, and `query(rows, k)`, which returns the
+neighbour indices and similarities of `rows`, best first. Rows with fewer
+than k candidates are padded with zero-weight entries pointing at the user
+itself.
+"""
+
+import numpy as np
+from scipy.sparse.linalg import svds
+
+
+def centered_similarity(scaled, offset, rows, cols=None):
+    # cosine similarity of normalized rows `rows` against `cols` (all users by default)
+    cols = np.arange(scaled.shape[0]) if cols is None else cols
+    row_shift = scaled[rows] @ offset
+    col_shift = scaled[cols] @ offset
+    offset_sq = offset @ offset
+
+    dots = (scaled[rows] @ scaled[cols].T).toarray()
+    dots -= row_shift[:, None]
+    dots -= col_shift[None, :]
+    dots += offset_sq
+
+    return dots / _norms(scaled, offset, rows, row_shift)[:, None] / _norms(scaled, offset, cols, col_shift)[None, :]
+
+
+def _norms(scaled, offset, rows, shift):
+    norms = np.asarray(scaled[rows].multiply(scaled[rows]).sum(axis=1)).ravel()
+    norms = np.sqrt(np.maximum(norms - 2 * shift + offset @ offset, 0))
+    norms[norms == 0] = 1.0
+    return norms
+
+
+def top_k_columns(block, k):
+    # best k columns per row of a dense block, sorted by similarity
+    idx = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    sim = np.take_along_axis(block, idx, axis=1)
+    order = np.argsort(-sim, axis=1, kind='stable')
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(sim, order, axis=1)
+
+
+class ExactNeighbors:
+    def __init__(self, chunk_size=256):
+        self.chunk_size = chunk_size
+
+    def fit(self, scaled, offset):
+        self.scaled = scaled
+        self.offset = offset
+        return self
+
+    def update(self, scaled, offset, rows):
+        return self.fit(scaled, offset)
+
+    def query(self, rows, k):
+        rows = np.asarray(rows)
+        k = min(k, self.scaled.shape[0] - 1)
+        neighbor_idx = np.empty((len(rows), k), dtype=np.int32)
+        neighbor_sim = np.empty((len(rows), k), dtype=np.float64)
+
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            block = centered_similarity(self.scaled, self.offset, chunk)
+            # a customer is not its own neighbour
+            block[np.arange(len(chunk)), chunk] = -np.inf
+            idx, sim = top_k_columns(block, k)
+            neighbor_idx[start:start + len(chunk)] = idx
+            neighbor_sim[start:start + len(chunk)] = sim
+
+        return neighbor_idx, neighbor_sim
+
+
+class IVFNeighbors:
+    def __init__(self, n_lists=64, n_probe=8, n_components=64, n_iter=10, chunk_size=256, random_state=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_components = n_components
+        self.n_iter = n_iter
+        self.chunk_size = chunk_size
+        self.random_state = random_state
+
+    def fit(self, scaled, offset):
+        self.scaled = scaled
+        self.offset = offset
+        rng = np.random.default_rng(self.random_state)
+
+        # low-rank embedding of the normalized rows, unit length
+        n_components = min(self.n_components, min(scaled.shape) - 1)
+        _, _, components = svds(scaled, k=n_components, random_state=self.random_state)
+        self.components = components.T
+        embedding = self._embed(np.arange(scaled.shape[0]))
+
+        # spherical k-means coarse quantizer
+        n_lists = min(self.n_lists, len(embedding))
+        centroids = embedding[rng.choice(len(embedding), n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            assignment = np.argmax(embedding @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, embedding)
+            # empty lists keep their previous centroid
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        self.centroids = centroids
+        self.assignment = np.argmax(embedding @ centroids.T, axis=1)
+        return self
+
+    def update(self, scaled, offset, rows):
+        # changed or new rows move to their closest list, the quantizer itself is kept
+        n_new_products = scaled.shape[1] - self.components.shape[0]
+        self.components = np.vstack([self.components, np.zeros((n_new_products, self.components.shape[1]))])
+        self.assignment = np.concatenate([self.assignment, np.zeros(scaled.shape[0] - len(self.assignment), dtype=self.assignment.dtype)])
+        self.scaled = scaled
+        self.offset = offset
+        self.assignment[rows] = np.argmax(self._embed(rows) @ self.centroids.T, axis=1)
+        return self
+
+    def _embed(self, rows):
+        embedding = self.scaled[rows] @ self.components - self.offset @ self.components
+        return embedding / np.maximum(np.linalg.norm(embedding, axis=1, keepdims=True), 1e-12)
+
+    def query(self, rows, k):
+        rows = np.asarray(rows)
+        k = min(k, self.scaled.shape[0] - 1)
+        # padding: zero weight on the user itself
+        neighbor_idx = np.repeat(rows[:, None], k, axis=1).astype(np.int32)
+        neighbor_sim = np.zeros((len(rows), k), dtype=np.float64)
+
+        # every list probes its n_probe closest lists (itself included)
+        probes = np.argsort(-(self.centroids @ self.centroids.T), axis=1)[:, :self.n_probe]
+        lists = self.assignment[rows]
+        for cell in np.unique(lists):
+            candidates = np.flatnonzero(np.isin(self.assignment, probes[cell]))
+            cell_k = min(k, len(candidates) - 1)
+            if cell_k <= 0:
+                continue
+
+            positions = np.flatnonzero(lists == cell)
+            for start in range(0, len(positions), self.chunk_size):
+                chunk = positions[start:start + self.chunk_size]
+                block = centered_similarity(self.scaled, self.offset, rows[chunk], candidates)
+                # a customer is not its own neighbour
+                block[rows[chunk][:, None] == candidates[None, :]] = -np.inf
+                idx, sim = top_k_columns(block, cell_k)
+                neighbor_idx[chunk, :cell_k] = candidates[idx]
+                neighbor_sim[chunk, :cell_k] = sim
+
+        return neighbor_idx, neighbor_sim
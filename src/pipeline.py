@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""Runs the four analysis scripts as a cached pipeline of stages.
+
+Every stage is one of the `src/*.py` scripts with the files it reads and the
+files it writes, as paths relative to the working directory the scripts run
+in. A stage depends on the stages that write its inputs, so preprocessing
+runs first, and descriptive analysis, clustering and recommendation run in
+parallel after it.
+
+A stage's cache key is a hash of the contents of its input files and of its
+code: the script and the `src` modules it imports. After a run, the outputs
+and the log are copied to `.pipeline/cache/<stage>/<key>/`. A stage whose key
+is unchanged is skipped when its outputs are still in place, and restored
+from the cache otherwise; only stages whose inputs or code changed run.
+File hashes are remembered by size and modification time, so unchanged data
+is not read again.
+
+The analysis stages read each table as its Parquet file (the partition
+directory for orders) or, like `storage.read_table`, its CSV export when only
+that is stored; whichever is there is hashed. A stage whose source inputs are
+missing, like preprocessing without the raw `data/raw/reviews.json`, is
+treated as a source when the tables other stages read are already stored in
+either form: they are used as they are and hashed as the downstream stages'
+inputs. A stage may list one of its own outputs as an
+input, as clustering does with `data/processed/segment_registry.json`, which
+carries segment ids from one run to the next; it is hashed when present and
+optional otherwise, so the stage re-runs whenever the state it starts from
+changed.
+
+Peak memory per stage comes from `os.wait4` where it exists (Unix). Elsewhere
+the stage is waited for through `subprocess`, and the peak is the largest
+child's so far from `resource` when that module is available, None otherwise.
+
+    python src/pipeline.py --work-dir . --stages clustering
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from storage import DATA_DIR, PARTITIONS
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# cache, logs and state, inside the working directory
+PIPELINE_DIR = '.pipeline'
+
+PIPELINE_VERSION = 1
+
+TABLES = ('customer', 'product', 'reviews')
+
+# runs a script with figure display switched off: matplotlib uses Agg (MPLBACKEND), plotly's show does nothing
+LAUNCHER = """
+import os, runpy, sys
+try:
+    import plotly.basedatatypes
+    plotly.basedatatypes.BaseFigure.show = lambda *args, **kwargs: None
+except ImportError:
+    pass
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+
+def _data(*names):
+    return [os.path.normpath(os.path.join(DATA_DIR, name)) for name in names]
+
+
+class Stage:
+    def __init__(self, name, script, inputs=(), outputs=()):
+        self.name = name
+        self.script = script
+        # paths relative to the working directory; a directory stands for all files below it
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+
+def _inputs(relative):
+    # an input is a path, or a tuple of paths of which the first one present is read
+    return relative if isinstance(relative, tuple) else (relative,)
+
+
+def _table(name):
+    # a stored table: its Parquet file, the partition directory for the order table, or else its CSV export
+    return tuple(_data(name if name in PARTITIONS else f'{name}.parquet', f'{name}.csv'))
+
+
+# the order table is stored as a directory of monthly partitions
+TABLE_FILES = _data(*(f'{name}.parquet' for name in TABLES), 'order', 'customer_ids.parquet', 'product_ids.parquet')
+
+# the id dictionaries are written with the tables and rebuilt from them when missing, so the tables stand for them
+TABLE_INPUTS = [_table(name) for name in TABLES + ('order',)]
+
+STAGES = [
+    Stage('preprocessing', 'data_preprocessing_nuuly.py', ['data/raw/reviews.json'],
+          TABLE_FILES + _data(*(f'{name}.csv' for name in TABLES + ('order',)))),
+    Stage('descriptive_analysis', 'descriptive_analysis.py', TABLE_INPUTS),
+    Stage('clustering', 'clustering.py', TABLE_INPUTS + _data('segment_registry.json'),
+          ['customer_segments.csv', 'customer_product_category_segments.csv', 'customer_seasonal_segments.csv',
+           *_data('segment_registry.json'), 'segment_model']),
+    Stage('recommendation', 'ai_product_recommendation.py', TABLE_INPUTS, ['recommender_model']),
+]
+
+
+def _peak_rss_mb(maxrss):
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux and the other Unixes
+    return maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_stage(args, cwd, log_path, timeout=None):
+    # wall time, peak RSS and exit code of one script run; args are the script and its arguments
+    env = {**os.environ, 'MPLBACKEND': 'Agg'}
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen([sys.executable, '-c', LAUNCHER, *args], cwd=cwd, stdout=log,
+                                   stderr=subprocess.STDOUT, env=env)
+        timer = threading.Timer(timeout, process.kill) if timeout else None
+        if timer:
+            timer.start()
+        if hasattr(os, 'wait4'):
+            # the child is reaped with wait4, which also returns its own resource usage
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            peak_rss_mb = _peak_rss_mb(usage.ru_maxrss)
+        else:
+            # only the largest of all children so far is known, an upper bound with stages running in parallel
+            process.wait()
+            peak_rss_mb = _peak_rss_mb(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) if resource else None
+        if timer:
+            timer.cancel()
+    return {
+        'seconds': time.perf_counter() - start,
+        'peak_rss_mb': peak_rss_mb,
+        'returncode': process.returncode,
+    }
+
+
+def _files(path):
+    # the file itself, or the files below a directory in a stable order
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(root, file) for root, _, files in os.walk(path) for file in files)
+
+
+def code_files(script, src_dir=SRC_DIR):
+    # the script and the src modules it imports, directly or through other src modules
+    found, pending = [], [os.path.join(src_dir, script)]
+    while pending:
+        path = pending.pop()
+        if path in found:
+            continue
+        found.append(path)
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                modules = [node.module]
+            else:
+                continue
+            pending += [os.path.join(src_dir, f'{m}.py') for m in modules
+                        if os.path.exists(os.path.join(src_dir, f'{m}.py'))]
+    return sorted(found)
+
+
+class Pipeline:
+    def __init__(self, stages=STAGES, work_dir='.', src_dir=SRC_DIR, timeout=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.work_dir = os.path.abspath(work_dir)
+        self.src_dir = os.path.abspath(src_dir)
+        self.timeout = timeout
+        self.pipeline_dir = os.path.join(self.work_dir, PIPELINE_DIR)
+        self._lock = threading.Lock()
+        self._hashes = self._load('hashes.json')
+        self._state = self._load('state.json')
+
+        writers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in writers:
+                    raise ValueError(f"Output '{output}' is written by both '{writers[output]}' and '{stage.name}'.")
+                writers[output] = stage.name
+        # stage name -> names of the stages writing its inputs
+        self.parents = {stage.name: sorted({writers[path] for i in stage.inputs for path in _inputs(i)
+                                            if path in writers} - {stage.name})
+                        for stage in stages}
+        # stage name -> the inputs other stages read from it
+        self.consumed = {stage.name: [] for stage in stages}
+        for stage in stages:
+            for i in stage.inputs:
+                for writer in sorted({writers[path] for path in _inputs(i) if path in writers} - {stage.name}):
+                    if i not in self.consumed[writer]:
+                        self.consumed[writer].append(i)
+
+    def _load(self, name):
+        path = os.path.join(self.pipeline_dir, name)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save(self, name, data):
+        os.makedirs(self.pipeline_dir, exist_ok=True)
+        path = os.path.join(self.pipeline_dir, name)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(f'{path}.tmp', path)
+
+    def _path(self, relative):
+        return os.path.join(self.work_dir, relative)
+
+    def _present(self, relative):
+        # the first of an input's paths that exists, None when none does
+        return next((path for path in _inputs(relative) if os.path.exists(self._path(path))), None)
+
+    def file_hash(self, path):
+        # sha256 of the contents, reused while the size and modification time are unchanged
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            known = self._hashes.get(path)
+        if known and known[:2] == stamp:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        with self._lock:
+            self._hashes[path] = stamp + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def stage_key(self, stage):
+        # hash of the pipeline version, the stage's code and the contents of its inputs
+        digest = hashlib.sha256(f'{PIPELINE_VERSION}:{stage.name}'.encode())
+        for path in code_files(stage.script, self.src_dir):
+            digest.update(f'{os.path.basename(path)}:{self.file_hash(path)};'.encode())
+        for relative in stage.inputs:
+            present = self._present(relative)
+            if present is None:
+                if relative in stage.outputs:
+                    # state the stage carries over from its previous run, absent on the first one
+                    digest.update(f'{relative}:absent;'.encode())
+                    continue
+                raise FileNotFoundError(f"Stage '{stage.name}' needs {' or '.join(map(repr, _inputs(relative)))}, "
+                                        f"which does not exist.")
+            for file in _files(self._path(present)):
+                digest.update(f'{os.path.relpath(file, self.work_dir)}:{self.file_hash(file)};'.encode())
+        return digest.hexdigest()[:16]
+
+    def _cache_dir(self, stage, key):
+        return os.path.join(self.pipeline_dir, 'cache', stage.name, key)
+
+    def _log_path(self, stage):
+        return os.path.join(self.pipeline_dir, 'logs', f'{stage.name}.log')
+
+    def _copy(self, source, target):
+        # copies a file or a directory, replacing what is at target; modification times are kept
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.isdir(source):
+            shutil.copytree(source, target)
+        else:
+            shutil.copy2(source, target)
+
+    def is_source(self, stage):
+        # source inputs missing, but what other stages read from it is already stored, in one of its forms
+        missing = [i for i in stage.inputs if i not in stage.outputs and self._present(i) is None]
+        return bool(missing) and all(self._present(i) is not None for i in self.consumed[stage.name])
+
+    def run_one(self, stage):
+        # 'skipped' when the outputs for the current key are in place, 'cached' when restored, 'ran' otherwise,
+        # 'source' when the stored outputs stand in for a stage that cannot run
+        if self.is_source(stage):
+            return {'stage': stage.name, 'key': None, 'status': 'source', 'returncode': 0}
+        missing = [i for i in stage.inputs if i not in stage.outputs and self._present(i) is None]
+        if missing:
+            absent = [_inputs(i)[0] for i in self.consumed[stage.name] if self._present(i) is None]
+            raise FileNotFoundError(f"Stage '{stage.name}' needs {missing}, or the stored tables {absent} "
+                                    f"to stand in for it.")
+        key = self.stage_key(stage)
+        cache_dir = self._cache_dir(stage, key)
+        outputs_present = all(os.path.exists(self._path(o)) for o in stage.outputs)
+        with self._lock:
+            current = self._state.get(stage.name)
+        if current == key and outputs_present:
+            return {'stage': stage.name, 'key': key, 'status': 'skipped', 'returncode': 0}
+        if os.path.exists(os.path.join(cache_dir, 'manifest.json')):
+            for output in stage.outputs:
+                self._copy(os.path.join(cache_dir, 'outputs', output), self._path(output))
+            self._copy(os.path.join(cache_dir, 'stage.log'), self._log_path(stage))
+            status = {'status': 'cached', 'returncode': 0}
+        else:
+            os.makedirs(os.path.dirname(self._log_path(stage)), exist_ok=True)
+            status = {'status': 'ran', **run_stage([os.path.join(self.src_dir, stage.script)], self.work_dir,
+                                                   self._log_path(stage), self.timeout)}
+            if status['returncode'] != 0:
+                return {'stage': stage.name, 'key': key, **status}
+            missing = [o for o in stage.outputs if not os.path.exists(self._path(o))]
+            if missing:
+                raise FileNotFoundError(f"Stage '{stage.name}' did not write {missing}.")
+            # the cache entry is complete once its manifest exists
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            for output in stage.outputs:
+                self._copy(self._path(output), os.path.join(cache_dir, 'outputs', output))
+            self._copy(self._log_path(stage), os.path.join(cache_dir, 'stage.log'))
+            with open(os.path.join(cache_dir, 'manifest.json'), 'w') as f:
+                json.dump({'stage': stage.name, 'key': key, 'outputs': stage.outputs}, f, indent=2)
+        with self._lock:
+            self._state[stage.name] = key
+        return {'stage': stage.name, 'key': key, **status}
+
+    def upstream(self, names):
+        # the named stages and every stage they depend on
+        selected, pending = set(), list(names)
+        while pending:
+            name = pending.pop()
+            if name not in selected:
+                selected.add(name)
+                pending += self.parents[name]
+        return selected
+
+    def run(self, names=None, max_workers=None):
+        # runs the selected stages and their parents, each as soon as its parents are done
+        selected = self.upstream(names or self.stages)
+        results, done, failed = [], set(), set()
+        with ThreadPoolExecutor(max_workers or len(selected)) as executor:
+            running = {}
+            while True:
+                for name in sorted(selected - done - failed - set(running.values())):
+                    parents = self.parents[name]
+                    if any(p in failed for p in parents):
+                        failed.add(name)
+                        results.append({'stage': name, 'status': 'blocked', 'returncode': None})
+                    elif all(p in done for p in parents):
+                        running[executor.submit(self.run_one, self.stages[name])] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        result = {'stage': name, 'status': 'failed', 'returncode': None, 'error': str(error)}
+                    results.append(result)
+                    (done if result['returncode'] == 0 else failed).add(name)
+        self._save('hashes.json', self._hashes)
+        self._save('state.json', self._state)
+        return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--work-dir', default='.', help='directory the scripts read ./data from and write to')
+    parser.add_argument('--stages', nargs='+', choices=[stage.name for stage in STAGES], default=None,
+                        help='run these stages and the ones they depend on')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per stage')
+    args = parser.parse_args()
+    results = Pipeline(work_dir=args.work_dir, timeout=args.timeout).run(args.stages, args.workers)
+    for result in results:
+        print(result)
+    sys.exit(0 if all(result['returncode'] == 0 for result in results) else 1)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""End-to-end timings of the analysis pipeline on synthetic data.
+
+For every scale factor, `synthetic_data.py` writes a dataset fitted to the
+stored tables into `<work dir>/x<scale>/data/processed`, then the analysis
+scripts run there one after another, each in its own process. Every stage
+is timed and its peak resident memory is taken from the process's resource
+usage. The results go to a JSON report for tracking regressions across
+commits.
+
+    python src/pipeline_benchmark.py --scales 1 10 --report pipeline_benchmark.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+from pipeline import SRC_DIR, run_stage
+from storage import DATA_DIR, table_files
+
+# scripts run after the data is generated, in order
+STAGES = ('descriptive_analysis', 'clustering', 'ai_product_recommendation')
+
+REPORT_VERSION = 1
+
+
+def table_sizes(directory):
+    # rows per generated table, from the Parquet metadata
+    return {name: ds.dataset(table_files(name, directory), format='parquet').count_rows()
+            for name in ('customer', 'product', 'order', 'reviews')}
+
+
+def run_benchmark(scales=(1, 10), stages=STAGES, data_dir=DATA_DIR, work_dir=None, seed=42, timeout=None):
+    results = []
+    with tempfile.TemporaryDirectory() as temporary:
+        work_dir = os.path.abspath(work_dir or temporary)
+        for scale in scales:
+            # the scripts read ./data/processed and write their outputs to the working directory
+            cwd = os.path.join(work_dir, f'x{scale:g}')
+            os.makedirs(cwd, exist_ok=True)
+            generate = ['--data-dir', os.path.abspath(data_dir), '--scale', str(scale), '--seed', str(seed),
+                        '--output-dir', DATA_DIR]
+
+            sizes = {}
+            for stage, args in [('synthetic_data', generate)] + [(stage, []) for stage in stages]:
+                result = run_stage([os.path.join(SRC_DIR, f'{stage}.py'), *args], cwd,
+                                   os.path.join(cwd, f'{stage}.log'), timeout)
+                if stage == 'synthetic_data' and result['returncode'] == 0:
+                    sizes = table_sizes(os.path.join(cwd, DATA_DIR))
+                results.append({'scale': scale, 'stage': stage, **sizes, **result})
+                if result['returncode'] != 0:
+                    # later stages need this stage's outputs
+                    break
+    return results
+
+
+def write_report(results, path):
+    report = {
+        'version': REPORT_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--data-dir', default=DATA_DIR, help='tables the synthetic data is fitted to')
+    parser.add_argument('--work-dir', default=None, help='keep the generated data, outputs and logs here')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per stage')
+    parser.add_argument('--report', default='pipeline_benchmark.json')
+    args = parser.parse_args()
+    results = run_benchmark(args.scales, args.stages, args.data_dir, args.work_dir, args.seed, args.timeout)
+    write_report(results, args.report)
+    print(pd.DataFrame(results).to_string(index=False))
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Reusable preprocessing steps for `data_preprocessing_nuuly.py`.
+
+`preprocess_reviews_streaming` runs the whole preprocessing on a review dump
+without loading it: products are parsed incrementally from the JSON array
+and the product/customer/review/order tables are written chunk by chunk
+through `storage.TableWriter`, with the same schemas, id codes and CSV
+exports as `data_preprocessing_nuuly.py`.
+
+    python src/preprocessing.py ./data/raw/reviews.json --chunk-size 1000
+"""
+
+import argparse
+import ast
+import json
+import uuid
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from storage import DATA_DIR, TableWriter
+
+CUSTOMER_COLUMNS = [
+    "customer_userid", "user_age", "user_height", "user_size", "user_weight",
+    "user_body_type", "user_color"
+]
+
+REVIEW_COLUMNS = [
+    "product_id", "customer_userid", "star_ratings", "review_date", "review_title", "review_content"
+]
+
+# synthesized orders: discount off the product price, and days between order and review (upper bound excluded)
+MAX_DISCOUNT = 0.5
+DELIVERY_DAYS = (2, 10)
+
+# the two hex characters of every byte value, as one uint16 each
+HEX_PAIRS = np.frombuffer(b''.join(f'{i:02x}'.encode() for i in range(256)), dtype=np.uint16)
+
+# user id key of the reviews posted without a username, so they share one customer across chunks
+MISSING_USERNAME = ''
+
+# output column -> key in the raw review dictionaries
+REVIEW_FIELDS = {
+    "customer_username": "review_posted_by_username",
+    "star_ratings": "star_ratings",
+    "review_date": "review_date",
+    "user_age": "user_age",
+    "user_height": "user_height",
+    "user_size": "user_size",
+    "user_weight": "user_weight",
+    "user_body_type": "user_body_type",
+    "user_color": "user_color",
+    "review_title": "review_title",
+    "review_content": "review_text",
+}
+
+
+def transform_reviews(df):
+    # parse reviews stored as strings, lists are used as they are
+    reviews = [ast.literal_eval(r) if isinstance(r, str) else r for r in df['reviews']]
+
+    # one product_id per review, then one list per output column
+    review_counts = np.fromiter((len(r) for r in reviews), dtype=np.int64, count=len(reviews))
+    flat_reviews = list(chain.from_iterable(reviews))
+    columns = {"product_id": np.repeat(df['product_id'].to_numpy(), review_counts)}
+    for column, key in REVIEW_FIELDS.items():
+        columns[column] = [review.get(key, None) for review in flat_reviews]
+
+    return pd.DataFrame(columns)
+
+
+def create_customer_df(df):
+    # drop duplicates to ensure one row per unique customer_username
+    return df[CUSTOMER_COLUMNS].drop_duplicates(subset="customer_userid").reset_index(drop=True)
+
+
+def create_review_df(df):
+    return df[REVIEW_COLUMNS]
+
+
+def create_product_df(df):
+    # product rows without the nested reviews, category taken from the product link
+    product_df = df.drop(columns=["reviews"])
+    product_df["product_category"] = product_df["product_link"].str.split("-").str[-1].str.split("?").str[0]
+    return product_df
+
+
+def hex_ids(n, rng=None):
+    # random 64-bit ids as 16 hex characters; the characters are looked up per byte and handed to
+    # Arrow as one buffer, without creating a Python string per id
+    rng = np.random.default_rng(rng)
+    values = rng.integers(0, np.iinfo(np.uint64).max, n, dtype=np.uint64, endpoint=True).astype('>u8')
+    characters = HEX_PAIRS[values.view(np.uint8).reshape(n, 8)]
+    offsets = np.arange(0, 16 * (n + 1), 16, dtype=np.int64)
+    ids = pa.LargeStringArray.from_buffers(n, pa.py_buffer(offsets), pa.py_buffer(characters.tobytes()))
+    return pd.arrays.ArrowStringArray(ids)
+
+
+def create_order_df(reviews_df, product_df, rng=None):
+    # one order per review, paid with a 0-50% discount and placed 2-9 days before the review;
+    # rng is a NumPy Generator or a seed, the same seed gives the same orders
+    rng = np.random.default_rng(rng)
+    n_orders = len(reviews_df)
+    order_df = reviews_df[["product_id", "customer_userid"]].copy()
+    order_df["order_id"] = hex_ids(n_orders, rng)
+    prices = order_df["product_id"].map(product_df.set_index("product_id")["product_price"])
+    discounts = rng.uniform(0, MAX_DISCOUNT, n_orders)
+    order_df["paid_amt"] = prices.to_numpy(dtype=np.float64, na_value=np.nan) * (1 - discounts)
+    order_df["order_date"] = pd.to_datetime(reviews_df["review_date"]).to_numpy(dtype='datetime64[ns]') \
+        - rng.integers(*DELIVERY_DAYS, n_orders).astype('timedelta64[D]')
+    return order_df
+
+
+def iter_json_array(path, chunk_size=1000, read_size=1 << 20):
+    # yield the elements of a top-level JSON array in lists of chunk_size
+    decoder = json.JSONDecoder()
+    chunk = []
+    with open(path, 'r') as f:
+        buffer = f.read(read_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} does not contain a JSON array.")
+        position = 1
+        eof = False
+
+        while True:
+            # skip whitespace and separators between elements
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the element continues in the next block
+                if eof:
+                    raise
+                block = f.read(read_size)
+                eof = not block
+                buffer = buffer[position:] + block
+                position = 0
+                continue
+
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def preprocess_reviews_streaming(json_path, output_dir=DATA_DIR, chunk_size=1000, seed=None):
+    # same outputs as data_preprocessing_nuuly.py, with memory bounded by one chunk of products
+    rng = np.random.default_rng(seed)
+    username_to_userid = {}
+    seen_customers = set()
+    writer = TableWriter(output_dir)
+
+    for products in iter_json_array(json_path, chunk_size):
+        df = pd.DataFrame(products)
+        df['product_id'] = [uuid.uuid4() for _ in range(len(df))]
+        product_df = create_product_df(df)
+        final_df = transform_reviews(df[["reviews", "product_id"]])
+
+        # user ids keep counting across chunks, in order of first appearance
+        usernames = final_df["customer_username"].fillna(MISSING_USERNAME)
+        for username in usernames.unique():
+            if username not in username_to_userid:
+                username_to_userid[username] = f"user_{len(username_to_userid) + 1}"
+        final_df["customer_userid"] = usernames.map(username_to_userid)
+        final_df = final_df.drop(columns="customer_username")
+        final_final_df = pd.merge(product_df, final_df, on='product_id')
+
+        # customers are written the first time they show up
+        customer_df = create_customer_df(final_final_df)
+        customer_df = customer_df[~customer_df["customer_userid"].isin(seen_customers)]
+        seen_customers.update(customer_df["customer_userid"])
+
+        reviews_df = create_review_df(final_final_df)
+        order_df = create_order_df(reviews_df, product_df, rng)
+
+        for name, frame in (('customer', customer_df), ('product', product_df),
+                            ('order', order_df), ('reviews', reviews_df)):
+            writer.write(frame, name)
+
+    writer.close()
+    return output_dir
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Preprocess a review dump chunk by chunk.')
+    parser.add_argument('json_path', nargs='?', default='./data/raw/reviews.json')
+    parser.add_argument('--output-dir', default=DATA_DIR)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=None, help='seed for the synthesized orders')
+    args = parser.parse_args()
+    preprocess_reviews_streaming(args.json_path, args.output_dir, args.chunk_size, args.seed)
+    print("DataFrames saved to Parquet and CSV files successfully!")
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Descriptive statistics for the processed tables in one scan per column.
+
+`profile_table` computes, for every column, the non-null and null counts and
+the cardinality. Numeric columns also get moments, min/max and quantiles
+(the fields of `Series.describe()`), and low-cardinality columns get their
+value counts. Label columns are reduced to integer codes once
+(categorical codes or `pd.factorize`) and counted with `np.bincount`;
+numeric columns are sorted once. Group aggregates (row count, sum and mean
+per key, optionally per calendar period of a date column) come from one
+bincount per value column.
+
+`Profiler.profile(name)` profiles a stored table with the aggregates in
+`GROUP_AGGREGATES` and caches the `TableProfile` in memory and as a pickle
+under `<data dir>/profiles`, keyed by the table's data version. A caller that
+has already read the table passes it as `df`, so the table is scanned once
+for both the report and its profile.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from feature_store import data_version
+from storage import DATA_DIR, read_table
+
+# bump when TableProfile changes
+PROFILE_VERSION = 3
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+# value counts are kept for columns with at most this many distinct values
+MAX_VALUE_COUNTS = 1000
+
+# table -> aggregate name -> (key column, period frequency for date keys or None, value columns)
+GROUP_AGGREGATES = {
+    'customer': {
+        'by_body_type': ('user_body_type', None, ['user_age']),
+    },
+    'product': {
+        'by_category': ('product_category', None, ['product_price']),
+    },
+    'order': {
+        'by_product': ('product_code', None, ['paid_amt']),
+        'by_customer': ('customer_code', None, ['paid_amt']),
+    },
+}
+
+
+class TableProfile:
+    def __init__(self, rows, counts, nulls, nunique, stats, value_counts, groups):
+        self.rows = rows
+        self.counts = counts
+        self.nulls = nulls
+        self.nunique = nunique
+        # column -> describe()-style Series, for numeric columns
+        self.stats = stats
+        # column -> counts per value, most frequent first
+        self.value_counts = value_counts
+        # aggregate name -> DataFrame indexed by key
+        self.groups = groups
+
+    def describe(self, column):
+        return self.stats[column]
+
+    def summary(self):
+        # one row per column
+        return pd.DataFrame({'count': self.counts, 'nulls': self.nulls, 'nunique': self.nunique})
+
+
+def _label_codes(values):
+    # integer codes for a label column, -1 for missing values
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values, use_na_sentinel=True)
+
+
+def _profile_labels(values, max_value_counts):
+    codes, uniques = _label_codes(values)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    observed = counts > 0
+    value_counts = None
+    if observed.sum() <= max_value_counts:
+        # most frequent first, ties in first-seen order like value_counts
+        order = np.argsort(-counts[observed], kind='stable')
+        value_counts = pd.Series(counts[observed][order], name='count',
+                                 index=pd.Index(np.asarray(uniques)[observed][order], name=values.name))
+    return int((codes < 0).sum()), int(observed.sum()), None, value_counts
+
+
+def _profile_numbers(values, max_value_counts, quantiles):
+    is_datetime = pd.api.types.is_datetime64_any_dtype(values)
+    if is_datetime:
+        missing = values.isna().to_numpy()
+        data = values.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    else:
+        data = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        missing = np.isnan(data)
+    ordered = np.sort(data[~missing])
+    distinct = np.r_[True, ordered[1:] != ordered[:-1]] if len(ordered) else np.zeros(0, dtype=bool)
+    nunique = int(distinct.sum())
+
+    stats = value_counts = None
+    if not is_datetime and len(ordered):
+        stats = pd.Series(
+            [len(ordered), ordered.mean(), ordered.std(ddof=1) if len(ordered) > 1 else np.nan, ordered[0]]
+            + list(np.quantile(ordered, quantiles)) + [ordered[-1]],
+            index=['count', 'mean', 'std', 'min'] + [f'{q:.0%}' for q in quantiles] + ['max'],
+            name=values.name,
+        )
+    if not is_datetime and 0 < nunique <= max_value_counts:
+        starts = np.flatnonzero(distinct)
+        counts = np.diff(np.r_[starts, len(ordered)])
+        order = np.argsort(-counts, kind='stable')
+        value_counts = pd.Series(counts[order], name='count', index=pd.Index(ordered[starts][order], name=values.name))
+    return int(missing.sum()), nunique, stats, value_counts
+
+
+def _group_keys(values, freq):
+    # integer key codes and key labels; date keys are grouped by calendar period
+    if freq is not None:
+        values = values.dt.to_period(freq)
+    return _label_codes(values)
+
+
+def group_aggregate(df, key, freq=None, value_columns=()):
+    # count, <column>_sum and <column>_mean per key (or period of a date key), in key order
+    codes, uniques = _group_keys(df[key], freq)
+    known = codes >= 0
+    codes = codes[known]
+    n_keys = len(uniques)
+    aggregate = {'count': np.bincount(codes, minlength=n_keys)}
+    for column in value_columns:
+        values = df[column].to_numpy(dtype=np.float64, na_value=np.nan)[known]
+        present = ~np.isnan(values)
+        total = np.bincount(codes, weights=np.where(present, values, 0.0), minlength=n_keys)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            aggregate[f'{column}_sum'] = total
+            aggregate[f'{column}_mean'] = total / np.bincount(codes, weights=present, minlength=n_keys)
+
+    index = pd.Index(uniques.astype(str) if freq is not None else uniques, name=key)
+    result = pd.DataFrame(aggregate, index=index)
+    result = result[result['count'] > 0]
+    return result.sort_index()
+
+
+def profile_table(df, group_aggregates=None, max_value_counts=MAX_VALUE_COUNTS, quantiles=QUANTILES):
+    counts, nulls, nunique, stats, value_counts = {}, {}, {}, {}, {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values) \
+                or pd.api.types.is_datetime64_any_dtype(values):
+            profile = _profile_numbers(values, max_value_counts, quantiles)
+        else:
+            profile = _profile_labels(values, max_value_counts)
+        nulls[column], nunique[column], column_stats, column_counts = profile
+        counts[column] = len(df) - nulls[column]
+        if column_stats is not None:
+            stats[column] = column_stats
+        if column_counts is not None:
+            value_counts[column] = column_counts
+
+    groups = {name: group_aggregate(df, key, freq, value_columns)
+              for name, (key, freq, value_columns) in (group_aggregates or {}).items()}
+    return TableProfile(len(df), pd.Series(counts), pd.Series(nulls), pd.Series(nunique),
+                        stats, value_counts, groups)
+
+
+class Profiler:
+    def __init__(self, directory=DATA_DIR, cache_dir=None):
+        self.directory = directory
+        self.cache_dir = cache_dir or os.path.join(directory, 'profiles')
+        self._cache = {}
+
+    def profile(self, name, df=None):
+        # df is the stored table when the caller has read it already, it is profiled instead of read again
+        key = f'{name}-{data_version(self.directory, (name,))}-{PROFILE_VERSION}'
+        if key in self._cache:
+            return self._cache[key]
+
+        path = os.path.join(self.cache_dir, f'{key}.pkl')
+        if os.path.exists(path):
+            profile = pd.read_pickle(path)
+        else:
+            df = read_table(name, self.directory) if df is None else df
+            profile = profile_table(df, GROUP_AGGREGATES.get(name))
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # written under a temporary name and renamed, so an interrupted run never leaves a partial pickle
+            temporary = f'{path}.{os.getpid()}.tmp'
+            pd.to_pickle(profile, temporary)
+            os.replace(temporary, path)
+        self._cache[key] = profile
+        return profile
+
+    def report(self, tables=('customer', 'product', 'order', 'reviews')):
+        # table name -> TableProfile
+        return {name: self.profile(name) for name in tables}
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""Local HTTP service around the recommender.
+
+Concurrent requests are collected for a few milliseconds and scored together
+with one `recommend_products_batch` call. Recent per-user results are kept in
+an LRU cache.
+
+Endpoints:
+- `GET /recommend?customer_userid=user_3454&top_n=5`, top_n from 1 to `MAX_TOP_N`
+- `GET /metrics`: p50/p99 latency, throughput, batch and cache counters.
+
+Run from the repository root after `ai_product_recommendation.py` has saved
+the model:
+
+    python src/recommendation_service.py --model recommender_model --port 8080
+
+`load_generator.py` drives it with concurrent clients.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from recommender import Recommender
+
+# largest top_n a request may ask for
+MAX_TOP_N = 100
+
+
+class RecommendationService:
+    def __init__(self, recommender, max_wait_ms=5, max_batch=256, cache_size=10000):
+        self.recommender = recommender
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.queue = None
+
+        # counters for /metrics
+        self.latencies = deque(maxlen=10000)
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.cache_hits = 0
+        self.batches = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.create_task(self._batch_loop())
+
+    async def recommend(self, customer_userid, top_n=5):
+        start = time.perf_counter()
+        key = (customer_userid, top_n)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.cache_hits += 1
+            result = self.cache[key]
+        else:
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((customer_userid, top_n, future))
+            result = await future
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        self.requests += 1
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # wait for the first request, then collect more for max_wait
+            pending = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(pending) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(None, self._score, pending)
+            except Exception as error:
+                for _, _, future in pending:
+                    future.set_exception(error)
+                continue
+            self.batches += 1
+            for (_, _, future), result in zip(pending, results):
+                future.set_result(result)
+
+    def _score(self, pending):
+        # one batch call for every distinct user, scored with the largest top_n asked for
+        user_ids = list(dict.fromkeys(user for user, _, _ in pending))
+        top_n = max(n for _, n, _ in pending)
+        batch = self.recommender.recommend_products_batch(user_ids, top_n=top_n)
+        by_user = {user: rows for user, rows in batch.groupby('customer_userid', sort=False)}
+
+        results = []
+        for user, n, _ in pending:
+            if user not in self.recommender.user_ids:
+                results.append({'error': f"Customer ID {user} not found in the dataset."})
+                continue
+            rows = by_user.get(user)
+            if rows is None:
+                results.append({'customer_userid': user, 'recommendations': []})
+                continue
+            # confidences are normalized over the user's own top_n
+            rows = rows[rows['rank'] <= n]
+            scores = rows['confidence'].to_numpy()
+            recommendations = rows[['product_id', 'product_name']].astype(str).to_dict('records')
+            for recommendation, score in zip(recommendations, _rescale(scores, n, top_n)):
+                recommendation['confidence'] = score
+            results.append({'customer_userid': user, 'recommendations': recommendations})
+        return results
+
+    def metrics(self):
+        latencies = np.array(self.latencies) * 1000
+        elapsed = time.perf_counter() - self.started
+        return {
+            'requests': self.requests,
+            'throughput_rps': self.requests / elapsed if elapsed else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'batches': self.batches,
+            'avg_batch_size': (self.requests - self.cache_hits) / self.batches if self.batches else None,
+            'cache_hits': self.cache_hits,
+            'cache_size': len(self.cache),
+        }
+
+    async def handle(self, reader, writer):
+        # minimal HTTP/1.1 with keep-alive
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                    url = urlsplit(target)
+                except ValueError:
+                    # the stream can't be trusted after a malformed request line, answer and close
+                    await self._respond(writer, '400 Bad Request', {'error': 'Malformed request line.'}, close=True)
+                    break
+                status, body = await self._route(method, url)
+                close = headers.get('connection', '').lower() == 'close'
+                await self._respond(writer, status, body, close)
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body, close=False):
+        payload = json.dumps(body).encode()
+        connection = 'Connection: close\r\n' if close else ''
+        writer.write(
+            f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n{connection}'
+            f'Content-Length: {len(payload)}\r\n\r\n'.encode() + payload
+        )
+        await writer.drain()
+
+    async def _route(self, method, url):
+        if method != 'GET':
+            return '405 Method Not Allowed', {'error': 'Only GET is supported.'}
+        if url.path == '/metrics':
+            return '200 OK', self.metrics()
+        if url.path == '/recommend':
+            query = parse_qs(url.query)
+            if 'customer_userid' not in query:
+                return '400 Bad Request', {'error': 'customer_userid is required.'}
+            try:
+                top_n = int(query.get('top_n', ['5'])[0])
+            except ValueError:
+                top_n = None
+            if top_n is None or not 1 <= top_n <= MAX_TOP_N:
+                return '400 Bad Request', {'error': f'top_n must be an integer from 1 to {MAX_TOP_N}.'}
+            try:
+                result = await self.recommend(query['customer_userid'][0], top_n)
+            except Exception as error:
+                return '500 Internal Server Error', {'error': str(error)}
+            return ('404 Not Found' if 'error' in result else '200 OK'), result
+        return '404 Not Found', {'error': f'Unknown path {url.path}.'}
+
+
+def _rescale(scores, n, top_n):
+    # min-max normalize again when fewer products than the batch top_n are returned
+    if n == top_n or len(scores) == 0:
+        return [float(score) for score in scores]
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return [100.0] * len(scores)
+    return [float(100 * (score - low) / (high - low)) for score in scores]
+
+
+async def serve(model_path, host='127.0.0.1', port=8080, **options):
+    service = RecommendationService(Recommender.load(model_path), **options)
+    await service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f'Serving recommendations on http://{host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve product recommendations over HTTP.')
+    parser.add_argument('--model', default='recommender_model')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--cache-size', type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(serve(args.model, args.host, args.port, max_wait_ms=args.max_wait_ms,
+                      max_batch=args.max_batch, cache_size=args.cache_size))
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""Sparse user-based recommender used by `ai_product_recommendation.py`.
+
+The user-item interactions are kept in a CSR matrix and only the top-k most
+similar customers are stored per customer, so memory grows linearly with the
+number of customers instead of the dense customers x customers similarity
+matrix.
+
+Similarities are the same ones the notebook computed: cosine similarity
+between the rows of the `StandardScaler`-normalized user-item matrix. The
+normalized matrix is dense (centering removes the zeros), so it is never
+materialized; the centering terms are applied to each block of sparse dot
+products instead. The neighbour search itself is delegated to a backend
+from `neighbors.py` (exact brute force by default).
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from neighbors import ExactNeighbors, centered_similarity, top_k_columns
+
+# bump when the on-disk layout written by Recommender.save changes
+ARTIFACT_VERSION = 1
+
+
+def build_interaction_matrix(merged_data):
+    # drop rows without a rating, pivot_table ignores them as well
+    merged_data = merged_data.dropna(subset=['star_ratings'])
+
+    # dense codes for customers and products
+    user_codes, user_ids = _factorize_ids(merged_data, 'customer_userid', 'customer_code')
+    item_codes, product_ids = _factorize_ids(merged_data, 'product_id', 'product_code')
+    shape = (len(user_ids), len(product_ids))
+
+    # pivot_table averages repeated (customer, product) pairs
+    ratings = merged_data['star_ratings'].to_numpy(dtype=np.float64)
+    sums = sp.csr_matrix((ratings, (user_codes, item_codes)), shape=shape)
+    counts = sp.csr_matrix((np.ones_like(ratings), (user_codes, item_codes)), shape=shape)
+    user_item = sums.multiply(counts.power(-1)).tocsr()
+
+    return user_item, counts, pd.Index(user_ids), pd.Index(product_ids)
+
+
+def _factorize_ids(df, id_column, code_column):
+    # reuse the int32 id-dictionary codes when the table has them, else sort ids like pivot_table
+    if code_column not in df.columns:
+        return pd.factorize(df[id_column], sort=True)
+    codes, first, inverse = np.unique(df[code_column].to_numpy(), return_index=True, return_inverse=True)
+    return inverse, df[id_column].to_numpy()[first].astype(str)
+
+
+def column_sums(user_item):
+    # per-product sum and sum of squares, enough to update the scaler later
+    column_sum = np.asarray(user_item.sum(axis=0)).ravel()
+    column_sq_sum = np.asarray(user_item.multiply(user_item).sum(axis=0)).ravel()
+    return column_sum, column_sq_sum
+
+
+def column_statistics(column_sum, column_sq_sum, n_users):
+    # mean and population std per product, matching StandardScaler
+    mean = column_sum / n_users
+    std = np.sqrt(np.maximum(column_sq_sum / n_users - mean ** 2, 0))
+    std[std == 0] = 1.0
+    return mean, std
+
+
+def scaled_space(user_item, mean, std):
+    # normalized row i is scaled[i] - offset
+    scaled = user_item @ sp.diags(1.0 / std)
+    offset = mean / std
+    return scaled.tocsr(), offset
+
+
+def _with_rows(matrix, n_rows):
+    # CSR matrix with empty rows appended, without touching the original arrays
+    indptr = np.concatenate([matrix.indptr, np.full(n_rows - matrix.shape[0], matrix.indptr[-1])])
+    return sp.csr_matrix((matrix.data, matrix.indices, indptr), shape=(n_rows, matrix.shape[1]))
+
+
+def _replace_rows(matrix, rows, new_rows):
+    # CSR matrix with the sorted `rows` swapped for the rows of new_rows; the other rows are copied over as they are
+    lengths = np.diff(matrix.indptr)
+    new_lengths = lengths.copy()
+    new_lengths[rows] = np.diff(new_rows.indptr)
+    indptr = np.concatenate([[0], np.cumsum(new_lengths)])
+    kept = np.ones(matrix.shape[0], dtype=bool)
+    kept[rows] = False
+    source, target = np.repeat(kept, lengths), np.repeat(kept, new_lengths)
+
+    data = np.empty(indptr[-1], dtype=np.result_type(matrix.data, new_rows.data))
+    indices = np.empty(indptr[-1], dtype=matrix.indices.dtype)
+    data[target], indices[target] = matrix.data[source], matrix.indices[source]
+    data[~target], indices[~target] = new_rows.data, new_rows.indices
+    return sp.csr_matrix((data, indices, indptr), shape=matrix.shape)
+
+
+class Recommender:
+    def __init__(self, user_item, counts, user_ids, product_ids, product_names,
+                 neighbor_idx, neighbor_sim, backend=None, column_sum=None, column_sq_sum=None, scale=None):
+        self.user_item = user_item
+        if column_sum is None:
+            column_sum, column_sq_sum = column_sums(user_item)
+        self.column_sum = column_sum
+        self.column_sq_sum = column_sq_sum
+        self.counts = counts
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        self.product_names = product_names
+        self.neighbor_idx = neighbor_idx
+        self.neighbor_sim = neighbor_sim
+        self.backend = backend
+        # per-product std the backend's scaled matrix was built with, kept between fits
+        self.scale = scale
+
+    @classmethod
+    def fit(cls, merged_data, product_data, n_neighbors=50, backend=None):
+        user_item, counts, user_ids, product_ids = build_interaction_matrix(merged_data)
+
+        # normalize the user-item matrix for cosine similarity
+        mean, std = column_statistics(*column_sums(user_item), len(user_ids))
+        scaled, offset = scaled_space(user_item, mean, std)
+
+        # top-k neighbours for every user
+        backend = (backend or ExactNeighbors()).fit(scaled, offset)
+        neighbor_idx, neighbor_sim = backend.query(np.arange(len(user_ids)), n_neighbors)
+
+        # product names aligned with the product columns
+        names = product_data.drop_duplicates('product_id').set_index('product_id')['product_name']
+        product_names = names.reindex(product_ids).to_numpy()
+
+        return cls(user_item, counts, user_ids, product_ids, product_names,
+                   neighbor_idx, neighbor_sim, backend, scale=std)
+
+    def update(self, delta, product_data=None, chunk_size=256):
+        # add new (customer_userid, product_id, star_ratings) rows without a full refit; only the rows of the
+        # customers in the delta are recomputed, and only neighbour lists they can enter are merged
+        delta = delta.dropna(subset=['star_ratings'])
+        if delta.empty:
+            return self
+
+        # new customers and products are appended to the index maps
+        self.user_ids = self.user_ids.append(pd.Index(delta['customer_userid'].unique()).difference(self.user_ids))
+        self.product_ids = self.product_ids.append(pd.Index(delta['product_id'].unique()).difference(self.product_ids))
+        n_users, n_products = len(self.user_ids), len(self.product_ids)
+        old_users, old_products = self.user_item.shape
+        self.product_names = np.concatenate([self.product_names, np.full(n_products - old_products, np.nan, dtype=object)])
+        if product_data is not None:
+            names = product_data.drop_duplicates('product_id').set_index('product_id')['product_name']
+            self.product_names = names.reindex(self.product_ids).to_numpy()
+        if self.scale is None:
+            # models loaded from disk take the scaling of their stored statistics
+            self.scale = column_statistics(self.column_sum, self.column_sq_sum, old_users)[1]
+
+        user_codes = self.user_ids.get_indexer(delta['customer_userid'])
+        item_codes = self.product_ids.get_indexer(delta['product_id'])
+        affected = np.unique(user_codes)
+
+        # running sums of ratings and counts of the affected rows, averaged like pivot_table
+        ratings = delta['star_ratings'].to_numpy(dtype=np.float64)
+        shape = (n_users, n_products)
+        self.user_item = _with_rows(self.user_item, n_users)
+        self.counts = _with_rows(self.counts, n_users)
+        self.user_item.resize(shape)
+        self.counts.resize(shape)
+        positions = (np.searchsorted(affected, user_codes), item_codes)
+        old_rows = self.user_item[affected]
+        old_counts = self.counts[affected]
+        new_counts = (old_counts + sp.csr_matrix((np.ones_like(ratings), positions), shape=old_counts.shape)).tocsr()
+        sums = old_rows.multiply(old_counts) + sp.csr_matrix((ratings, positions), shape=old_rows.shape)
+        new_rows = sp.csr_matrix(sums.multiply(new_counts.power(-1)))
+        self.user_item = _replace_rows(self.user_item, affected, new_rows)
+        self.counts = _replace_rows(self.counts, affected, new_counts)
+
+        # scaler statistics only change by the rewritten rows
+        self.column_sum = np.concatenate([self.column_sum, np.zeros(n_products - old_products)])
+        self.column_sq_sum = np.concatenate([self.column_sq_sum, np.zeros(n_products - old_products)])
+        self.column_sum += np.asarray(new_rows.sum(axis=0) - old_rows.sum(axis=0)).ravel()
+        self.column_sq_sum += np.asarray(new_rows.multiply(new_rows).sum(axis=0) - old_rows.multiply(old_rows).sum(axis=0)).ravel()
+        mean, std = column_statistics(self.column_sum, self.column_sq_sum, n_users)
+        # the column scaling stays the last fit's, so untouched rows of the scaled matrix stay valid;
+        # new products get theirs on first rating and the centering follows the updated means
+        self.scale = np.concatenate([self.scale, std[len(self.scale):]])
+        offset = mean / self.scale
+        if self.backend is None:
+            # models loaded from disk build the scaled matrix once and fall back to the exact backend
+            scaled = scaled_space(self.user_item, mean, self.scale)[0]
+            self.backend = ExactNeighbors()
+        else:
+            scaled = _with_rows(self.backend.scaled, n_users)
+            scaled.resize(shape)
+            scaled = _replace_rows(scaled, affected, sp.csr_matrix(new_rows @ sp.diags(1.0 / self.scale)))
+        self.backend = self.backend.update(scaled, offset, affected)
+
+        # new customers start with zero-weight padding
+        k = self.neighbor_idx.shape[1]
+        new_users = np.arange(old_users, n_users)
+        self.neighbor_idx = np.concatenate([self.neighbor_idx, np.repeat(new_users[:, None], k, axis=1).astype(np.int32)])
+        self.neighbor_sim = np.concatenate([self.neighbor_sim, np.zeros((len(new_users), k))])
+
+        # fresh neighbour lists for the customers in the delta
+        self.neighbor_idx[affected], self.neighbor_sim[affected] = self.backend.query(affected, k)
+
+        # other customers change only if an affected customer is in their list (a stale similarity)
+        # or now beats their k-th neighbour
+        is_affected = np.zeros(n_users, dtype=bool)
+        is_affected[affected] = True
+        stale = is_affected[self.neighbor_idx].any(axis=1)
+        for start in range(0, len(affected), chunk_size):
+            chunk = affected[start:start + chunk_size]
+            block = centered_similarity(scaled, offset, chunk).T
+            block[chunk, np.arange(len(chunk))] = -np.inf
+            rows = np.flatnonzero(stale | (block.max(axis=1) > self.neighbor_sim[:, -1]))
+            if len(rows) == 0:
+                continue
+
+            # drop stale similarities to the chunk, the block has the fresh ones
+            current_idx, block = self.neighbor_idx[rows], block[rows]
+            current_sim = np.where(np.isin(current_idx, chunk), -np.inf, self.neighbor_sim[rows])
+            merged_idx = np.concatenate([current_idx, np.broadcast_to(chunk, block.shape)], axis=1)
+            merged_sim = np.concatenate([current_sim, block], axis=1)
+            idx, sim = top_k_columns(merged_sim, k)
+            idx = np.take_along_axis(merged_idx, idx, axis=1).astype(np.int32)
+            # rows left without enough neighbours fall back to padding
+            padding = ~np.isfinite(sim)
+            idx[padding] = np.broadcast_to(rows[:, None], idx.shape)[padding]
+            sim[padding] = 0.0
+            self.neighbor_idx[rows], self.neighbor_sim[rows] = idx, sim
+
+        return self
+
+    def save(self, path):
+        # versioned directory of .npy arrays that load() can memory-map
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            'user_ids': _to_array(self.user_ids),
+            'product_ids': _to_array(self.product_ids),
+            # missing product names are stored as empty strings
+            'product_names': pd.Series(self.product_names).fillna('').to_numpy(dtype=str),
+            'column_sum': self.column_sum,
+            'column_sq_sum': self.column_sq_sum,
+            'neighbor_idx': self.neighbor_idx,
+            'neighbor_sim': self.neighbor_sim,
+        }
+        for name, matrix in (('user_item', self.user_item), ('counts', self.counts)):
+            arrays[f'{name}_data'] = matrix.data
+            arrays[f'{name}_indices'] = matrix.indices
+            arrays[f'{name}_indptr'] = matrix.indptr
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(array))
+
+        manifest = {
+            'version': ARTIFACT_VERSION,
+            'n_users': len(self.user_ids),
+            'n_products': len(self.product_ids),
+            'n_neighbors': self.neighbor_idx.shape[1],
+            'arrays': sorted(arrays),
+        }
+        # the manifest is written last, so a partial build is never loadable
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest['version'] != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported recommender artifact version {manifest['version']} "
+                             f"(expected {ARTIFACT_VERSION}).")
+
+        # large arrays are memory-mapped, so worker processes share the same pages
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+                  for name in manifest['arrays']}
+        shape = (manifest['n_users'], manifest['n_products'])
+        user_item, counts = (
+            sp.csr_matrix((arrays[f'{name}_data'], arrays[f'{name}_indices'], arrays[f'{name}_indptr']),
+                          shape=shape, copy=False)
+            for name in ('user_item', 'counts')
+        )
+        product_names = np.asarray(arrays['product_names'], dtype=object)
+        product_names[product_names == ''] = np.nan
+
+        return cls(user_item, counts, pd.Index(arrays['user_ids']), pd.Index(arrays['product_ids']),
+                   product_names, arrays['neighbor_idx'], arrays['neighbor_sim'],
+                   column_sum=arrays['column_sum'], column_sq_sum=arrays['column_sq_sum'])
+
+    def _score_block(self, users):
+        # one sparse weight row per user, built from the neighbour index
+        n_neighbors = self.neighbor_idx.shape[1]
+        sim = self.neighbor_sim[users]
+        weights = sp.csr_matrix(
+            (sim.ravel(), self.neighbor_idx[users].ravel(),
+             np.arange(0, len(users) * n_neighbors + 1, n_neighbors)),
+            shape=(len(users), self.user_item.shape[0]),
+        )
+        similarity_sum = np.abs(sim).sum(axis=1)
+
+        # weighted average of the neighbours' ratings for the whole block
+        scores = (weights @ self.user_item).toarray()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores /= similarity_sum[:, None]
+
+        # filter out products already rated by the users
+        rated = self.user_item[users]
+        rated_rows = np.repeat(np.arange(len(users)), np.diff(rated.indptr))
+        positive = rated.data > 0
+        scores[rated_rows[positive], rated.indices[positive]] = -np.inf
+        # keep the products that have a name, like the merge with product_data
+        scores[:, pd.isnull(self.product_names)] = -np.inf
+        scores[similarity_sum == 0] = -np.inf
+
+        return scores
+
+    def recommend_products_batch(self, user_ids, top_n=5, block_size=1024):
+        # customers missing from the dataset are skipped
+        users = self.user_ids.get_indexer(pd.Index(user_ids))
+        users = users[users >= 0]
+        top_n = min(top_n, len(self.product_ids))
+
+        results = []
+        for start in range(0, len(users), block_size):
+            block = users[start:start + block_size]
+            scores = self._score_block(block)
+
+            # top N products per user, sorted by score
+            top = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            # normalize scores per user
+            valid = np.isfinite(top_scores)
+            min_score = np.where(valid, top_scores, np.inf).min(axis=1, keepdims=True)
+            max_score = np.where(valid, top_scores, -np.inf).max(axis=1, keepdims=True)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                confidence = np.where(max_score == min_score, 100.0,
+                                      100 * (top_scores - min_score) / (max_score - min_score))
+
+            rows, ranks = np.nonzero(valid)
+            products = top[rows, ranks]
+            results.append(pd.DataFrame({
+                'customer_userid': self.user_ids[block[rows]],
+                'rank': ranks + 1,
+                'product_id': self.product_ids[products],
+                'product_name': self.product_names[products],
+                'confidence': confidence[rows, ranks],
+            }))
+
+        if not results:
+            return pd.DataFrame(columns=['customer_userid', 'rank', 'product_id', 'product_name', 'confidence'])
+        return pd.concat(results, ignore_index=True)
+
+    def recommend_products(self, customer_userid, top_n=5):
+        if customer_userid not in self.user_ids:
+            return f"Customer ID {customer_userid} not found in the dataset."
+        user = self.user_ids.get_loc(customer_userid)
+        if np.abs(self.neighbor_sim[user]).sum() == 0:
+            return "No similar users found to base recommendations on."
+
+        top_recommendations = self.recommend_products_batch([customer_userid], top_n=top_n)
+        return top_recommendations[['product_id', 'product_name', 'confidence']]
+
+
+def _to_array(index):
+    # ids as a fixed-width numpy array, strings when they are not numeric
+    array = np.asarray(index)
+    return array.astype(str) if array.dtype == object or not np.issubdtype(array.dtype, np.number) else array
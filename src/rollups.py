@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Day, week and month rollups of orders and reviews per product category.
+
+Dates are turned into integer period codes once: days since 1970-01-01,
+Monday-based weeks since then, and months since January 1970. For each grain
+`RollupCube` keeps a dense array of period x category x metric, filled with
+one `np.bincount` per metric over `period * n_categories + category`.
+`add_orders` / `add_reviews` fold new rows into the existing arrays, growing
+them when new periods or categories appear, so the cube is updated
+incrementally as orders land. Trend charts and date-range queries are then
+slices of these arrays.
+
+`load_rollups` builds the cube from the stored tables, or loads it from
+`<data dir>/rollups` when it was already built for the current reviews and
+products. The cube records the order files it was built from, so orders
+appended to the partitioned order table since are folded in from the new
+files only; any other change to the orders rebuilds it.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from feature_store import data_version
+from storage import DATA_DIR, read_table, table_files
+
+ARTIFACT_VERSION = 1
+
+GRAINS = ('day', 'week', 'month')
+
+# pandas period frequency of each grain, weeks run Monday to Sunday
+PERIOD_FREQ = {'day': 'D', 'week': 'W-SUN', 'month': 'M'}
+
+METRICS = ('order_count', 'revenue', 'review_count', 'rating_sum', 'rating_count')
+
+# category of orders and reviews whose product is not in the product table
+UNKNOWN_CATEGORY = 'unknown'
+
+ORDER_COLUMNS = ['product_code', 'paid_amt', 'order_date']
+
+
+def period_codes(dates, grain):
+    # integer period code per date, NaT becomes -1
+    dates = pd.to_datetime(pd.Series(dates))
+    missing = dates.isna().to_numpy()
+    days = dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    if grain == 'day':
+        codes = days
+    elif grain == 'week':
+        # 1970-01-01 is a Thursday, +3 aligns weeks on Mondays
+        codes = (days + 3) // 7
+    elif grain == 'month':
+        codes = dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[M]').astype(np.int64)
+    else:
+        raise ValueError(f"Unknown grain '{grain}', expected one of {GRAINS}.")
+    return np.where(missing, -1, codes)
+
+
+def period_index(codes, grain):
+    # pandas PeriodIndex for integer period codes
+    codes = np.asarray(codes, dtype=np.int64)
+    if grain == 'day':
+        starts = codes.astype('datetime64[D]')
+    elif grain == 'week':
+        starts = (codes * 7 - 3).astype('datetime64[D]')
+    else:
+        starts = codes.astype('datetime64[M]')
+    return pd.PeriodIndex(pd.DatetimeIndex(starts), freq=PERIOD_FREQ[grain], name=grain)
+
+
+class RollupCube:
+    def __init__(self, categories=(), product_categories=None, starts=None, values=None, order_files=None):
+        self.categories = list(categories)
+        # product_code -> category index, -1 for products without a category
+        self.product_categories = np.full(0, -1, dtype=np.int64) if product_categories is None \
+            else np.asarray(product_categories, dtype=np.int64)
+        # grain -> code of the first period, and period x category x metric sums
+        self.starts = starts or {grain: 0 for grain in GRAINS}
+        self.values = values or {grain: np.zeros((0, len(self.categories), len(METRICS))) for grain in GRAINS}
+        # stored order file -> stamp of the version that was added, kept up to date by load_rollups
+        self.order_files = order_files or {}
+
+    @classmethod
+    def build(cls, order_df, reviews_df, product_df):
+        cube = cls().set_products(product_df)
+        return cube.add_orders(order_df).add_reviews(reviews_df)
+
+    def _category_index(self, category):
+        if category not in self.categories:
+            self.categories.append(category)
+            for grain in GRAINS:
+                values = self.values[grain]
+                self.values[grain] = np.concatenate([values, np.zeros((len(values), 1, len(METRICS)))], axis=1)
+        return self.categories.index(category)
+
+    def set_products(self, product_df):
+        # product_code -> category lookup, new categories and products are added
+        codes = product_df['product_code'].to_numpy()
+        categories = product_df['product_category'].astype(object).to_numpy()
+        size = max(len(self.product_categories), int(codes.max()) + 1 if len(codes) else 0)
+        lookup = np.full(size, -1, dtype=np.int64)
+        lookup[:len(self.product_categories)] = self.product_categories
+        for category in pd.unique(categories[pd.notna(categories)]):
+            index = self._category_index(category)
+            lookup[codes[categories == category]] = index
+        self.product_categories = lookup
+        return self
+
+    def _categories_of(self, product_codes):
+        product_codes = np.asarray(product_codes)
+        known = (product_codes >= 0) & (product_codes < len(self.product_categories))
+        categories = np.full(len(product_codes), -1, dtype=np.int64)
+        categories[known] = self.product_categories[product_codes[known]]
+        if (categories < 0).any():
+            categories[categories < 0] = self._category_index(UNKNOWN_CATEGORY)
+        return categories
+
+    def _add(self, dates, product_codes, metrics):
+        # metrics: metric name -> weights per row
+        categories = self._categories_of(product_codes)
+        metric_index = [METRICS.index(metric) for metric in metrics]
+        n_categories = len(self.categories)
+        for grain in GRAINS:
+            codes = period_codes(dates, grain)
+            dated = codes >= 0
+            if not dated.any():
+                continue
+            codes = codes[dated]
+            values = self.values[grain]
+
+            # grow the period axis to cover the new rows
+            start = min(codes.min(), self.starts[grain]) if len(values) else codes.min()
+            end = max(codes.max() + 1, self.starts[grain] + len(values)) if len(values) else codes.max() + 1
+            if len(values) == 0 or start < self.starts[grain] or end > self.starts[grain] + len(values):
+                grown = np.zeros((end - start, n_categories, len(METRICS)))
+                offset = self.starts[grain] - start
+                grown[offset:offset + len(values)] = values
+                values, self.starts[grain] = grown, start
+
+            cells = (codes - self.starts[grain]) * n_categories + categories[dated]
+            for index, weights in zip(metric_index, metrics.values()):
+                values[:, :, index] += np.bincount(
+                    cells, weights=np.asarray(weights, dtype=np.float64)[dated], minlength=len(values) * n_categories
+                ).reshape(len(values), n_categories)
+            self.values[grain] = values
+        return self
+
+    def add_orders(self, order_df):
+        paid = np.nan_to_num(order_df['paid_amt'].to_numpy(dtype=np.float64, na_value=np.nan))
+        return self._add(order_df['order_date'], order_df['product_code'].to_numpy(),
+                         {'order_count': np.ones(len(order_df)), 'revenue': paid})
+
+    def add_reviews(self, reviews_df):
+        ratings = reviews_df['star_ratings'].to_numpy(dtype=np.float64, na_value=np.nan)
+        rated = ~np.isnan(ratings)
+        return self._add(reviews_df['review_date'], reviews_df['product_code'].to_numpy(),
+                         {'review_count': np.ones(len(reviews_df)), 'rating_sum': np.where(rated, ratings, 0.0),
+                          'rating_count': rated.astype(np.float64)})
+
+    def query(self, grain, start=None, end=None, metrics=METRICS, categories=None, by_category=False):
+        # metrics per period between start and end (inclusive), summed over categories unless by_category
+        values = self.values[grain]
+        first = self.starts[grain]
+        lo = 0 if start is None else max(int(period_codes([start], grain)[0]) - first, 0)
+        hi = len(values) if end is None else min(int(period_codes([end], grain)[0]) - first + 1, len(values))
+        hi = max(hi, lo)
+
+        selected = np.arange(len(self.categories)) if categories is None \
+            else np.array([self.categories.index(c) for c in categories if c in self.categories], dtype=np.int64)
+        block = values[lo:hi][:, selected][:, :, [METRICS.index(metric) for metric in metrics]]
+        periods = period_index(np.arange(first + lo, first + hi), grain)
+        if by_category:
+            index = pd.MultiIndex.from_product([periods, [self.categories[i] for i in selected]],
+                                               names=[grain, 'product_category'])
+            return pd.DataFrame(block.reshape(-1, len(metrics)), index=index, columns=list(metrics))
+        return pd.DataFrame(block.sum(axis=1), index=periods, columns=list(metrics))
+
+    def save(self, path):
+        # written to a temporary directory that then replaces the cube, so a crash part-way never leaves
+        # arrays that disagree with the manifest's order files
+        temporary, previous = f'{path}.{os.getpid()}.tmp', f'{path}.{os.getpid()}.old'
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        np.save(os.path.join(temporary, 'product_categories.npy'), self.product_categories)
+        for grain in GRAINS:
+            np.save(os.path.join(temporary, f'{grain}.npy'), self.values[grain])
+        manifest = {
+            'version': ARTIFACT_VERSION,
+            'categories': [str(category) for category in self.categories],
+            'starts': {grain: int(start) for grain, start in self.starts.items()},
+            'metrics': list(METRICS),
+            'order_files': self.order_files,
+        }
+        with open(os.path.join(temporary, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        # a directory can't replace a non-empty one, so the old cube is moved aside first; a crash in
+        # between leaves no cube, which is rebuilt from the tables
+        if os.path.exists(path):
+            os.replace(path, previous)
+        try:
+            os.replace(temporary, path)
+        except OSError:
+            # another process saved the cube in between, for the same tables
+            shutil.rmtree(temporary, ignore_errors=True)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest['version'] != ARTIFACT_VERSION or manifest['metrics'] != list(METRICS):
+            raise ValueError(f"Unsupported rollup cube version {manifest['version']} (expected {ARTIFACT_VERSION}).")
+        # loaded into memory, add_orders updates the arrays in place
+        return cls(manifest['categories'], np.load(os.path.join(path, 'product_categories.npy')), manifest['starts'],
+                   {grain: np.load(os.path.join(path, f'{grain}.npy')) for grain in GRAINS}, manifest['order_files'])
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def load_rollups(directory=DATA_DIR, cache_dir=None, tables=None):
+    # the cube for the current tables, built and saved on first use and updated with appended orders;
+    # tables maps table names to the stored tables the caller has in memory, used instead of reading them
+    cache_dir = cache_dir or os.path.join(directory, 'rollups')
+    path = os.path.join(cache_dir, data_version(directory, ('reviews', 'product')))
+    order_files = {os.path.relpath(file, directory): _file_stamp(file) for file in table_files('order', directory)}
+
+    if os.path.exists(os.path.join(path, 'manifest.json')):
+        cube = RollupCube.load(path)
+        if all(order_files.get(file) == stamp for file, stamp in cube.order_files.items()):
+            new_files = [file for file in order_files if file not in cube.order_files]
+            for file in new_files:
+                cube.add_orders(pd.read_parquet(os.path.join(directory, file), columns=ORDER_COLUMNS))
+                cube.order_files[file] = order_files[file]
+            if new_files:
+                cube.save(path)
+            return cube
+
+    tables = tables or {}
+
+    def table(name, columns):
+        return tables[name][columns] if name in tables else read_table(name, directory, columns)
+
+    cube = RollupCube.build(
+        table('order', ORDER_COLUMNS),
+        table('reviews', ['product_code', 'star_ratings', 'review_date']),
+        table('product', ['product_code', 'product_category']),
+    )
+    cube.order_files = order_files
+    cube.save(path)
+    return cube
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Fitted segmentations for assigning new customers without refitting.
+
+`clustering.py` saves, for each segmentation, the feature names, the scaler
+mean and scale and the centroids in scaled space, together with the stable
+segment id and name of every centroid. `assign_segments(features)` scales a
+feature frame (columns as in `FeatureStore.customer_features()`) and labels
+every row with its nearest centroid in one matrix product per segmentation.
+
+The model is a versioned directory of .npy arrays plus a manifest, like the
+recommender artifact, and is memory-mapped on load.
+"""
+
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+ARTIFACT_VERSION = 1
+
+SEGMENT_MODEL = 'segment_model'
+
+
+class SegmentModel:
+    def __init__(self, segmentations=None):
+        # name -> features, mean, scale, centroids (scaled), segment_ids, labels
+        self.segmentations = segmentations or {}
+
+    def add(self, name, features, scaler, centroids, segment_ids, labels):
+        # centroids in the scaler's space, one segment id per centroid, labels: segment id -> name
+        self.segmentations[name] = {
+            'features': list(features),
+            'mean': np.asarray(scaler.mean_, dtype=np.float64),
+            'scale': np.asarray(scaler.scale_, dtype=np.float64),
+            'centroids': np.asarray(centroids, dtype=np.float64),
+            'segment_ids': np.asarray(segment_ids, dtype=np.int64),
+            'labels': {int(segment_id): name for segment_id, name in labels.items()},
+        }
+        return self
+
+    def assign(self, name, features):
+        # segment id per row, by nearest centroid in scaled space
+        segmentation = self.segmentations[name]
+        X = features.reindex(columns=segmentation['features'], fill_value=0).to_numpy(dtype=np.float64)
+        X = (X - segmentation['mean']) / segmentation['scale']
+        centroids = segmentation['centroids']
+        # argmin of |x - c|² without the |x|² term, which is the same for every centroid
+        distances = (centroids ** 2).sum(axis=1) - 2 * X @ centroids.T
+        return segmentation['segment_ids'][np.argmin(distances, axis=1)]
+
+    def assign_segments(self, features):
+        # <name>_segment_id and <name>_segment columns for every segmentation
+        assigned = pd.DataFrame(index=features.index)
+        if 'customer_code' in features.columns:
+            assigned['customer_code'] = features['customer_code']
+        for name, segmentation in self.segmentations.items():
+            segment_ids = self.assign(name, features)
+            assigned[f'{name}_segment_id'] = segment_ids
+            assigned[f'{name}_segment'] = pd.Series(segment_ids, index=features.index).map(segmentation['labels'])
+        return assigned
+
+    def save(self, path=SEGMENT_MODEL):
+        os.makedirs(path, exist_ok=True)
+        manifest = {'version': ARTIFACT_VERSION, 'segmentations': {}}
+        for name, segmentation in self.segmentations.items():
+            for array in ('mean', 'scale', 'centroids', 'segment_ids'):
+                np.save(os.path.join(path, f'{name}_{array}.npy'), np.ascontiguousarray(segmentation[array]))
+            manifest['segmentations'][name] = {
+                'features': segmentation['features'],
+                'labels': {str(segment_id): label for segment_id, label in segmentation['labels'].items()},
+            }
+        # the manifest is written last, so a partial save is never loadable
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(cls, path=SEGMENT_MODEL, mmap_mode='r'):
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest['version'] != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported segment model version {manifest['version']} "
+                             f"(expected {ARTIFACT_VERSION}).")
+
+        segmentations = {}
+        for name, entry in manifest['segmentations'].items():
+            segmentation = {array: np.load(os.path.join(path, f'{name}_{array}.npy'), mmap_mode=mmap_mode)
+                            for array in ('mean', 'scale', 'centroids', 'segment_ids')}
+            segmentation['features'] = entry['features']
+            segmentation['labels'] = {int(segment_id): label for segment_id, label in entry['labels'].items()}
+            segmentations[name] = segmentation
+        return cls(segmentations)
+
+
+@lru_cache(maxsize=None)
+def _load_model(path):
+    return SegmentModel.load(path)
+
+
+def assign_segments(features, path=SEGMENT_MODEL):
+    # label customer features with the saved segmentations, the model is loaded once per path
+    return _load_model(path).assign_segments(features)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Stable segment ids across clustering runs.
+
+K-Means numbers its clusters arbitrarily, so the same segment can get a
+different cluster id on every refit. `SegmentRegistry` persists the centroids
+of each segmentation with a stable segment id and name. New centroids are
+matched to the persisted ones with the Hungarian algorithm on their distance
+in scaled feature space. Matched clusters keep their id and name; clusters
+without a match, or farther than `max_distance`, get new ids. Segments that
+find no match are kept, so they can match again on a later run. The registry
+is stored next to the tables, in `<data dir>/segment_registry.json`.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+
+from storage import DATA_DIR
+
+SEGMENT_REGISTRY = os.path.join(DATA_DIR, 'segment_registry.json')
+
+
+class SegmentRegistry:
+    def __init__(self, path=SEGMENT_REGISTRY):
+        self.path = path
+        self.segmentations = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.segmentations = json.load(f)
+
+    def save(self):
+        # written under a temporary name and renamed, so a crash never leaves a truncated registry
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.segmentations, f, indent=2)
+        os.replace(temporary, self.path)
+
+    def previous_centroids(self, segmentation, features):
+        # persisted centroids of the active segments as a DataFrame over `features`, or None
+        entry = self.segmentations.get(segmentation)
+        if entry is None:
+            return None
+        active = [segment for segment in entry['segments'] if segment['active']]
+        if not active:
+            return None
+        return pd.DataFrame(self._centroids(active, features), columns=list(features))
+
+    def assign(self, segmentation, centroids, features, names=None, scale=None, max_distance=None):
+        # stable segment id per cluster; names maps cluster -> name for clusters that get a new id
+        centroids = np.asarray(centroids, dtype=np.float64)
+        features = list(features)
+        scale = np.ones(len(features)) if scale is None else np.asarray(scale, dtype=np.float64)
+        names = names or {}
+        entry = self.segmentations.setdefault(segmentation, {'next_id': 0, 'segments': []})
+        segments = entry['segments']
+
+        # Hungarian matching on the distances between scaled centroids
+        segment_ids = np.full(len(centroids), -1, dtype=np.int64)
+        if segments:
+            previous = self._centroids(segments, features)
+            distances = np.sqrt((((centroids[:, None, :] - previous[None, :, :]) / scale) ** 2).sum(axis=2))
+            rows, cols = linear_sum_assignment(distances)
+            for row, col in zip(rows, cols):
+                if max_distance is None or distances[row, col] <= max_distance:
+                    segment_ids[row] = segments[col]['id']
+
+        by_id = {segment['id']: segment for segment in segments}
+        for segment in segments:
+            segment['active'] = False
+        for cluster, centroid in enumerate(centroids):
+            if segment_ids[cluster] < 0:
+                segment_ids[cluster] = entry['next_id']
+                entry['next_id'] += 1
+                by_id[segment_ids[cluster]] = {
+                    'id': int(segment_ids[cluster]),
+                    'name': names.get(cluster, f"Segment {segment_ids[cluster] + 1}"),
+                }
+                segments.append(by_id[segment_ids[cluster]])
+            # matched segments follow the drift of their centroid
+            by_id[segment_ids[cluster]].update(
+                {'centroid': dict(zip(features, centroid.tolist())), 'active': True})
+
+        entry['segments'] = sorted(segments, key=lambda segment: segment['id'])
+        return segment_ids
+
+    def labels(self, segmentation):
+        # segment id -> name for the active segments
+        return {segment['id']: segment['name']
+                for segment in self.segmentations[segmentation]['segments'] if segment['active']}
+
+    @staticmethod
+    def _centroids(segments, features):
+        # features a centroid was not fitted on, like a new product category, count as 0
+        return np.array([[segment['centroid'].get(feature, 0.0) for feature in features]
+                         for segment in segments], dtype=np.float64)
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+"""K-Means helpers shared by the segmentations in `clustering.py`.
+
+`k_sweep` fits the candidate cluster counts across a process pool and
+returns inertia (WCSS) and silhouette per k. The k values are split into
+contiguous chains, one per worker; inside a chain every fit is seeded with
+the previous k's centroids plus one new centroid drawn by k-means++ style
+D² sampling, so each fit starts close to a good solution. By default each
+chain holds at least `MIN_CHAIN_LENGTH` k values, and the sweep's
+`warm_started` column shows which fits were seeded this way. `select_k` picks
+k from the sweep by silhouette or by the elbow of the WCSS curve.
+
+`StreamingSegmentation` is the bounded-memory mode for large customer bases:
+it reads the cached customer features from Parquet in row batches, keeps
+running `StandardScaler` statistics and fits `MiniBatchKMeans` with
+`partial_fit`, so only one chunk is in memory at a time.
+`compare_with_full_batch` reports its quality against a full `KMeans` fit.
+
+`OptimalSegmentation1D` segments a single feature such as total spending
+exactly: a ckmeans-style dynamic program over the sorted values gives the
+minimal within-cluster sum of squares for every k up to `max_k` in one run,
+with clusters numbered from the lowest values up.
+
+    python src/segmentation.py seasonal --k 4 --output customer_seasonal_stream.csv
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import adjusted_rand_score, silhouette_score
+from sklearn.preprocessing import StandardScaler
+
+from features import CATEGORY_PREFIX
+
+# segmentation -> feature columns, as used in clustering.py
+SEGMENTATIONS = {
+    'spending': ['total_spending'],
+    'preferences': CATEGORY_PREFIX,
+    'seasonal': ['weighted_holiday_spending', 'non_holiday_spending', 'holiday_ratio', 'order_count'],
+}
+
+
+# fewest k values per chain by default, so every chain warm-starts at least one fit
+MIN_CHAIN_LENGTH = 2
+
+
+def _add_centroid(X, centers, rng):
+    # next seed by D² sampling against the current centroids
+    distances = ((X[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+    total = distances.sum()
+    index = rng.choice(len(X), p=distances / total) if total > 0 else rng.integers(len(X))
+    return np.vstack([centers, X[index]])
+
+
+def _fit_chain(X, k_values, warm_start, random_state, silhouette_sample):
+    rng = np.random.default_rng(random_state)
+    results = []
+    centers = None
+    for k in k_values:
+        warm = warm_start and centers is not None and len(centers) == k - 1
+        if warm:
+            kmeans = KMeans(n_clusters=k, init=_add_centroid(X, centers, rng), n_init=1, random_state=random_state)
+        else:
+            kmeans = KMeans(n_clusters=k, random_state=random_state)
+        labels = kmeans.fit_predict(X)
+        centers = kmeans.cluster_centers_
+
+        # silhouette needs at least two clusters and fewer clusters than points
+        silhouette = np.nan
+        if 1 < len(np.unique(labels)) < len(X):
+            silhouette = silhouette_score(X, labels, sample_size=min(silhouette_sample, len(X)),
+                                          random_state=random_state)
+        results.append({'k': k, 'inertia': kmeans.inertia_, 'silhouette': silhouette, 'warm_started': warm})
+    return results
+
+
+def _pool_context():
+    # the analysis scripts run at module level without a __main__ guard,
+    # so workers are forked rather than spawned (which would re-run them)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def k_sweep(X, k_values=range(1, 11), n_jobs=None, warm_start=True, random_state=42, silhouette_sample=10000):
+    X = np.asarray(X, dtype=np.float64)
+    k_values = [k for k in sorted(k_values) if k <= len(X)]
+    # by default no more chains than leave MIN_CHAIN_LENGTH k values in each, whatever the core count
+    n_jobs = n_jobs or min(os.cpu_count() or 1, math.ceil(len(k_values) / MIN_CHAIN_LENGTH))
+    n_jobs = max(1, min(n_jobs, len(k_values)))
+
+    # contiguous chains keep consecutive k values together for warm starts
+    chains = [list(chain) for chain in np.array_split(k_values, n_jobs) if len(chain)]
+    if n_jobs == 1:
+        results = [_fit_chain(X, chain, warm_start, random_state, silhouette_sample) for chain in chains]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=_pool_context()) as pool:
+            futures = [pool.submit(_fit_chain, X, chain, warm_start, random_state, silhouette_sample)
+                       for chain in chains]
+            results = [future.result() for future in futures]
+
+    return pd.DataFrame([row for chain in results for row in chain],
+                        columns=['k', 'inertia', 'silhouette', 'warm_started'])
+
+
+def select_k(sweep, method='elbow'):
+    # 'silhouette': k with the highest silhouette,
+    # 'elbow': k farthest below the line joining the first and last WCSS values
+    if method == 'silhouette':
+        scored = sweep.dropna(subset=['silhouette'])
+        if scored.empty:
+            raise ValueError("No k in the sweep has a silhouette score.")
+        return int(scored.loc[scored['silhouette'].idxmax(), 'k'])
+    if method == 'elbow':
+        k = sweep['k'].to_numpy(dtype=np.float64)
+        inertia = sweep['inertia'].to_numpy(dtype=np.float64)
+        if len(k) < 3:
+            return int(k[-1])
+        line = inertia[0] + (inertia[-1] - inertia[0]) * (k - k[0]) / (k[-1] - k[0])
+        return int(k[np.argmax(line - inertia)])
+    raise ValueError(f"Unknown method '{method}', expected 'silhouette' or 'elbow'.")
+
+
+def warm_kmeans(n_clusters, previous=None, random_state=42):
+    # KMeans seeded with the previous run's centroids (scaled) when the cluster count is unchanged
+    if previous is not None and len(previous) == n_clusters:
+        return KMeans(n_clusters=n_clusters, init=np.asarray(previous), n_init=1, random_state=random_state)
+    return KMeans(n_clusters=n_clusters, random_state=random_state)
+
+
+# levels named for small numbers of tiers, lowest first
+TIER_LEVELS = {
+    1: ["Moderate"],
+    2: ["Low", "High"],
+    3: ["Low", "Moderate", "High"],
+    4: ["Low", "Moderate", "High", "Very High"],
+    5: ["Very Low", "Low", "Moderate", "High", "Very High"],
+}
+
+
+def tier_labels(noun, k):
+    # names for k clusters sorted lowest first, from each cluster's rank; past five tiers the ranks are
+    # split into five quantile bands and the tiers sharing a band are numbered from the lowest
+    if k in TIER_LEVELS:
+        return {tier: f"{level} {noun}" for tier, level in enumerate(TIER_LEVELS[k])}
+    bands = [tier * len(TIER_LEVELS) // k for tier in range(k)]
+    levels = TIER_LEVELS[len(TIER_LEVELS)]
+    labels = {}
+    for tier, band in enumerate(bands):
+        name = f"{levels[band]} {noun}"
+        labels[tier] = name if bands.count(band) == 1 else f"{name} {bands[:tier].count(band) + 1}"
+    return labels
+
+
+def feature_labels(centers, features, names, default):
+    # cluster -> name of the feature its scaled centroid is furthest above average on, for any k;
+    # names maps feature -> name and each name goes to the cluster highest on its features, clusters
+    # left without one are `default`, numbered when there are several
+    centers = np.asarray(centers, dtype=np.float64)
+    features = [str(feature) for feature in features]
+    named = [i for i, feature in enumerate(features) if feature in names]
+    labels = {}
+    # (cluster, feature) pairs from the highest scaled value down, ties broken by cluster then feature
+    pairs = sorted(((-centers[c, i], c, i) for c in range(len(centers)) for i in named if centers[c, i] > 0))
+    for _, cluster, i in pairs:
+        if cluster not in labels and names[features[i]] not in labels.values():
+            labels[cluster] = names[features[i]]
+    rest = [cluster for cluster in range(len(centers)) if cluster not in labels]
+    for n, cluster in enumerate(rest):
+        labels[cluster] = default if n == 0 else f"{default} {n + 1}"
+    return labels
+
+
+class OptimalSegmentation1D:
+    # Within-cluster sums of squares of contiguous runs of the sorted distinct values are
+    # read from prefix sums. Each level q of the DP solves
+    #   cost[q][i] = min_j cost[q-1][j-1] + sse(j, i)
+    # whose best j never decreases with i, so it is filled by divide and conquer,
+    # all the subproblems of one recursion depth at once.
+
+    def __init__(self, values, max_k=10):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0 or np.isnan(values).any():
+            raise ValueError("OptimalSegmentation1D needs a non-empty array without NaN values.")
+        self.values, self.weights = np.unique(values, return_counts=True)
+        self.max_k = min(max_k, len(self.values))
+
+        centered = self.values - np.average(self.values, weights=self.weights)
+        self._w = np.concatenate([[0.0], np.cumsum(self.weights)])
+        self._s1 = np.concatenate([[0.0], np.cumsum(self.weights * centered)])
+        self._s2 = np.concatenate([[0.0], np.cumsum(self.weights * centered ** 2)])
+
+        n = len(self.values)
+        self.cost = np.full((self.max_k, n), np.inf)
+        self.split = np.zeros((self.max_k, n), dtype=np.int64)
+        self.cost[0] = self._sse(np.zeros(n, dtype=np.int64), np.arange(n))
+        for q in range(1, self.max_k):
+            self._fill_level(q)
+
+    def _sse(self, j, i):
+        # weighted sum of squares of values[j..i]
+        w = self._w[i + 1] - self._w[j]
+        s1 = self._s1[i + 1] - self._s1[j]
+        return np.maximum(self._s2[i + 1] - self._s2[j] - s1 * s1 / w, 0.0)
+
+    def _fill_level(self, q):
+        n = len(self.values)
+        previous, cost, split = self.cost[q - 1], self.cost[q], self.split[q]
+        # pending subproblems: rows lo..hi whose best split lies in opt_lo..opt_hi
+        lo, hi = np.array([q]), np.array([n - 1])
+        opt_lo, opt_hi = np.array([q]), np.array([n - 1])
+        while len(lo):
+            mid = (lo + hi) // 2
+            first, last = opt_lo, np.minimum(opt_hi, mid)
+            lengths = last - first + 1
+            starts = np.cumsum(lengths) - lengths
+            j = np.arange(lengths.sum()) + np.repeat(first - starts, lengths)
+            # sse(j, mid) with the mid-side prefix sums repeated rather than gathered
+            w = np.repeat(self._w[mid + 1], lengths) - self._w[j]
+            s1 = np.repeat(self._s1[mid + 1], lengths) - self._s1[j]
+            s2 = np.repeat(self._s2[mid + 1], lengths) - self._s2[j]
+            candidates = previous[j - 1] + np.maximum(s2 - s1 * s1 / w, 0.0)
+
+            # first argmin within each subproblem's candidates
+            best = np.minimum.reduceat(candidates, starts)
+            hits = np.flatnonzero(candidates == np.repeat(best, lengths))
+            owner = np.searchsorted(starts, hits, side='right')
+            best_j = j[hits[np.r_[True, owner[1:] != owner[:-1]]]]
+            cost[mid], split[mid] = best, best_j
+
+            left, right = lo < mid, mid < hi
+            lo, hi = np.concatenate([lo[left], mid[right] + 1]), np.concatenate([mid[left] - 1, hi[right]])
+            opt_lo = np.concatenate([opt_lo[left], best_j[right]])
+            opt_hi = np.concatenate([best_j[left], opt_hi[right]])
+
+    def sweep(self):
+        # same layout as k_sweep, so select_k and plot_sweep apply
+        return pd.DataFrame({
+            'k': np.arange(1, self.max_k + 1),
+            'inertia': self.cost[:, -1],
+            'silhouette': np.nan,
+            'warm_started': False,
+        })
+
+    def _bounds(self, k):
+        # first distinct-value index of each of the k clusters
+        if not 1 <= k <= self.max_k:
+            raise ValueError(f"k must be between 1 and {self.max_k}.")
+        starts = np.zeros(k, dtype=np.int64)
+        end = len(self.values) - 1
+        for q in range(k - 1, 0, -1):
+            starts[q] = self.split[q, end]
+            end = starts[q] - 1
+        return starts
+
+    def breaks(self, k):
+        # lowest value of each cluster
+        return self.values[self._bounds(k)]
+
+    def labels(self, values, k):
+        # cluster per value, 0 for the lowest values
+        return np.searchsorted(self.breaks(k), np.asarray(values, dtype=np.float64), side='right') - 1
+
+    def centers(self, k):
+        starts = self._bounds(k)
+        sums = np.add.reduceat(self.values * self.weights, starts)
+        return sums / np.add.reduceat(self.weights, starts)
+
+
+def plot_sweep(sweep, title):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.plot(sweep['k'], sweep['inertia'], marker='o', linestyle='--')
+    ax.set_xlabel('Number of Clusters')
+    ax.set_ylabel('Within-Cluster Sum of Squares (WCSS)')
+    ax.set_title(title)
+    ax.set_xticks(sweep['k'])
+    ax.grid()
+
+    silhouette_ax = ax.twinx()
+    silhouette_ax.plot(sweep['k'], sweep['silhouette'], marker='s', color='tab:orange')
+    silhouette_ax.set_ylabel('Silhouette Score')
+    plt.show()
+
+
+def segmentation_columns(path, segmentation):
+    # feature columns of a segmentation, every category count column for 'preferences'
+    columns = SEGMENTATIONS[segmentation]
+    if isinstance(columns, str):
+        columns = [c for c in pq.ParquetFile(path).schema_arrow.names if c.startswith(columns)]
+    return list(columns)
+
+
+def feature_chunks(path, columns, chunk_size=100000, key='customer_code', drop_empty=False):
+    # (keys, features) per row batch of a Parquet feature file;
+    # drop_empty skips rows whose features are all zero, like customers without categorized orders
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=[key] + columns):
+        chunk = batch.to_pandas()
+        X = chunk[columns].to_numpy(dtype=np.float64)
+        keep = X.any(axis=1) if drop_empty else slice(None)
+        yield chunk[key].to_numpy()[keep], X[keep]
+
+
+class StreamingSegmentation:
+    def __init__(self, n_clusters, batch_size=4096, n_epochs=3, random_state=42):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.n_epochs = n_epochs
+        self.random_state = random_state
+
+    def fit(self, chunks):
+        # chunks: callable returning a fresh iterator of (keys, features) chunks, one per pass
+        self.scaler = StandardScaler()
+        for _, X in chunks():
+            if len(X):
+                self.scaler.partial_fit(X)
+
+        self.kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, batch_size=self.batch_size,
+                                      random_state=self.random_state, n_init=3)
+        pending = np.empty((0, self.scaler.n_features_in_))
+        for _ in range(self.n_epochs):
+            for _, X in chunks():
+                X = self.scaler.transform(X) if len(X) else X
+                if not hasattr(self.kmeans, 'cluster_centers_'):
+                    # the first partial_fit initializes the centroids and needs enough rows
+                    pending = np.vstack([pending, X])
+                    if len(pending) < max(self.batch_size, 3 * self.n_clusters):
+                        continue
+                    X, pending = pending, pending[:0]
+                for start in range(0, len(X), self.batch_size):
+                    self.kmeans.partial_fit(X[start:start + self.batch_size])
+        if not hasattr(self.kmeans, 'cluster_centers_'):
+            if len(pending) < self.n_clusters:
+                raise ValueError(f"Need at least {self.n_clusters} rows to fit {self.n_clusters} clusters.")
+            self.kmeans.partial_fit(pending)
+        return self
+
+    @property
+    def cluster_centers_(self):
+        return self.scaler.inverse_transform(self.kmeans.cluster_centers_)
+
+    def predict(self, X):
+        return self.kmeans.predict(self.scaler.transform(X))
+
+    def predict_chunks(self, chunks):
+        # (keys, labels) per chunk
+        for keys, X in chunks():
+            yield keys, self.predict(X) if len(X) else np.empty(0, dtype=np.int32)
+
+
+def compare_with_full_batch(X, streaming, random_state=42):
+    # streaming model against a full KMeans fit on the same features, in the full-batch scaled space
+    start = time.perf_counter()
+    scaler = StandardScaler().fit(X)
+    scaled = scaler.transform(X)
+    full = KMeans(n_clusters=streaming.n_clusters, random_state=random_state).fit(scaled)
+    full_time = time.perf_counter() - start
+
+    streaming_labels = streaming.predict(X)
+    centers = scaler.transform(streaming.cluster_centers_)
+    streaming_inertia = float(((scaled - centers[streaming_labels]) ** 2).sum())
+    return {
+        'n_customers': len(X),
+        'n_clusters': streaming.n_clusters,
+        'full_inertia': float(full.inertia_),
+        'streaming_inertia': streaming_inertia,
+        'inertia_ratio': streaming_inertia / full.inertia_ if full.inertia_ else np.nan,
+        'adjusted_rand_index': float(adjusted_rand_score(full.labels_, streaming_labels)),
+        'full_fit_s': full_time,
+    }
+
+
+def segment_streaming(path, segmentation, n_clusters, output, chunk_size=100000, **options):
+    # fit on the Parquet feature file chunk by chunk and write the labels to a CSV chunk by chunk
+    columns = segmentation_columns(path, segmentation)
+    drop_empty = segmentation == 'preferences'
+
+    def chunks():
+        return feature_chunks(path, columns, chunk_size, drop_empty=drop_empty)
+
+    model = StreamingSegmentation(n_clusters, **options).fit(chunks)
+    header = True
+    for keys, labels in model.predict_chunks(chunks):
+        pd.DataFrame({'customer_code': keys, 'cluster': labels}).to_csv(
+            output, mode='w' if header else 'a', header=header, index=False)
+        header = False
+    return model
+
+
+if __name__ == '__main__':
+    from feature_store import FeatureStore
+
+    parser = argparse.ArgumentParser(description='Segment customers from the cached features in bounded memory.')
+    parser.add_argument('segmentation', choices=sorted(SEGMENTATIONS))
+    parser.add_argument('--k', type=int, default=4)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=4096)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--compare', action='store_true', help='also fit full-batch KMeans and report quality')
+    args = parser.parse_args()
+
+    path = FeatureStore().path()
+    output = args.output or f'customer_{args.segmentation}_stream_segments.csv'
+    model = segment_streaming(path, args.segmentation, args.k, output, args.chunk_size,
+                              batch_size=args.batch_size, n_epochs=args.epochs)
+    print(f'Wrote {output}')
+    if args.compare:
+        columns = segmentation_columns(path, args.segmentation)
+        X = np.vstack([X for _, X in feature_chunks(path, columns, args.chunk_size,
+                                                     drop_empty=args.segmentation == 'preferences')])
+        print(pd.Series(compare_with_full_batch(X, model)))
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""Mergeable quantile and distinct-count sketches for large tables.
+
+`QuantileSketch` is a KLL-style sketch: values are kept in levels of sorted
+compactors whose items weigh 2**level; a full level is halved (every other
+item from a random offset) into the next one. `HyperLogLog` estimates
+distinct counts from 2**p one-byte registers of hashed values. Both have
+`update` (a NumPy chunk at a time) and `merge`, so chunks can be sketched
+independently and combined.
+
+`sketch_table` reads a stored table's row groups in a process pool, sketches
+each column chunk by chunk and merges the results, so quantiles, outlier
+bounds and cardinalities come from one streaming pass instead of whole
+columns in memory. `sketch_frame` sketches a table that is already in
+memory in batches, without reading it again.
+"""
+
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from storage import DATA_DIR, apply_schema, table_files
+
+
+class QuantileSketch:
+    def __init__(self, k=1024, seed=None):
+        # k is the capacity of the top level; lower levels shrink by 2/3 per level
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.min, self.max = np.inf, -np.inf
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(8, math.ceil(self.k * (2 / 3) ** depth))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.count += len(values)
+            self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                items = np.sort(items)
+                # an odd item out stays on this level
+                kept, items = (items[:1], items[1:]) if len(items) % 2 else (items[:0], items)
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[self.rng.integers(2)::2]])
+            level += 1
+
+    def quantile(self, q):
+        # approximate quantile(s) for q in [0, 1]
+        q = np.asarray(q, dtype=np.float64)
+        if self.count == 0:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, ranks = items[order], np.cumsum(weights[order])
+        positions = np.searchsorted(ranks, q * ranks[-1], side='left').clip(0, len(items) - 1)
+        result = np.where(q <= 0, self.min, np.where(q >= 1, self.max, items[positions]))
+        return result if q.ndim else float(result)
+
+
+class HyperLogLog:
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values):
+        values = pd.Series(values)
+        values = values[values.notna()].to_numpy()
+        if len(values) == 0:
+            return self
+        hashes = pd.util.hash_array(values)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        # rank = leading zeros of the remaining bits + 1; the guard bit caps it at 64 - p + 1
+        rest = (hashes << np.uint64(self.p)) | np.uint64(1 << (self.p - 1))
+        for shift in (1, 2, 4, 8, 16, 32):
+            rest |= rest >> np.uint64(shift)
+        rank = (65 - np.bitwise_count(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Only HyperLogLog sketches with the same precision can be merged.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros:
+            # linear counting for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class ColumnSketch:
+    def __init__(self, numeric, k=1024, p=14, seed=None):
+        self.rows = 0
+        self.nulls = 0
+        self.quantiles = QuantileSketch(k, seed) if numeric else None
+        self.distinct = HyperLogLog(p)
+
+    def update(self, values):
+        self.rows += len(values)
+        self.nulls += int(values.isna().sum())
+        if self.quantiles is not None:
+            self.quantiles.update(values.to_numpy(dtype=np.float64, na_value=np.nan))
+        self.distinct.update(values)
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.nulls += other.nulls
+        if self.quantiles is not None:
+            self.quantiles.merge(other.quantiles)
+        self.distinct.merge(other.distinct)
+        return self
+
+
+def iqr_bounds(q1, q3, factor=1.5):
+    # lower and upper outlier bounds around the interquantile range
+    iqr = q3 - q1
+    return q1 - factor * iqr, q3 + factor * iqr
+
+
+def sketch_iqr_bounds(sketch, lower=0.15, upper=0.80, factor=1.5):
+    # outlier bounds from a QuantileSketch, with the quantiles remove_outliers_iqr uses
+    q1, q3 = sketch.quantile([lower, upper])
+    return iqr_bounds(q1, q3, factor)
+
+
+def _is_numeric(series):
+    return (pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)) \
+        or pd.api.types.is_datetime64_any_dtype(series)
+
+
+def _sketch_chunks(chunks, columns, k, p, seed):
+    sketches = {}
+    for chunk in chunks:
+        for column in columns:
+            values = chunk[column]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                # dates are sketched as nanosecond timestamps
+                timestamps = values.to_numpy(dtype='datetime64[ns]').view(np.int64)
+                values = pd.Series(np.where(values.notna(), timestamps, np.nan), name=column)
+            if column not in sketches:
+                sketches[column] = ColumnSketch(_is_numeric(values), k, p, seed)
+            sketches[column].update(values)
+    return sketches
+
+
+def sketch_frame(df, columns, batch_size=100000, k=1024, p=14, seed=42):
+    # column -> ColumnSketch over a DataFrame already in memory, batch by batch
+    chunks = (df.iloc[start:start + batch_size] for start in range(0, len(df), batch_size))
+    return _sketch_chunks(chunks, list(columns), k, p, seed)
+
+
+def _sketch_row_groups(row_groups, columns, batch_size, k, p, seed):
+    # row_groups: (file, row group) pairs
+    def chunks():
+        for path, group in row_groups:
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, row_groups=[group], columns=columns):
+                yield batch.to_pandas()
+    return _sketch_chunks(chunks(), columns, k, p, seed)
+
+
+def _pool_context():
+    # forked workers, the analysis scripts have no __main__ guard
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+def sketch_table(name, columns, directory=DATA_DIR, n_jobs=None, batch_size=100000, k=1024, p=14, seed=42):
+    # column -> ColumnSketch over a stored table, row groups sketched in parallel and merged
+    columns = list(columns)
+    files = table_files(name, directory)
+    if files[0].endswith('.csv'):
+        # CSV exports are read sequentially in chunks
+        chunks = pd.read_csv(files[0], usecols=columns, chunksize=batch_size)
+        return _sketch_chunks((apply_schema(chunk, name) for chunk in chunks), columns, k, p, seed)
+
+    # every row group of every file (one file, or the table's partitions), split across the workers
+    row_groups = [(path, group) for path in files for group in range(pq.ParquetFile(path).num_row_groups)]
+    n_jobs = max(1, min(n_jobs or os.cpu_count() or 1, len(row_groups)))
+    groups = [[row_groups[i] for i in part] for part in np.array_split(np.arange(len(row_groups)), n_jobs) if len(part)]
+    if n_jobs == 1:
+        parts = [_sketch_row_groups(group, columns, batch_size, k, p, seed) for group in groups]
+    else:
+        # independent sampling streams per worker, also when seed is None
+        seeds = np.random.SeedSequence(seed).spawn(len(groups))
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=_pool_context()) as pool:
+            futures = [pool.submit(_sketch_row_groups, group, columns, batch_size, k, p, worker_seed)
+                       for group, worker_seed in zip(groups, seeds)]
+            parts = [future.result() for future in futures]
+
+    sketches = parts[0]
+    for part in parts[1:]:
+        for column, sketch in part.items():
+            sketches[column].merge(sketch)
+    return sketches
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""Typed, columnar storage for the processed tables.
+
+Every stage reads and writes `customer`, `product`, `order` and `reviews`
+through `read_table` / `write_table`. Tables are stored as Parquet with the
+schemas below: ids and low-cardinality labels as categoricals, dates as
+native timestamps, so consumers no longer re-parse text, re-infer dtypes or
+call `pd.to_datetime`. CSV stays available as an export format, and
+`read_table` falls back to an existing CSV when no Parquet file is present.
+
+The order table is partitioned by month of `order_date`: a directory
+`order/<YYYY-MM>/` of Parquet files per month. `append_table` adds new
+orders as new files in the months they fall in, without rewriting the
+table, and `read_table(..., start=, end=)` only opens the partitions that
+overlap the requested date range.
+
+Id columns come with the int32 `customer_code` / `product_code` columns from
+`id_dictionary.py`; tables written before the codes existed get them added
+on read from the persisted (or rebuilt) id dictionaries. Appended rows with
+customers or products that are new extend the persisted dictionaries first.
+
+`TableWriter` writes the tables chunk by chunk, for inputs too large to hold
+in memory: every chunk is cast to its schema, coded with dictionaries that
+grow as ids first appear, and added as row groups (or order partitions) and
+CSV rows; the dictionaries are saved when the writer is closed.
+"""
+
+import os
+import shutil
+from functools import lru_cache
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from id_dictionary import (
+    CODE_COLUMNS, DICTIONARIES, IdDictionary, add_codes, dictionary_path, save_id_dictionaries,
+)
+
+DATA_DIR = './data/processed'
+
+# rows per Parquet row group, the unit chunked readers such as sketch_table work on
+ROW_GROUP_SIZE = 100000
+
+# tables stored as one directory of Parquet files per calendar period: name -> (date column, period frequency)
+PARTITIONS = {
+    'order': ('order_date', 'M'),
+}
+
+# partition of rows without a date
+UNDATED = 'undated'
+
+SCHEMAS = {
+    'customer': {
+        'customer_userid': 'category',
+        'customer_code': 'int32',
+        'user_age': 'float64',
+        'user_height': 'string',
+        'user_size': 'category',
+        'user_weight': 'string',
+        'user_body_type': 'category',
+        'user_color': 'category',
+    },
+    'product': {
+        'product_link': 'string',
+        'product_name': 'string',
+        'product_description': 'string',
+        'product_price': 'float64',
+        'product_id': 'category',
+        'product_code': 'int32',
+        'product_category': 'category',
+    },
+    'order': {
+        'product_id': 'category',
+        'customer_userid': 'category',
+        'product_code': 'int32',
+        'customer_code': 'int32',
+        'order_id': 'string',
+        'paid_amt': 'float64',
+        'order_date': 'datetime64[ns]',
+    },
+    'reviews': {
+        'product_id': 'category',
+        'customer_userid': 'category',
+        'product_code': 'int32',
+        'customer_code': 'int32',
+        'star_ratings': 'float64',
+        'review_date': 'datetime64[ns]',
+        'review_title': 'string',
+        'review_content': 'string',
+    },
+}
+
+
+def apply_schema(df, name):
+    # cast the known columns of a table, other columns are left untouched
+    df = df.copy()
+    for column, dtype in SCHEMAS[name].items():
+        if column not in df.columns:
+            continue
+        if dtype.startswith('datetime'):
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+        elif dtype == 'int32':
+            df[column] = df[column].astype('int32')
+        elif dtype == 'float64':
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+        elif dtype in ('string', 'category'):
+            # uuid objects and other ids are stored as their text form
+            values = df[column].astype('string')
+            df[column] = values.astype('category') if dtype == 'category' else values
+    return df
+
+
+def table_path(name, directory=DATA_DIR, format='parquet'):
+    return os.path.join(directory, f'{name}.{format}')
+
+
+def partition_dir(name, directory=DATA_DIR):
+    return os.path.join(directory, name)
+
+
+def is_partitioned(name, directory=DATA_DIR):
+    return name in PARTITIONS and os.path.isdir(partition_dir(name, directory))
+
+
+def _partition_keys(dates, freq):
+    # partition name per row: the calendar period of its date
+    dates = pd.to_datetime(pd.Series(dates))
+    return dates.dt.to_period(freq).astype(str).where(dates.notna(), UNDATED)
+
+
+def _in_range(partition, freq, start, end):
+    if partition == UNDATED:
+        return start is None and end is None
+    period = pd.Period(partition, freq)
+    return (start is None or period.end_time >= pd.Timestamp(start)) and \
+        (end is None or period.start_time <= pd.Timestamp(end))
+
+
+def table_files(name, directory=DATA_DIR, start=None, end=None):
+    # stored files of a table; for a partitioned table only the partitions overlapping start..end
+    root = partition_dir(name, directory)
+    if is_partitioned(name, directory):
+        freq = PARTITIONS[name][1]
+        return [os.path.join(root, partition, file)
+                for partition in sorted(os.listdir(root)) if _in_range(partition, freq, start, end)
+                for file in sorted(os.listdir(os.path.join(root, partition))) if file.endswith('.parquet')]
+    if start is not None or end is not None:
+        raise ValueError(f"Table '{name}' is not stored partitioned by date.")
+    for format in ('parquet', 'csv'):
+        path = table_path(name, directory, format)
+        if os.path.exists(path):
+            return [path]
+    raise FileNotFoundError(f"No stored '{name}' table in {directory}.")
+
+
+def _write_partitions(df, name, directory):
+    # one new file per partition the rows fall in, existing files are never rewritten
+    date_column, freq = PARTITIONS[name]
+    root = partition_dir(name, directory)
+    paths = []
+    for partition, rows in df.groupby(_partition_keys(df[date_column], freq).to_numpy(), sort=True):
+        os.makedirs(os.path.join(root, partition), exist_ok=True)
+        existing = [f for f in os.listdir(os.path.join(root, partition)) if f.endswith('.parquet')]
+        path = os.path.join(root, partition, f'part-{len(existing):05d}.parquet')
+        rows.to_parquet(path, index=False, row_group_size=ROW_GROUP_SIZE)
+        paths.append(path)
+    return paths
+
+
+def write_table(df, name, directory='.', format='parquet'):
+    # format='csv' exports the same typed table as text; partitioned tables are written as a directory
+    df = apply_schema(df, name)
+    path = table_path(name, directory, format)
+    if format == 'parquet' and name in PARTITIONS:
+        path = partition_dir(name, directory)
+        shutil.rmtree(path, ignore_errors=True)
+        _write_partitions(df, name, directory)
+    elif format == 'parquet':
+        df.to_parquet(path, index=False, row_group_size=ROW_GROUP_SIZE)
+    elif format == 'csv':
+        df.to_csv(path, index=False)
+    else:
+        raise ValueError(f"Unsupported table format '{format}', expected 'parquet' or 'csv'.")
+    return path
+
+
+def append_table(df, name, directory=DATA_DIR):
+    # add rows to a partitioned table, returns the files written
+    if name not in PARTITIONS:
+        raise ValueError(f"Only partitioned tables {sorted(PARTITIONS)} can be appended to.")
+    if not is_partitioned(name, directory) and os.path.exists(table_path(name, directory, 'parquet')):
+        # tables stored as a single file are partitioned on the first append
+        write_table(pd.read_parquet(table_path(name, directory, 'parquet')), name, directory)
+    if any(id_column in df.columns for id_column in CODE_COLUMNS):
+        df = add_codes(df, extend_id_dictionaries(df, directory))
+    return _write_partitions(apply_schema(df, name), name, directory)
+
+
+def extend_id_dictionaries(df, directory=DATA_DIR):
+    # ids of df that are new get the next codes, the dictionaries are saved and the cached ones dropped
+    read_id_dictionaries.cache_clear()
+    dictionaries = read_id_dictionaries(directory)
+    for name, (id_column, _) in DICTIONARIES.items():
+        if id_column in df.columns:
+            dictionaries[name].extend(df[id_column].dropna())
+            dictionaries[name].save(dictionary_path(name, directory))
+    read_id_dictionaries.cache_clear()
+    return dictionaries
+
+
+class TableWriter:
+    # tables written chunk by chunk with their schemas and codes; ids are coded in order of first
+    # appearance, as build_id_dictionaries does for whole tables
+    def __init__(self, directory=DATA_DIR, csv=True):
+        self.directory = directory
+        self.csv = csv
+        self.dictionaries = {name: IdDictionary([]) for name in DICTIONARIES}
+        self._writers = {}
+        self._csv_started = set()
+        os.makedirs(directory, exist_ok=True)
+        for name in PARTITIONS:
+            shutil.rmtree(partition_dir(name, directory), ignore_errors=True)
+
+    def write(self, df, name):
+        for dictionary, (id_column, _) in DICTIONARIES.items():
+            if id_column in df.columns:
+                self.dictionaries[dictionary].extend(df[id_column].dropna())
+        df = apply_schema(add_codes(df, self.dictionaries), name)
+        if name in PARTITIONS:
+            _write_partitions(df, name, self.directory)
+        else:
+            self._write_row_groups(df, name)
+        if self.csv:
+            df.to_csv(table_path(name, self.directory, 'csv'), mode='a' if name in self._csv_started else 'w',
+                      header=name not in self._csv_started, index=False)
+            self._csv_started.add(name)
+
+    def _write_row_groups(self, df, name):
+        # categoricals get int32 indices, so every chunk has the first chunk's Arrow schema
+        if name not in self._writers:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            for i, field in enumerate(schema):
+                if pa.types.is_dictionary(field.type):
+                    schema = schema.set(i, field.with_type(pa.dictionary(pa.int32(), field.type.value_type)))
+            self._writers[name] = pq.ParquetWriter(table_path(name, self.directory, 'parquet'), schema)
+        writer = self._writers[name]
+        writer.write_table(pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False),
+                           row_group_size=ROW_GROUP_SIZE)
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        save_id_dictionaries(self.dictionaries, self.directory)
+        read_id_dictionaries.cache_clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read_stored(name, directory, columns=None, start=None, end=None):
+    # partitions, a Parquet file or the CSV export with the schema applied
+    files = table_files(name, directory, start, end)
+    if is_partitioned(name, directory):
+        return _read_partitions(name, directory, files, columns, start, end)
+    if files[0].endswith('.csv'):
+        df = pd.read_csv(files[0], usecols=columns)
+        return apply_schema(df, name)
+    return pd.read_parquet(files[0], columns=columns)
+
+
+def _read_partitions(name, directory, files, columns, start, end):
+    # rows of the pruned partition files with start <= date <= end
+    if not files:
+        # no partition overlaps the range, an empty frame with the table's columns
+        return pd.read_parquet(table_files(name, directory)[0], columns=columns).iloc[:0]
+    dataset = ds.dataset(files, format='parquet')
+    missing = [c for c in columns or () if c not in dataset.schema.names]
+    if missing:
+        raise KeyError(missing)
+    date = ds.field(PARTITIONS[name][0])
+    row_filter = None
+    if start is not None:
+        row_filter = date >= pd.Timestamp(start)
+    if end is not None:
+        row_filter = date <= pd.Timestamp(end) if row_filter is None else row_filter & (date <= pd.Timestamp(end))
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+
+@lru_cache(maxsize=None)
+def read_id_dictionaries(directory=DATA_DIR):
+    # persisted dictionaries, rebuilt from the customer and product tables if missing
+    dictionaries = {}
+    for name, (id_column, table) in DICTIONARIES.items():
+        path = dictionary_path(name, directory)
+        if os.path.exists(path):
+            dictionaries[name] = IdDictionary.load(path)
+        else:
+            dictionaries[name] = IdDictionary(_read_stored(table, directory, [id_column])[id_column])
+    return dictionaries
+
+
+def read_table(name, directory=DATA_DIR, columns=None, start=None, end=None):
+    # start and end (inclusive timestamps) select rows by date, reading only the partitions they overlap
+    try:
+        df = _read_stored(name, directory, columns, start, end)
+    except (ValueError, KeyError):
+        if columns is None:
+            raise
+        # older files without code columns: read the id columns instead
+        id_columns = {code: id_column for id_column, code in CODE_COLUMNS.items()}
+        df = _read_stored(name, directory, list(dict.fromkeys(id_columns.get(c, c) for c in columns)), start, end)
+
+    if any(i in df.columns and c not in df.columns for i, c in CODE_COLUMNS.items()):
+        df = add_codes(df, read_id_dictionaries(directory))
+    return df if columns is None else df[columns]
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Synthetic customer, product, review and order tables at any scale.
+
+`fit_profile` reads the stored tables and keeps the distributions the
+generator draws from: the customer attribute rows (resampled whole, so age,
+size, body type, height, weight and colour stay consistent with each other),
+the product category mix and the prices observed in each category and, when
+a review table is stored, reviews per customer, the star rating mix, product
+popularity and review dates. The snapshot in `data/processed/` only has
+customers and products, so those review distributions fall back to the
+`DEFAULT_*` values below.
+
+`generate_tables(profile, scale)` draws `scale` times as many customers and
+products from the profile with a seeded NumPy Generator, then reviews per
+customer and one order per review with `create_order_df`, as the
+preprocessing does. `write_dataset` stores them like
+`data_preprocessing_nuuly.py`, with id dictionaries and typed Parquet tables.
+
+    python src/synthetic_data.py --scale 10 --output-dir ./synthetic/x10/data/processed
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from id_dictionary import add_codes, build_id_dictionaries, save_id_dictionaries
+from preprocessing import CUSTOMER_COLUMNS, create_order_df, hex_ids
+from storage import DATA_DIR, read_table, write_table
+
+# used when no review table is stored to fit them from
+DEFAULT_REVIEWS_PER_CUSTOMER = {1: 0.6, 2: 0.25, 3: 0.1, 4: 0.05}
+DEFAULT_RATINGS = {1: 0.04, 2: 0.06, 3: 0.12, 4: 0.23, 5: 0.55}
+DEFAULT_REVIEW_DATES = ('2023-01-01', '2023-12-31')
+
+
+class DataProfile:
+    def __init__(self, customers, categories, prices, reviews_per_customer=None, ratings=None,
+                 popularity=None, review_days=None):
+        # customer attribute rows without the id
+        self.customers = customers
+        # category -> share of products, and category -> observed prices
+        self.categories = categories
+        self.prices = prices
+        # reviews per customer -> share of customers, star rating -> share of reviews
+        self.reviews_per_customer = reviews_per_customer or DEFAULT_REVIEWS_PER_CUSTOMER
+        self.ratings = ratings or DEFAULT_RATINGS
+        # reviews per product, resampled as product weights; None draws Zipf-like weights
+        self.popularity = popularity
+        # observed review dates as datetime64[D]; None draws them uniformly from DEFAULT_REVIEW_DATES
+        self.review_days = review_days
+
+    @property
+    def n_products(self):
+        return sum(len(prices) for prices in self.prices.values())
+
+
+def _shares(values):
+    # value -> share of the non-missing values
+    shares = pd.Series(values).value_counts(normalize=True)
+    return {key: float(share) for key, share in shares[shares > 0].items()}
+
+
+def fit_profile(directory=DATA_DIR):
+    customers = read_table('customer', directory, CUSTOMER_COLUMNS[1:])
+    product_df = read_table('product', directory, ['product_price', 'product_category'])
+    product_df = product_df[product_df['product_price'].notna() & product_df['product_category'].notna()]
+    categories = _shares(product_df['product_category'].astype(str))
+    prices = {str(category): group.to_numpy(dtype=np.float64)
+              for category, group in product_df.groupby('product_category', observed=True)['product_price']}
+
+    try:
+        reviews = read_table('reviews', directory, ['product_id', 'customer_userid', 'star_ratings', 'review_date'])
+    except FileNotFoundError:
+        return DataProfile(customers, categories, prices)
+
+    return DataProfile(
+        customers, categories, prices,
+        reviews_per_customer=_shares(reviews.groupby('customer_userid', observed=True).size()),
+        ratings=_shares(reviews['star_ratings'].dropna()),
+        popularity=reviews['product_id'].value_counts().to_numpy(),
+        review_days=reviews['review_date'].dropna().to_numpy(dtype='datetime64[D]'),
+    )
+
+
+def _choice(shares, n, rng):
+    # n draws from a value -> share mapping
+    values = np.array(list(shares))
+    weights = np.array(list(shares.values()), dtype=np.float64)
+    return values[rng.choice(len(values), n, p=weights / weights.sum())]
+
+
+def generate_tables(profile, scale=1.0, seed=42):
+    # table name -> DataFrame with the columns of the preprocessed tables
+    rng = np.random.default_rng(seed)
+    n_customers = max(1, round(len(profile.customers) * scale))
+    n_products = max(1, round(profile.n_products * scale))
+
+    customer_df = profile.customers.iloc[rng.integers(0, len(profile.customers), n_customers)].reset_index(drop=True)
+    customer_df.insert(0, 'customer_userid', 'user_' + pd.Series(np.arange(1, n_customers + 1)).astype(str))
+
+    # category first, then a price observed in that category
+    categories = _choice(profile.categories, n_products, rng)
+    prices = np.empty(n_products)
+    for category in profile.categories:
+        in_category = categories == category
+        prices[in_category] = rng.choice(profile.prices[category], in_category.sum())
+    numbers = pd.Series(np.arange(n_products)).astype(str)
+    product_df = pd.DataFrame({
+        'product_link': 'https://www.nuuly.com/rent/products/synthetic-' + numbers + '-' + categories + '?color=000',
+        'product_name': 'Synthetic ' + categories + ' ' + numbers,
+        'product_description': 'Synthetic product.',
+        'product_price': prices,
+        'product_id': hex_ids(n_products, rng),
+        'product_category': categories,
+    })
+
+    # reviews per customer, products by popularity, ratings and dates as observed
+    reviews_per_customer = _choice(profile.reviews_per_customer, n_customers, rng).astype(np.int64)
+    reviewers = np.repeat(np.arange(n_customers), reviews_per_customer)
+    n_reviews = len(reviewers)
+    if profile.popularity is None:
+        weights = 1 / (rng.permutation(n_products) + 1)
+    else:
+        # products without reviews keep a tiny weight, so the weights never sum to zero
+        weights = rng.choice(profile.popularity, n_products).astype(np.float64) + 1e-12
+    products = rng.choice(n_products, n_reviews, p=weights / weights.sum())
+    if profile.review_days is None:
+        first, last = (np.datetime64(day, 'D') for day in DEFAULT_REVIEW_DATES)
+        review_days = first + rng.integers(0, (last - first).astype(np.int64) + 1, n_reviews).astype('timedelta64[D]')
+    else:
+        review_days = profile.review_days[rng.integers(0, len(profile.review_days), n_reviews)]
+    reviews_df = pd.DataFrame({
+        'product_id': pd.Categorical.from_codes(products, product_df['product_id']),
+        'customer_userid': pd.Categorical.from_codes(reviewers, customer_df['customer_userid']),
+        'star_ratings': _choice(profile.ratings, n_reviews, rng).astype(np.float64),
+        'review_date': review_days.astype('datetime64[ns]'),
+        'review_title': 'Synthetic review',
+        'review_content': 'Synthetic review text.',
+    })
+
+    order_df = create_order_df(reviews_df, product_df, rng)
+    return {'customer': customer_df, 'product': product_df, 'order': order_df, 'reviews': reviews_df}
+
+
+def write_dataset(tables, directory):
+    # id dictionaries and typed Parquet tables, as data_preprocessing_nuuly.py writes them
+    os.makedirs(directory, exist_ok=True)
+    id_dictionaries = build_id_dictionaries(tables['customer'], tables['product'])
+    save_id_dictionaries(id_dictionaries, directory)
+    for name, table in tables.items():
+        write_table(add_codes(table, id_dictionaries), name, directory)
+    return directory
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic tables fitted to the stored ones.')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='tables to fit the distributions to')
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-dir', required=True)
+    args = parser.parse_args()
+    tables = generate_tables(fit_profile(args.data_dir), args.scale, args.seed)
+    write_dataset(tables, args.output_dir)
+    print({name: len(table) for name, table in tables.items()})